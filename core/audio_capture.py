@@ -1,9 +1,21 @@
-import soundcard as sc
 import numpy as np
 import threading
 import queue
 import time
 
+from utils.audio_devices import device_registry
+from core.audio_mixer import AudioMixer
+from core.audio_sources import SoundcardSource, PulseSource, ToneSource, FileSource, ClickSource
+from utils.logger import get_logger
+
+log = get_logger("audio")
+
+try:
+    import soundcard as sc
+except Exception:
+    # サウンドサーバ・デバイスが無い環境 (pulse / file / synthetic のみ使用可能)
+    sc = None
+
 class AudioCapturer:
     def __init__(self):
         self.running = False
@@ -12,14 +24,36 @@ class AudioCapturer:
         self.samplerate = 44100
         self.channels = 2
         self.thread = None
+        # ミキサー (ソースごとのゲイン・リミッタ・メーター)
+        self.gains = {'system': 1.0, 'mic': 1.0}
+        self.use_limiter = True
+        self.mixer = None
+        self.separate_tracks = False
+        # 入力方式 ('soundcard' / 'pulse' / 'file' / 'synthetic') と再生ファイル (file 用)
+        self.backend = 'soundcard'
+        self.replay_paths = {}
+        self.click_options = {} # click (A/V 同期の校正) の設定: period, delay_ms, drift_ppm
+        self.scheduler = None # CpuScheduler (キャプチャスレッドと同じ設定を適用)
+        # レベル監視 (アイドル検出用)
+        self.silence_threshold = 0.01 # RMS (約 -40dBFS)
+        self.level_rms = 0.0
+        self.last_sound_time = 0.0
         
-    def start_capture(self, use_system=True, use_mic=False, mic_device_id=None):
+    def start_capture(self, use_system=True, use_mic=False, mic_device_id=None, samplerate=None, channels=None,
+                      separate_tracks=False):
         """
         音声キャプチャ開始
         use_system: システム音声を録音するか
         use_mic: マイク音声を録音するか
         mic_device_id: マイクデバイスID (soundcard ID string)
+        samplerate / channels: 出力形式 (各デバイスはネイティブ形式で録音し、ここに変換する)
+        separate_tracks: True ならミックスせず、ソースごとのトラック ('system' / 'mic') として出力
         """
+        self.separate_tracks = separate_tracks
+        if samplerate:
+            self.samplerate = samplerate
+        if channels:
+            self.channels = channels
         self.running = True
         self.paused = False
         
@@ -27,92 +61,145 @@ class AudioCapturer:
         self.thread.start()
 
     def _capture_loop(self, use_system, use_mic, mic_device_id):
+        if self.scheduler:
+            self.scheduler.apply_capture_thread('audio')
         
-        system_mic = None
-        user_mic = None
+        src_sys = None
+        src_mic = None
         
         try:
-            # システム音声用Loopbackマイクの特定
+            blocksize = 1024 # 出力レートでのブロック長
+            
+            # 設定された方式でソースを用意 (soundcard / pulse / file / synthetic)
             if use_system:
-                default_speaker = sc.default_speaker()
-                # スピーカーと同じ名前のLoopbackマイクを探す
-                all_mics = sc.all_microphones(include_loopback=True)
-                for m in all_mics:
-                    if m.isloopback and m.name == default_speaker.name:
-                        system_mic = m
-                        break
-                # 見つからなければ任意のLoopback
-                if not system_mic:
-                    for m in all_mics:
-                        if m.isloopback:
-                            system_mic = m
-                            break
-                            
-            # マイクの特定
+                src_sys = self._create_source('system', None, blocksize)
             if use_mic:
-                if mic_device_id:
-                    user_mic = sc.get_microphone(mic_device_id, include_loopback=False)
-                else:
-                    user_mic = sc.default_microphone()
-
-            blocksize = 1024
+                src_mic = self._create_source('mic', mic_device_id, blocksize)
             
-            # Context Managers
-            ctx_sys = system_mic.recorder(samplerate=self.samplerate, channels=self.channels, blocksize=blocksize) if system_mic else None
-            ctx_mic = user_mic.recorder(samplerate=self.samplerate, channels=self.channels, blocksize=blocksize) if user_mic else None
+            stream_sys = src_sys.open() if src_sys else None
+            stream_mic = src_mic.open() if src_mic else None
             
-            # コンテキストに入る
-            # Note: 複数のコンテキストを動的に管理するのは少し泥臭い
+            # 別トラック出力時は加算しないのでリミッタも不要 (ゲインとメーターのみ)
+            self.mixer = AudioMixer(self.samplerate, self.channels, gains=self.gains,
+                                    limiter=self.use_limiter and not self.separate_tracks)
             
-            stream_sys = ctx_sys.__enter__() if ctx_sys else None
-            stream_mic = ctx_mic.__enter__() if ctx_mic else None
+            # 変換後の長さはブロックごとに ±1 サンプル揺れるため、余りは次回に持ち越す
+            pending_sys = np.zeros((0, self.channels), dtype=np.float32)
+            pending_mic = np.zeros((0, self.channels), dtype=np.float32)
             
-            try:
-                while self.running:
-                    if self.paused:
-                        time.sleep(0.1)
-                        continue
-                        
-                    data_sys = None
-                    data_mic = None
+            while self.running:
+                if self.paused:
+                    time.sleep(0.1)
+                    continue
+                    
+                data_sys = None
+                data_mic = None
+                
+                if stream_sys:
+                    data_sys = stream_sys.read()
+                    # ブロック先頭の時刻 (読み出し完了時刻からブロック長を引く)
+                    ts_sys = time.time() - len(data_sys) / self.samplerate
                     
-                    if stream_sys:
-                        data_sys = stream_sys.record(numframes=blocksize)
-                        
-                    if stream_mic:
-                        data_mic = stream_mic.record(numframes=blocksize)
-                        
-                    # ミキシング
-                    if data_sys is not None and data_mic is not None:
-                        # 長さを合わせる（念のため）
-                        min_len = min(len(data_sys), len(data_mic))
-                        mixed = data_sys[:min_len] + data_mic[:min_len]
-                        # クリッピング防止は？ Soundcardはfloat32なので1.0を超えてもデータとしては保たれるが、
-                        # 最終的にwav書き出し時にクリップされる可能性あり。
-                        # ここでは単純加算とする。
-                        self.audio_queue.put(mixed)
-                        
-                    elif data_sys is not None:
-                        self.audio_queue.put(data_sys)
-                        
-                    elif data_mic is not None:
-                        self.audio_queue.put(data_mic)
+                if stream_mic:
+                    data_mic = stream_mic.read()
+                    ts_mic = time.time() - len(data_mic) / self.samplerate
                     
-                    else:
-                        # 音声なし設定の場合
+                if self.separate_tracks:
+                    # ソースごとに独立したトラックとして出力 (ミックスしない)
+                    if data_sys is not None:
+                        self._put_block(self.mixer.mix({'system': data_sys}), 'system', ts_sys)
+                    if data_mic is not None:
+                        self._put_block(self.mixer.mix({'mic': data_mic}), 'mic', ts_mic)
+                    if data_sys is None and data_mic is None:
                         time.sleep(0.1)
-
-            finally:
-                if ctx_sys: ctx_sys.__exit__(None, None, None)
-                if ctx_mic: ctx_mic.__exit__(None, None, None)
+                    continue
+                    
+                # ミキシング
+                if data_sys is not None and data_mic is not None:
+                    pending_sys = np.concatenate((pending_sys, data_sys))
+                    pending_mic = np.concatenate((pending_mic, data_mic))
+                    # 両方そろっている分だけ混ぜる
+                    min_len = min(len(pending_sys), len(pending_mic))
+                    # ゲイン適用・加算・リミッタでクリップを防ぐ
+                    mixed = self.mixer.mix({'system': pending_sys[:min_len], 'mic': pending_mic[:min_len]})
+                    pending_sys = pending_sys[min_len:]
+                    pending_mic = pending_mic[min_len:]
+                    self._put_block(mixed, 'mix', min(ts_sys, ts_mic))
+                    
+                elif data_sys is not None:
+                    self._put_block(self.mixer.mix({'system': data_sys}), 'mix', ts_sys)
+                    
+                elif data_mic is not None:
+                    self._put_block(self.mixer.mix({'mic': data_mic}), 'mix', ts_mic)
+                
+                else:
+                    # 音声なし設定の場合
+                    time.sleep(0.1)
                 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"Audio capture error: {e}")
+            log.exception(f"Audio capture error: {e}")
+        finally:
+            if src_sys: src_sys.close()
+            if src_mic: src_mic.close()
+
+    def _create_source(self, role, mic_device_id, blocksize):
+        """
+        role ('system' / 'mic') に対応するソースを backend に従って生成。使えなければ None
+        """
+        if self.backend == 'synthetic':
+            frequency, amplitude = (440.0, 0.5) if role == 'system' else (997.0, 0.3)
+            return ToneSource(self.samplerate, self.channels, blocksize, frequency=frequency, amplitude=amplitude)
+        if self.backend == 'click':
+            # 校正用のクリック音はシステム音声としてのみ鳴らす
+            if role != 'system':
+                return None
+            return ClickSource(self.samplerate, self.channels, blocksize, **self.click_options)
+        if self.backend == 'file':
+            path = self.replay_paths.get(role)
+            if not path:
+                log.warning(f"Audio capture: no replay file for {role}")
+                return None
+            return FileSource(path, self.samplerate, self.channels, blocksize)
+        if self.backend == 'pulse':
+            device = PulseSource.DEFAULT_MONITOR if role == 'system' else (mic_device_id or PulseSource.DEFAULT_SOURCE)
+            return PulseSource(device, self.samplerate, self.channels, blocksize)
+        
+        if role == 'system':
+            # システム音声用Loopbackマイクの特定 (列挙済みキャッシュを使用)
+            device = device_registry.get_loopback()
+            if not device:
+                log.warning("Audio capture: loopback device not found")
+                return None
+        else:
+            # マイクの特定
+            device = device_registry.get_microphone(mic_device_id)
+            if not device and sc is not None:
+                # キャッシュ未反映 (接続直後など) の場合は直接問い合わせる
+                if mic_device_id:
+                    device = sc.get_microphone(mic_device_id, include_loopback=False)
+                else:
+                    device = sc.default_microphone()
+            if not device:
+                return None
+        # 各デバイスはネイティブのレート・チャンネル数で開き、変換はまとめてこちらで行う
+        return SoundcardSource(device, self.samplerate, self.channels, blocksize,
+                               native_format=device_registry.native_format(device))
+
+    def _put_block(self, block, track='mix', timestamp=None):
+        """ブロックを (トラック名, データ, 先頭時刻) としてキューに入れ、同時にレベルを更新"""
+        if len(block):
+            self.level_rms = float(np.sqrt(np.mean(np.square(block))))
+            if self.level_rms > self.silence_threshold:
+                self.last_sound_time = time.time()
+        self.audio_queue.put((track, block, timestamp if timestamp is not None else time.time()))
+
+    def get_levels(self):
+        """前回呼び出し以降のレベル (dBFS)。キャプチャしていなければ空"""
+        mixer = self.mixer
+        return mixer.get_levels() if mixer else {}
 
     def get_audio_data(self):
-        """キューから音声データを取得"""
+        """キューから音声データを (トラック名, データ, 先頭時刻) で取得。空なら None"""
         try:
             return self.audio_queue.get_nowait()
         except queue.Empty:
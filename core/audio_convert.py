@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def channel_matrix(in_channels, out_channels):
+    """
+    チャンネル変換行列 (in_channels x out_channels)
+    モノラル→ステレオは複製、ステレオ以上→モノラルは平均、多チャンネル→ステレオは L/R を使用
+    """
+    if in_channels == out_channels:
+        return None
+    matrix = np.zeros((in_channels, out_channels), dtype=np.float32)
+    if out_channels == 1:
+        matrix[:, 0] = 1.0 / in_channels
+    elif in_channels == 1:
+        matrix[0, :] = 1.0
+    else:
+        for ch in range(min(in_channels, out_channels)):
+            matrix[ch, ch] = 1.0
+    return matrix
+
+
+class StreamResampler:
+    """
+    ブロック単位で呼び出せるポリフェーズ (窓付き sinc) リサンプラ
+    カットオフを入出力の低い方のナイキスト周波数に置いた低域通過フィルタを補間と同時にかけるため、
+    ダウンサンプル時に折り返し (エイリアス) が出ない
+    フィルタの履歴と位相をブロック境界をまたいで引き継ぐため、継ぎ目でノイズが出ない
+    (出力はフィルタ長の半分 = 1ms 未満だけ遅れる)
+    """
+    ZERO_CROSSINGS = 16 # 片側のフィルタ長 (カットオフ周波数での周期数)
+    PHASES = 128 # 係数表の分解能 (入力 1 サンプル間の位相数、間は線形補間)
+    ROLLOFF = 0.95 # ナイキスト周波数に対するカットオフの比 (遷移帯域の分だけ下げる)
+    KAISER_BETA = 8.0
+
+    def __init__(self, in_rate, out_rate):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.step = in_rate / out_rate # 出力1サンプルあたりの入力サンプル数
+        cutoff = min(1.0, out_rate / in_rate) * self.ROLLOFF
+        self.half = int(np.ceil(self.ZERO_CROSSINGS / cutoff))
+        self.offsets = np.arange(-self.half + 1, self.half + 1)
+        self.table = self._kernel_table(cutoff)
+        self.pos = float(self.half) # 次の出力サンプルの位置 (tail を含むバッファの先頭基準)
+        self.tail = None # フィルタの履歴 (前ブロックの末尾)
+
+    def _kernel_table(self, cutoff):
+        """位相 (0 - 1) ごとの係数表 (PHASES + 1, タップ数)。各位相で直流ゲインを 1 に正規化"""
+        phases = np.arange(self.PHASES + 1)[:, None] / self.PHASES
+        x = self.offsets[None, :] - phases
+        ratio = np.clip(x / self.half, -1.0, 1.0)
+        window = np.i0(self.KAISER_BETA * np.sqrt(1.0 - ratio ** 2)) / np.i0(self.KAISER_BETA)
+        kernel = np.sinc(cutoff * x) * window
+        return (kernel / kernel.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    def process(self, block):
+        if self.in_rate == self.out_rate or len(block) == 0:
+            return block
+        if self.tail is None:
+            self.tail = np.zeros((self.half,) + block.shape[1:], dtype=np.float32)
+        buf = np.concatenate((self.tail, block))
+        # 出力位置の後ろ half サンプルまで揃っている分だけ出力する
+        available = len(buf) - self.half
+        n_out = max(0, int(np.ceil((available - self.pos) / self.step)))
+        positions = self.pos + np.arange(n_out) * self.step
+        base = positions.astype(np.intp)
+        phase = (positions - base) * self.PHASES
+        index = phase.astype(np.intp)
+        weight = (phase - index).astype(np.float32)[:, None]
+        taps = self.table[index] * (1.0 - weight) + self.table[np.minimum(index + 1, self.PHASES)] * weight
+        out = np.einsum('nt,nt...->n...', taps, buf[base[:, None] + self.offsets])
+
+        # 次の出力に必要な履歴だけ残す
+        pos = self.pos + n_out * self.step
+        drop = max(0, int(pos) - self.half)
+        self.tail = buf[drop:]
+        self.pos = pos - drop
+        return out.astype(np.float32, copy=False)
+
+
+class AudioFormatConverter:
+    """
+    ソースのネイティブ形式 (レート・チャンネル数) から出力形式への変換
+    チャンネル変換は行列積、リサンプルは係数表を使ったベクトル演算で、ブロック全体を一度に処理する
+    """
+    def __init__(self, in_rate, in_channels, out_rate, out_channels):
+        self.in_rate = in_rate
+        self.in_channels = in_channels
+        self.out_rate = out_rate
+        self.out_channels = out_channels
+        self.matrix = channel_matrix(in_channels, out_channels)
+        self.resampler = StreamResampler(in_rate, out_rate)
+
+    def is_passthrough(self):
+        return self.matrix is None and self.in_rate == self.out_rate
+
+    def convert(self, block):
+        """block: (frames, in_channels) float32 -> (frames', out_channels) float32"""
+        if block.ndim == 1:
+            block = block.reshape(-1, self.in_channels)
+        if self.matrix is not None:
+            # チャンネル数を先に減らしてからリサンプルする (演算量削減)
+            block = block @ self.matrix
+        return self.resampler.process(block)
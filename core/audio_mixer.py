@@ -0,0 +1,147 @@
+import threading
+import numpy as np
+
+SILENCE_DB = -120.0
+
+def to_dbfs(value):
+    return float(20 * np.log10(value)) if value > 1e-6 else SILENCE_DB
+
+def window_max(x, width):
+    """
+    x[i:i+width] の最大値を各 i について求める (長さ len(x) - width + 1)
+    幅を倍々に広げるため O(N log width) で済む
+    """
+    result = x
+    span = 1
+    while span * 2 <= width:
+        result = np.maximum(result[:-span], result[span:])
+        span *= 2
+    if span < width:
+        length = len(x) - width + 1
+        result = np.maximum(result[:length], result[width - span:width - span + length])
+    return result
+
+
+class SoftLimiter:
+    """
+    先読み型のソフトリミッタ (ブロック単位のベクトル演算)
+    先読み区間のピークから必要なゲインを求め、アタックは即時・リリースは指数的に戻す
+    リリースの再帰計算だけは granule (数十サンプル) 単位で行い、サンプル単位は補間する
+    """
+    def __init__(self, samplerate, channels, ceiling=0.98, lookahead_ms=5.0, release_ms=80.0, granule=32):
+        self.ceiling = ceiling
+        self.granule = granule
+        self.lookahead = max(1, int(samplerate * lookahead_ms / 1000))
+        self.release_coef = float(np.exp(-granule / (samplerate * release_ms / 1000)))
+        self.delay = np.zeros((self.lookahead, channels), dtype=np.float32)
+        self.gain = 1.0
+        self.gain_reduction = 1.0 # 直近ブロックの最小ゲイン (メーター表示用)
+
+    def process(self, block):
+        """block を処理して同じ長さの出力を返す (先読み分だけ遅延する)"""
+        n = len(block)
+        if n == 0:
+            return block
+        buf = np.concatenate((self.delay, block))
+        envelope = np.abs(buf).max(axis=1)
+        # 出力サンプル i に対して [i, i + lookahead] の範囲のピーク
+        peaks = window_max(envelope, self.lookahead + 1)[:n]
+        target = np.minimum(1.0, self.ceiling / np.maximum(peaks, 1e-9)).astype(np.float32)
+
+        # granule ごとのゲイン (アタック即時、リリース指数)
+        count = -(-n // self.granule)
+        padded = np.pad(target, (0, count * self.granule - n), mode='edge')
+        granule_min = padded.reshape(count, self.granule).min(axis=1)
+        gains = np.empty(count + 1, dtype=np.float32)
+        gains[0] = g = self.gain
+        coef = self.release_coef
+        for k in range(count):
+            t = granule_min[k]
+            g = t if t < g else t + (g - t) * coef
+            gains[k + 1] = g
+        self.gain = g
+
+        # granule 境界間を補間し、目標値を超えないよう制限
+        positions = np.arange(1, n + 1, dtype=np.float32) / self.granule
+        sample_gain = np.minimum(np.interp(positions, np.arange(count + 1), gains).astype(np.float32), target)
+        self.gain_reduction = float(sample_gain.min())
+
+        out = buf[:n] * sample_gain[:, None]
+        self.delay = buf[n:]
+        return out
+
+
+class AudioMixer:
+    """
+    ソースごとのゲイン、ミックス、リミッタ、レベルメーター
+    作業用バッファは使い回し、ブロックごとの確保は出力配列のみ
+    """
+    def __init__(self, samplerate, channels, gains=None, limiter=True):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.gains = dict(gains or {})
+        self.limiter = SoftLimiter(samplerate, channels) if limiter else None
+        self.work = np.zeros((0, channels), dtype=np.float32)
+        self.scratch = np.zeros((0, channels), dtype=np.float32)
+        self.lock = threading.Lock()
+        self._reset_meters()
+
+    def _reset_meters(self):
+        # name -> [peak, sum of squares, sample count]
+        self.meters = {}
+        self.min_gain = 1.0
+
+    def _ensure(self, n):
+        if len(self.work) < n:
+            self.work = np.zeros((n, self.channels), dtype=np.float32)
+            self.scratch = np.zeros((n, self.channels), dtype=np.float32)
+        return self.work[:n], self.scratch[:n]
+
+    def _meter(self, name, block):
+        if not len(block):
+            return
+        meter = self.meters.setdefault(name, [0.0, 0.0, 0])
+        meter[0] = max(meter[0], float(np.abs(block).max()))
+        meter[1] += float(np.vdot(block, block))
+        meter[2] += block.size
+
+    def mix(self, sources):
+        """
+        sources: {名前: (frames, channels) float32} すべて同じ長さ
+        戻り値: ミックス・リミッタ処理済みの新しい配列
+        """
+        n = min(len(block) for block in sources.values())
+        work, scratch = self._ensure(n)
+        work.fill(0.0)
+        with self.lock:
+            for name, block in sources.items():
+                block = block[:n]
+                gain = self.gains.get(name, 1.0)
+                if gain != 1.0:
+                    np.multiply(block, gain, out=scratch)
+                    block = scratch
+                self._meter(name, block)
+                work += block
+            out = self.limiter.process(work) if self.limiter else work.copy()
+            if self.limiter:
+                self.min_gain = min(self.min_gain, self.limiter.gain_reduction)
+            self._meter("master", out)
+        return out
+
+    def set_gain(self, name, gain):
+        with self.lock:
+            self.gains[name] = gain
+
+    def get_levels(self):
+        """
+        前回呼び出し以降のピーク・RMS (dBFS) を返してリセット
+        {'system': {'peak_db': .., 'rms_db': ..}, ..., 'limiter_gr_db': ..}
+        """
+        with self.lock:
+            levels = {}
+            for name, (peak, sum_sq, count) in self.meters.items():
+                rms = np.sqrt(sum_sq / count) if count else 0.0
+                levels[name] = {'peak_db': round(to_dbfs(peak), 1), 'rms_db': round(to_dbfs(rms), 1)}
+            levels['limiter_gr_db'] = round(to_dbfs(self.min_gain), 1)
+            self._reset_meters()
+        return levels
@@ -0,0 +1,238 @@
+import time
+import ctypes
+import ctypes.util
+import ffmpeg
+import numpy as np
+
+from core.audio_convert import AudioFormatConverter
+from utils.logger import get_logger
+
+log = get_logger("audio")
+
+class AudioSource:
+    """
+    音声入力のソース
+    read() は出力形式 (samplerate, channels) の float32 配列 (frames, channels) を返す
+    デバイスと同じく、約 blocksize フレーム分の時間だけブロックする
+    """
+    name = None
+
+    def __init__(self, samplerate, channels, blocksize=1024):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+
+    def open(self):
+        return self
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SoundcardSource(AudioSource):
+    """soundcard のデバイス (WASAPI Loopback / マイク)。ネイティブ形式で開いてまとめて変換する"""
+    name = 'soundcard'
+
+    def __init__(self, device, samplerate, channels, blocksize=1024, native_format=(None, 2)):
+        super().__init__(samplerate, channels, blocksize)
+        self.device = device
+        native_rate, native_channels = native_format
+        rate = native_rate or samplerate
+        self.converter = AudioFormatConverter(rate, native_channels, samplerate, channels)
+        # 出力レートで blocksize 分に相当する長さを読む
+        self.numframes = max(1, int(round(blocksize * rate / samplerate)))
+        self.ctx = self.device.recorder(samplerate=rate, channels=native_channels, blocksize=self.numframes)
+        self.stream = None
+
+    def open(self):
+        self.stream = self.ctx.__enter__()
+        return self
+
+    def read(self):
+        return self.converter.convert(self.stream.record(numframes=self.numframes))
+
+    def close(self):
+        if self.stream is not None:
+            self.ctx.__exit__(None, None, None)
+            self.stream = None
+
+
+class PaSampleSpec(ctypes.Structure):
+    _fields_ = [("format", ctypes.c_int), ("rate", ctypes.c_uint32), ("channels", ctypes.c_uint8)]
+
+
+class PaBufferAttr(ctypes.Structure):
+    _fields_ = [("maxlength", ctypes.c_uint32), ("tlength", ctypes.c_uint32), ("prebuf", ctypes.c_uint32),
+                ("minreq", ctypes.c_uint32), ("fragsize", ctypes.c_uint32)]
+
+
+class PulseSource(AudioSource):
+    """
+    PulseAudio / PipeWire (pipewire-pulse) からの録音 (libpulse-simple)
+    システム音声は既定出力のモニタ (@DEFAULT_MONITOR@) を使う
+    形式変換はサーバ側で行われ、fragsize をブロック長にすることで遅延を抑える
+    """
+    name = 'pulse'
+    PA_STREAM_RECORD = 2
+    PA_SAMPLE_FLOAT32LE = 5
+    DEFAULT_MONITOR = '@DEFAULT_MONITOR@'
+    DEFAULT_SOURCE = '@DEFAULT_SOURCE@'
+
+    def __init__(self, device, samplerate, channels, blocksize=1024, stream_name='PyRec'):
+        super().__init__(samplerate, channels, blocksize)
+        self.device = device
+        self.stream_name = stream_name
+        self.handle = None
+        path = ctypes.util.find_library('pulse-simple')
+        if not path:
+            raise OSError("libpulse-simple not found")
+        self.lib = ctypes.CDLL(path)
+        self.lib.pa_simple_new.restype = ctypes.c_void_p
+        self.lib.pa_simple_new.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_char_p, ctypes.POINTER(PaSampleSpec), ctypes.c_void_p,
+                                           ctypes.POINTER(PaBufferAttr), ctypes.POINTER(ctypes.c_int)]
+        self.lib.pa_simple_read.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t,
+                                            ctypes.POINTER(ctypes.c_int)]
+        self.lib.pa_simple_free.argtypes = [ctypes.c_void_p]
+        self.buffer = np.empty((blocksize, channels), dtype=np.float32)
+
+    def open(self):
+        spec = PaSampleSpec(self.PA_SAMPLE_FLOAT32LE, self.samplerate, self.channels)
+        unset = 0xFFFFFFFF
+        attr = PaBufferAttr(unset, unset, unset, unset, self.buffer.nbytes)
+        error = ctypes.c_int(0)
+        self.handle = self.lib.pa_simple_new(None, b"PyRec-OmniCapture", self.PA_STREAM_RECORD,
+                                             self.device.encode() if self.device else None,
+                                             self.stream_name.encode(), ctypes.byref(spec), None,
+                                             ctypes.byref(attr), ctypes.byref(error))
+        if not self.handle:
+            raise OSError(f"pa_simple_new failed ({self.device}): error {error.value}")
+        return self
+
+    def read(self):
+        error = ctypes.c_int(0)
+        if self.lib.pa_simple_read(self.handle, self.buffer.ctypes.data, self.buffer.nbytes, ctypes.byref(error)) < 0:
+            raise OSError(f"pa_simple_read failed: error {error.value}")
+        return self.buffer.copy()
+
+    def close(self):
+        if self.handle:
+            self.lib.pa_simple_free(self.handle)
+            self.handle = None
+
+
+class _PacedSource(AudioSource):
+    """実時間に合わせて read() を待たせる (realtime=False なら待たずに返す: ベンチマーク用)"""
+    def __init__(self, samplerate, channels, blocksize=1024, realtime=True):
+        super().__init__(samplerate, channels, blocksize)
+        self.realtime = realtime
+        self.start = None
+        self.frames_read = 0
+
+    def _pace(self, frames):
+        if not self.realtime:
+            return
+        if self.start is None:
+            self.start = time.perf_counter()
+        self.frames_read += frames
+        delay = self.start + self.frames_read / self.samplerate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ToneSource(_PacedSource):
+    """正弦波 (決定的なテスト信号、ブロック間で位相を引き継ぐ)"""
+    name = 'tone'
+
+    def __init__(self, samplerate, channels, blocksize=1024, frequency=440.0, amplitude=0.5, realtime=True):
+        super().__init__(samplerate, channels, blocksize, realtime)
+        self.phase_step = 2 * np.pi * frequency / samplerate
+        self.amplitude = amplitude
+        self.position = 0
+
+    def read(self):
+        n = self.blocksize
+        t = np.arange(self.position, self.position + n, dtype=np.float64)
+        self.position += n
+        mono = (self.amplitude * np.sin(t * self.phase_step)).astype(np.float32)
+        self._pace(n)
+        return np.repeat(mono[:, None], self.channels, axis=1)
+
+
+class FileSource(_PacedSource):
+    """音声ファイルを出力形式にデコードしてループ再生 (ffmpeg)"""
+    name = 'file'
+
+    def __init__(self, path, samplerate, channels, blocksize=1024, loop=True, realtime=True):
+        super().__init__(samplerate, channels, blocksize, realtime)
+        self.path = path
+        self.loop = loop
+        self.process = None
+        self.block_bytes = blocksize * channels * 4
+
+    def open(self):
+        self.process = (
+            ffmpeg.input(self.path, stream_loop=-1 if self.loop else 0)
+            .output('pipe:', format='f32le', ac=self.channels, ar=self.samplerate)
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdout=True)
+        )
+        return self
+
+    def read(self):
+        data = self.process.stdout.read(self.block_bytes)
+        if not data:
+            # ループしない場合は終端以降を無音にする
+            block = np.zeros((self.blocksize, self.channels), dtype=np.float32)
+        else:
+            block = np.frombuffer(data, dtype=np.float32)[:len(data) // 4 // self.channels * self.channels]
+            block = block.reshape(-1, self.channels).copy()
+        self._pace(len(block))
+        return block
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdout.close()
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+class ClickSource(_PacedSource):
+    """
+    A/V 同期の校正用: 実時刻 (time.time()) が period の倍数になるたびに短いクリック音を鳴らす
+    (FlashBackend の閃光と同じ時刻)。delay_ms / drift_ppm で遅延・時計のずれを模擬できる
+    """
+    name = 'click'
+
+    def __init__(self, samplerate, channels, blocksize=1024, period=1.0, click_sec=0.01,
+                 delay_ms=0.0, drift_ppm=0.0, realtime=True):
+        super().__init__(samplerate, channels, blocksize, realtime)
+        self.period = period
+        self.click_sec = click_sec
+        self.delay_ms = delay_ms
+        self.drift_ppm = drift_ppm
+        self.wall_start = None
+        self.position = 0
+
+    def read(self):
+        n = self.blocksize
+        if self.wall_start is None:
+            self.wall_start = time.time()
+        i = np.arange(self.position, self.position + n, dtype=np.float64)
+        self.position += n
+        # このソースの時計での各サンプルの時刻 (drift_ppm だけ速く進み、delay_ms だけ遅れて鳴る)
+        t = self.wall_start + i / self.samplerate * (1 + self.drift_ppm * 1e-6) - self.delay_ms / 1000
+        phase = np.mod(t, self.period)
+        mono = np.where(phase < self.click_sec, 0.8 * np.sin(2 * np.pi * 1000.0 * phase), 0.0).astype(np.float32)
+        self._pace(n)
+        return np.repeat(mono[:, None], self.channels, axis=1)
@@ -0,0 +1,101 @@
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+RIFF_SIZE_LIMIT = 0xFFFFFFFF
+
+class AudioSpoolWriter:
+    """
+    長時間録音向けの WAV 書き込み (wave モジュールの代替)
+    - 4GB を超えたら RF64 に切り替える (先頭に ds64 用の JUNK チャンクを確保しておく)
+    - 一定間隔でヘッダのサイズを更新するため、途中で落ちてもそこまでは読めるファイルになる
+    - float32 のまま書き込めるので、録画ループでの int16 変換が不要
+    """
+    def __init__(self, path, samplerate, channels, sample_format='float32', header_interval_sec=5.0):
+        self.path = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.is_float = sample_format == 'float32'
+        self.sample_width = 4 if self.is_float else 2
+        self.frame_bytes = self.sample_width * channels
+        self.header_interval = max(1, int(samplerate * header_interval_sec))
+        self.frames_written = 0
+        self.frames_since_header = 0
+        self.rf64 = False
+        self.file = open(path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        f = self.file
+        f.write(b'RIFF' + struct.pack('<I', 0) + b'WAVE')
+        # RF64 化したときに ds64 チャンクになる領域 (riff/data サイズ, サンプル数, テーブル長)
+        self.ds64_offset = f.tell()
+        f.write(b'JUNK' + struct.pack('<I', 28) + bytes(28))
+        fmt_tag = WAVE_FORMAT_IEEE_FLOAT if self.is_float else WAVE_FORMAT_PCM
+        fmt = struct.pack('<HHIIHH', fmt_tag, self.channels, self.samplerate,
+                          self.samplerate * self.frame_bytes, self.frame_bytes, self.sample_width * 8)
+        if self.is_float:
+            # PCM 以外は cbSize と fact チャンクが必要
+            f.write(b'fmt ' + struct.pack('<I', 18) + fmt + struct.pack('<H', 0))
+            self.fact_offset = f.tell()
+            f.write(b'fact' + struct.pack('<I', 4) + struct.pack('<I', 0))
+        else:
+            f.write(b'fmt ' + struct.pack('<I', 16) + fmt)
+            self.fact_offset = None
+        self.data_offset = f.tell()
+        f.write(b'data' + struct.pack('<I', 0))
+        self.data_start = f.tell()
+        f.flush()
+
+    def write(self, block):
+        """block: (frames, channels) float32 (-1.0 .. 1.0)"""
+        if self.is_float:
+            data = np.ascontiguousarray(block, dtype=np.float32)
+        else:
+            data = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+        self.file.write(memoryview(data).cast('B'))
+        self.frames_written += len(data)
+        self.frames_since_header += len(data)
+        if self.frames_since_header >= self.header_interval:
+            self.update_header()
+
+    def update_header(self):
+        """現在の書き込み位置までを有効なデータとしてヘッダに反映"""
+        f = self.file
+        end = f.tell()
+        data_size = end - self.data_start
+        riff_size = end - 8
+        if not self.rf64 and riff_size > RIFF_SIZE_LIMIT:
+            self.rf64 = True
+            f.seek(0)
+            f.write(b'RF64')
+            f.seek(self.ds64_offset)
+            f.write(b'ds64')
+        if self.rf64:
+            f.seek(4)
+            f.write(struct.pack('<I', RIFF_SIZE_LIMIT))
+            f.seek(self.ds64_offset + 8)
+            f.write(struct.pack('<QQQI', riff_size, data_size, self.frames_written, 0))
+            data_size32 = RIFF_SIZE_LIMIT
+            frames32 = RIFF_SIZE_LIMIT
+        else:
+            f.seek(4)
+            f.write(struct.pack('<I', riff_size))
+            data_size32 = data_size
+            frames32 = self.frames_written
+        if self.fact_offset is not None:
+            f.seek(self.fact_offset + 8)
+            f.write(struct.pack('<I', min(frames32, RIFF_SIZE_LIMIT)))
+        f.seek(self.data_offset + 4)
+        f.write(struct.pack('<I', data_size32))
+        f.seek(end)
+        f.flush()
+        self.frames_since_header = 0
+
+    def close(self):
+        if self.file is None:
+            return
+        self.update_header()
+        self.file.close()
+        self.file = None
@@ -0,0 +1,143 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.logger import get_logger
+
+log = get_logger("burst")
+
+FORMATS = {'png': 'png', 'webp': 'webp', 'jpeg': 'jpg'} # 形式 -> 拡張子
+
+def save_options(image_format, quality=90, png_compress_level=1):
+    """PIL の保存オプション (PNG は圧縮レベル、WebP は quality 100 で可逆)"""
+    if image_format == 'png':
+        return {'compress_level': png_compress_level}
+    if image_format == 'webp':
+        return {'lossless': True, 'method': 0} if quality >= 100 else {'quality': quality, 'method': 2}
+    return {'quality': min(quality, 95)}
+
+def _encode_still(frame, path, image_format, options):
+    """プロセスプール側で実行: BGRA -> RGB に変換して保存"""
+    from PIL import Image
+    Image.fromarray(np.ascontiguousarray(frame[..., 2::-1])).save(path, format=image_format, **options)
+    return path
+
+
+class BurstWriter:
+    """
+    連写モード: フレームを静止画として保存する
+    キャプチャ側は上限付きキューに入れるだけ (満杯なら捨てる)、圧縮はプロセスプールで並列に行う
+    インターフェースは EncoderFeeder と同じ (start / submit / get_stats / stop)
+    """
+    def __init__(self, output_dir, image_format='png', quality=90, png_compress_level=1, workers=None, queue_size=32):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unsupported still format: {image_format}")
+        self.output_dir = output_dir
+        self.extension = FORMATS[image_format]
+        self.pil_format = image_format.upper()
+        self.options = save_options(image_format, quality, png_compress_level)
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.in_flight = threading.BoundedSemaphore(self.workers * 2) # プールに渡す数の上限
+        self.pool = None
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+        self.pending = 0 # プールで処理中の枚数
+        self.peak_backlog = 0
+        self.first_ts = None
+        self.last_written_at = None
+        self.started_at = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 子プロセスに Qt 等を引き継がないよう spawn で起動
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context('spawn'))
+        self.running = True
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._dispatch_loop, name="BurstDispatcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, frame, timestamp):
+        """キャプチャ側から呼ばれる。ブロックしない"""
+        if self.first_ts is None:
+            self.first_ts = timestamp
+        try:
+            # 呼び出し元がバッファを再利用する場合に備えて所有権のある配列にする
+            self.queue.put_nowait((frame if frame.flags.owndata else frame.copy(), timestamp))
+            self.frames_submitted += 1
+        except queue.Full:
+            self.frames_dropped += 1
+        with self.lock:
+            self.peak_backlog = max(self.peak_backlog, self.queue.qsize() + self.pending)
+
+    def _dispatch_loop(self):
+        """キューから取り出してプールへ渡す (pickle のコストもキャプチャスレッドから外す)"""
+        index = 0
+        while self.running or not self.queue.empty():
+            try:
+                frame, timestamp = self.queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            # ファイル名は取得時刻 (先頭からのミリ秒) と通し番号
+            offset_ms = int(round((timestamp - self.first_ts) * 1000))
+            path = os.path.join(self.output_dir, f"still_{index:06d}_{offset_ms:09d}ms.{self.extension}")
+            index += 1
+            self.in_flight.acquire()
+            with self.lock:
+                self.pending += 1
+            try:
+                future = self.pool.submit(_encode_still, frame, path, self.pil_format, self.options)
+            except Exception as e:
+                # プールが壊れた場合も取得側を止めないよう、残りは失敗として数えて読み捨てる
+                self.in_flight.release()
+                with self.lock:
+                    self.pending -= 1
+                    self.frames_failed += 1
+                if self.frames_failed == 1:
+                    log.error(f"Burst pool unavailable: {e}")
+                continue
+            future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        self.in_flight.release()
+        with self.lock:
+            self.pending -= 1
+            if future.exception() is not None:
+                self.frames_failed += 1
+                log.error(f"Failed to write still: {future.exception()}")
+            else:
+                self.frames_written += 1
+                self.last_written_at = time.time()
+
+    def get_stats(self):
+        with self.lock:
+            elapsed = (self.last_written_at or time.time()) - (self.started_at or time.time())
+            return {
+                "queue_frames": self.queue.qsize(),
+                "burst_backlog": self.queue.qsize() + self.pending,
+                "burst_peak_backlog": self.peak_backlog,
+                "frames_written": self.frames_written,
+                "frames_dropped": self.frames_dropped,
+                "frames_failed": self.frames_failed,
+                "stills_per_sec": round(self.frames_written / elapsed, 2) if elapsed > 0 else 0.0,
+            }
+
+    def stop(self):
+        """キューに残った分も書き出してから終了"""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
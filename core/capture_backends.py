@@ -0,0 +1,458 @@
+import time
+import ctypes
+import ctypes.util
+import mss
+import ffmpeg
+import numpy as np
+
+from utils.config import config
+from utils.logger import get_logger
+
+log = get_logger("capture")
+
+class CaptureBackend:
+    """
+    画面取得のバックエンド
+    grab() が返す配列は次の grab() / close() までのみ有効 (再利用されるバッファのビューの場合がある)
+    """
+    name = None
+
+    def __init__(self, rect, **options):
+        # rect: mss と同じ形式の dict (left, top, width, height)
+        self.rect = rect
+        self.width = int(rect["width"])
+        self.height = int(rect["height"])
+        self.grabs = 0 # 実際に画面を取得した回数
+        self.reused = 0 # 変化が無く前回のフレームを返した回数
+
+    @staticmethod
+    def monitors(**options):
+        """mss.monitors と同じ形式 (0 は全体、1 以降が各モニタ)"""
+        with mss.mss() as sct:
+            return list(sct.monitors)
+
+    def grab(self):
+        raise NotImplementedError
+
+    def move(self, left, top):
+        """取得範囲を移動する (サイズは固定、ズーム時のカーソル追従用)。移動したら True"""
+        if (left, top) == (self.rect["left"], self.rect["top"]):
+            return False
+        self.rect = dict(self.rect, left=left, top=top)
+        return True
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        return {"capture_backend": self.name, "capture_grabs": self.grabs, "capture_reused": self.reused}
+
+
+class MssBackend(CaptureBackend):
+    """mss による取得 (既定、全プラットフォーム)"""
+    name = 'mss'
+
+    def __init__(self, rect, **options):
+        super().__init__(rect, **options)
+        # スレッド内で新しいインスタンスを作成（必須）
+        self.sct = mss.mss()
+
+    def grab(self):
+        self.grabs += 1
+        return np.array(self.sct.grab(self.rect))
+
+    def close(self):
+        self.sct.close()
+
+
+class XImage(ctypes.Structure):
+    # 先頭の必要な部分のみ (構造体は Xlib が確保するので末尾を省略しても問題ない)
+    _fields_ = [
+        ("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int), ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int), ("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int), ("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p), ("readOnly", ctypes.c_int),
+    ]
+
+
+def _load_library(name):
+    path = ctypes.util.find_library(name)
+    if not path:
+        raise OSError(f"lib{name} not found")
+    return ctypes.CDLL(path)
+
+
+class XShmBackend(CaptureBackend):
+    """
+    X11 の MIT-SHM による取得
+    共有メモリ上の XImage を1つだけ確保して毎回そこへ取得する (フレームごとの確保・コピーなし)
+    """
+    name = 'xshm'
+    ZPIXMAP = 2
+    ALL_PLANES = ctypes.c_ulong(0xFFFFFFFF)
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+
+    def __init__(self, rect, **options):
+        super().__init__(rect, **options)
+        self.x11 = _load_library('X11')
+        self.xext = _load_library('Xext')
+        self.libc = _load_library('c')
+        self._declare()
+
+        self.display = self.x11.XOpenDisplay(None)
+        if not self.display:
+            raise OSError("Cannot open X display")
+        self.image = None
+        self.shm_info = XShmSegmentInfo()
+        try:
+            if not self.xext.XShmQueryExtension(self.display):
+                raise OSError("MIT-SHM extension is not available")
+            self._create_image()
+        except Exception:
+            self.close()
+            raise
+
+    def _declare(self):
+        x11, xext, libc = self.x11, self.xext, self.libc
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XFree.argtypes = [ctypes.c_void_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+                                         ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo),
+                                         ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage),
+                                      ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def _create_image(self):
+        x11, xext, libc = self.x11, self.xext, self.libc
+        screen = x11.XDefaultScreen(self.display)
+        self.root = x11.XDefaultRootWindow(self.display)
+        visual = x11.XDefaultVisual(self.display, screen)
+        depth = x11.XDefaultDepth(self.display, screen)
+
+        self.image = xext.XShmCreateImage(self.display, visual, depth, self.ZPIXMAP, None,
+                                          ctypes.byref(self.shm_info), self.width, self.height)
+        if not self.image:
+            raise OSError("XShmCreateImage failed")
+        image = self.image.contents
+        if image.bits_per_pixel != 32:
+            raise OSError(f"Unsupported pixel format: {image.bits_per_pixel} bpp")
+
+        size = image.bytes_per_line * self.height
+        self.shm_info.shmid = libc.shmget(self.IPC_PRIVATE, size, self.IPC_CREAT | 0o600)
+        if self.shm_info.shmid < 0:
+            raise OSError("shmget failed")
+        address = libc.shmat(self.shm_info.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(self.shm_info.shmid, self.IPC_RMID, None)
+            self.shm_info.shmid = -1
+            raise OSError("shmat failed")
+        self.shm_info.shmaddr = address
+        self.shm_info.readOnly = 0
+        image.data = address
+        if not xext.XShmAttach(self.display, ctypes.byref(self.shm_info)):
+            libc.shmctl(self.shm_info.shmid, self.IPC_RMID, None)
+            raise OSError("XShmAttach failed")
+        x11.XSync(self.display, 0)
+        # デタッチ後に自動で破棄されるよう、アタッチ直後に削除予約しておく
+        libc.shmctl(self.shm_info.shmid, self.IPC_RMID, None)
+
+        buffer = (ctypes.c_uint8 * size).from_address(address)
+        rows = np.ctypeslib.as_array(buffer).reshape(self.height, image.bytes_per_line // 4, 4)
+        self.frame = rows[:, :self.width] # 行末のパディングを除いたビュー
+
+    def grab(self):
+        if not self.xext.XShmGetImage(self.display, self.root, self.image,
+                                      int(self.rect["left"]), int(self.rect["top"]), self.ALL_PLANES):
+            raise OSError("XShmGetImage failed")
+        self.grabs += 1
+        return self.frame
+
+    def close(self):
+        if getattr(self, 'display', None) is None:
+            return
+        self.frame = None
+        if self.shm_info.shmaddr:
+            self.xext.XShmDetach(self.display, ctypes.byref(self.shm_info))
+            self.x11.XSync(self.display, 0)
+            self.libc.shmdt(self.shm_info.shmaddr)
+            self.shm_info.shmaddr = None
+        if self.image:
+            # XDestroyImage は data (共有メモリ) も解放しようとするため構造体だけ解放
+            self.x11.XFree(self.image)
+            self.image = None
+        self.x11.XCloseDisplay(self.display)
+        self.display = None
+
+
+class XRectangle(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_short), ("y", ctypes.c_short),
+                ("width", ctypes.c_ushort), ("height", ctypes.c_ushort)]
+
+
+class XDamageNotifyEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int), ("serial", ctypes.c_ulong), ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p), ("drawable", ctypes.c_ulong), ("damage", ctypes.c_ulong),
+        ("level", ctypes.c_int), ("more", ctypes.c_int), ("timestamp", ctypes.c_ulong),
+        ("area", XRectangle), ("geometry", XRectangle),
+    ]
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("damage", XDamageNotifyEvent), ("pad", ctypes.c_long * 24)]
+
+
+class XDamageBackend(XShmBackend):
+    """
+    XDamage で変化を監視し、録画範囲に変化があったときだけ取得する (XShm で取得)
+    変化が無ければ前回のフレームをそのまま返す
+    コンポジタ環境で通知が届かない場合に備えて、一定時間ごとに必ず取得する
+    """
+    name = 'xdamage'
+    REPORT_RAW_RECTANGLES = 0
+    DAMAGE_NOTIFY = 0
+
+    def __init__(self, rect, refresh_sec=1.0, **options):
+        super().__init__(rect, **options)
+        self.refresh_sec = refresh_sec
+        self.last_grab = 0.0
+        self.damage = None
+        try:
+            self.xdamage = _load_library('Xdamage')
+            self.xdamage.XDamageQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                                           ctypes.POINTER(ctypes.c_int)]
+            self.xdamage.XDamageCreate.restype = ctypes.c_ulong
+            self.xdamage.XDamageCreate.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int]
+            self.xdamage.XDamageSubtract.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong]
+            self.xdamage.XDamageDestroy.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+            self.x11.XPending.argtypes = [ctypes.c_void_p]
+            self.x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+
+            event_base, error_base = ctypes.c_int(), ctypes.c_int()
+            if not self.xdamage.XDamageQueryExtension(self.display, ctypes.byref(event_base), ctypes.byref(error_base)):
+                raise OSError("DAMAGE extension is not available")
+            self.damage_event = event_base.value + self.DAMAGE_NOTIFY
+            self.damage = self.xdamage.XDamageCreate(self.display, self.root, self.REPORT_RAW_RECTANGLES)
+        except Exception:
+            self.close()
+            raise
+        self.event = XEvent()
+
+    def _region_damaged(self):
+        """溜まっている通知を読み、録画範囲と重なるものがあったか"""
+        left, top = int(self.rect["left"]), int(self.rect["top"])
+        right, bottom = left + self.width, top + self.height
+        damaged = False
+        while self.x11.XPending(self.display):
+            self.x11.XNextEvent(self.display, ctypes.byref(self.event))
+            if self.event.type != self.damage_event:
+                continue
+            area = self.event.damage.area
+            if area.x < right and area.x + area.width > left and area.y < bottom and area.y + area.height > top:
+                damaged = True
+        return damaged
+
+    def grab(self):
+        now = time.monotonic()
+        if self._region_damaged() or now - self.last_grab >= self.refresh_sec:
+            self.xdamage.XDamageSubtract(self.display, self.damage, 0, 0)
+            self.last_grab = now
+            return super().grab()
+        self.reused += 1
+        return self.frame
+
+    def move(self, left, top):
+        moved = super().move(left, top)
+        if moved:
+            self.last_grab = 0.0 # 範囲が変わったら変化の通知が無くても取得し直す
+        return moved
+
+    def close(self):
+        if getattr(self, 'damage', None) and self.display:
+            self.xdamage.XDamageDestroy(self.display, self.damage)
+            self.damage = None
+        super().close()
+
+
+class SyntheticBackend(CaptureBackend):
+    """
+    決定的なテストパターン (ディスプレイ不要)
+    グラデーション背景の上を矩形が移動し、左上にフレーム番号をビットパターンで描く
+    """
+    name = 'synthetic'
+    BOX = 64
+    BIT = 8 # フレーム番号の1ビットあたりのブロックサイズ
+
+    def __init__(self, rect, **options):
+        super().__init__(rect, **options)
+        h, w = self.height, self.width
+        base = np.empty((h, w, 4), dtype=np.uint8)
+        base[..., 0] = (np.arange(w) * 255 // max(1, w - 1)).astype(np.uint8)[None, :]
+        base[..., 1] = (np.arange(h) * 255 // max(1, h - 1)).astype(np.uint8)[:, None]
+        base[..., 2] = 96
+        base[..., 3] = 255
+        self.base = base
+        self.frame = base.copy()
+        self.index = 0
+        self.box = None
+
+    @staticmethod
+    def monitors(synthetic_size=(1920, 1080), **options):
+        w, h = synthetic_size
+        rect = {"left": 0, "top": 0, "width": int(w), "height": int(h)}
+        return [dict(rect), dict(rect)]
+
+    def grab(self):
+        h, w = self.height, self.width
+        box = min(self.BOX, h, w)
+        # 前回の矩形を背景に戻してから新しい位置に描く (フレーム全体は書き換えない)
+        if self.box is not None:
+            y, x = self.box
+            self.frame[y:y + box, x:x + box] = self.base[y:y + box, x:x + box]
+        x = (self.index * 8) % max(1, w - box)
+        y = (self.index * 4) % max(1, h - box)
+        self.frame[y:y + box, x:x + box, :3] = (255, 255, 255)
+        self.box = (y, x)
+
+        bits = min(32, w // self.BIT)
+        for bit in range(bits):
+            value = 255 if (self.index >> bit) & 1 else 0
+            self.frame[:self.BIT, bit * self.BIT:(bit + 1) * self.BIT, :3] = value
+
+        self.index += 1
+        self.grabs += 1
+        return self.frame[:] # 呼び出し側が所有権の無いビューとして扱えるように
+
+
+class FlashBackend(CaptureBackend):
+    """
+    A/V 同期の校正用: 実時刻 (time.time()) が flash_period の倍数になってから flash_sec の間だけ白くなる画面
+    (ClickSource のクリック音と同じ時刻)
+    """
+    name = 'flash'
+
+    def __init__(self, rect, flash_period=1.0, flash_sec=0.1, **options):
+        super().__init__(rect, **options)
+        self.period = flash_period
+        self.flash_sec = flash_sec
+        self.dark = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        self.dark[..., 3] = 255
+        self.light = np.full((self.height, self.width, 4), 255, dtype=np.uint8)
+
+    @staticmethod
+    def monitors(synthetic_size=(1920, 1080), **options):
+        return SyntheticBackend.monitors(synthetic_size)
+
+    def grab(self):
+        self.grabs += 1
+        lit = time.time() % self.period < self.flash_sec
+        return (self.light if lit else self.dark)[:]
+
+
+class FileReplayBackend(CaptureBackend):
+    """
+    動画ファイルを録画範囲のサイズに変換してループ再生する (ffmpeg でデコード)
+    """
+    name = 'file'
+
+    def __init__(self, rect, replay_path=None, **options):
+        super().__init__(rect, **options)
+        if not replay_path:
+            raise ValueError("capture_replay_path is not set")
+        self.path = replay_path
+        self.frame_bytes = self.width * self.height * 4
+        self.buffer = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        self.process = None
+        self._start()
+
+    @staticmethod
+    def monitors(synthetic_size=(1920, 1080), **options):
+        return SyntheticBackend.monitors(synthetic_size)
+
+    def _start(self):
+        self.process = (
+            ffmpeg.input(self.path, stream_loop=-1)
+            .output('pipe:', format='rawvideo', pix_fmt='bgra', s=f"{self.width}x{self.height}")
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdout=True)
+        )
+
+    def grab(self):
+        view = memoryview(self.buffer).cast('B')
+        read = self.process.stdout.readinto(view)
+        if read != self.frame_bytes:
+            raise EOFError(f"Replay ended: {self.path}")
+        self.grabs += 1
+        return self.buffer[:]
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdout.close()
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+BACKENDS = {
+    'mss': MssBackend,
+    'xshm': XShmBackend,
+    'xdamage': XDamageBackend,
+    'synthetic': SyntheticBackend,
+    'file': FileReplayBackend,
+    'flash': FlashBackend,
+}
+
+def backend_settings():
+    """現在の設定からバックエンド名とオプションを取得 (別プロセスに渡せる形)"""
+    return config.capture_backend, {
+        'replay_path': config.capture_replay_path,
+        'synthetic_size': config.synthetic_capture_size,
+        'flash_period': config.calibration_period_sec,
+        'flash_sec': config.calibration_flash_sec,
+    }
+
+def get_backend_class(name):
+    cls = BACKENDS.get(name)
+    if cls is None:
+        log.warning(f"Unknown capture backend '{name}', using mss")
+        return MssBackend
+    return cls
+
+def open_backend(name, rect, options=None):
+    """バックエンドを生成 (X11 系が使えない環境では mss にフォールバック)"""
+    options = options or {}
+    cls = get_backend_class(name)
+    try:
+        return cls(rect, **options)
+    except Exception as e:
+        if cls in (XShmBackend, XDamageBackend):
+            log.warning(f"Capture backend '{name}' unavailable ({e}), falling back to mss")
+            return MssBackend(rect, **options)
+        raise
@@ -0,0 +1,220 @@
+import multiprocessing as mp
+import queue
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.screen_capture import ScreenCapturer
+from core.capture_backends import backend_settings
+from core.zoom import roi_size
+from core.scheduling import apply_current_thread
+from utils.logger import get_logger, child_logging_config, setup_child_logging
+
+log = get_logger("capture")
+
+
+def _capture_worker(shm_name, shape, slots, conn, free_slots, stop_event, pause_event,
+                    region, monitor_index, show_cursor, target_fps, thread_policy=None,
+                    backend=None, backend_options=None, zoom=None, log_config=None):
+    """
+    子プロセス側のキャプチャループ
+    フレーム本体は共有メモリのリングバッファに書き込み、パイプには (スロット番号, タイムスタンプ) のみ流す
+    free_slots: 空いたスロット番号のキュー (親側は使い終わった順に返却するので、番号の順序は決まっていない)
+    log_config: 親プロセスのログキューとレベル (spawn した子プロセスではログ設定が引き継がれないため)
+    """
+    setup_child_logging(log_config)
+    if thread_policy:
+        apply_current_thread(thread_policy.get('cpus'), thread_policy.get('priority', 'normal'))
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((slots,) + tuple(shape), dtype=np.uint8, buffer=shm.buf)
+    capturer = ScreenCapturer(backend, backend_options)
+
+    # 停止・一時停止は別スレッドでイベントを監視してキャプチャラーに反映
+    # (一時停止中のジェネレータは yield しないため、ループ内では検知できない)
+    def _watch_control():
+        while not stop_event.wait(0.05):
+            capturer.paused = pause_event.is_set()
+        capturer.stop()
+
+    watcher = threading.Thread(target=_watch_control, daemon=True)
+    watcher.start()
+
+    try:
+        for frame, timestamp in capturer.start_capture(region=region, monitor_index=monitor_index,
+                                                       show_cursor=show_cursor, target_fps=target_fps,
+                                                       zoom=zoom):
+            # 空きスロットを待つ (消費側が追いつかない場合はここでキャプチャが待たされる)
+            slot = None
+            while slot is None:
+                try:
+                    slot = free_slots.get(timeout=0.1)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        return
+            if frame.shape != ring.shape[1:]:
+                free_slots.put(slot)
+                log.error(f"Capture error: unexpected frame shape {frame.shape}")
+                break
+            np.copyto(ring[slot], frame)
+            try:
+                conn.send((slot, timestamp))
+            except (BrokenPipeError, OSError):
+                break # 親側が停止して受信端を閉じた
+    finally:
+        stop_event.set()
+        try:
+            conn.send(None) # 終了通知
+        except (BrokenPipeError, OSError):
+            pass
+        conn.close()
+        del ring
+        shm.close()
+
+
+class ProcessScreenCapturer:
+    """
+    ScreenCapturer を別プロセスで動かすラッパー
+    GUIスレッドとGILを共有しないため、UIの再描画がフレーム間隔に影響しない
+    インターフェースは ScreenCapturer と同じ (start_capture / stop / pause / resume)
+    """
+    def __init__(self, slots=4, thread_policy=None, deferred_release=False):
+        """
+        deferred_release: True なら yield したスロットは release_frame() を呼ぶまで返却しない
+                          (共有メモリ上のビューをコピーせずにエンコーダまで渡す場合。slots はその分多く取ること)
+        """
+        self.slots = max(2, int(slots))
+        self.thread_policy = thread_policy # キャプチャスレッドのコア固定・優先度 (CpuScheduler.thread_policy)
+        self.deferred_release = deferred_release
+        self.running = False
+        self.paused = False
+        self.process = None
+        self.shm = None
+        self._ctx = mp.get_context("spawn")
+        self._stop_event = None
+        self._pause_event = None
+        self._free_slots = None
+        self._ring_base = None
+        self._frame_bytes = 0
+
+    @staticmethod
+    def get_monitors():
+        return ScreenCapturer.get_monitors()
+
+    def start_capture(self, region=None, monitor_index=1, show_cursor=True, target_fps=30, zoom=None):
+        """
+        キャプチャを開始するジェネレータ
+        yield されるフレームは共有メモリ上のビューで、次のフレームを要求するまで
+        (deferred_release 時は release_frame() を呼ぶまで) のみ有効
+        """
+        self.running = True
+        self.paused = False
+
+        # リングバッファのサイズを決めるため、親プロセス側でキャプチャ範囲を確定させる
+        backend, backend_options = backend_settings()
+        monitor = ScreenCapturer.resolve_monitor(ScreenCapturer.list_monitors(), region, monitor_index)
+        width, height = monitor["width"], monitor["height"]
+        if zoom and zoom.get('factor', 1.0) > 1.0:
+            width, height = roi_size(width, height, zoom['factor']) # ズーム時は ROI のサイズ
+        shape = (height, width, 4)
+        frame_bytes = int(np.prod(shape))
+
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.slots)
+        ring = np.ndarray((self.slots,) + shape, dtype=np.uint8, buffer=self.shm.buf)
+
+        recv_conn, send_conn = self._ctx.Pipe(duplex=False)
+        free_slots = self._free_slots = self._ctx.Queue()
+        for slot in range(self.slots):
+            free_slots.put(slot)
+        self._ring_base = ring.__array_interface__['data'][0]
+        self._frame_bytes = frame_bytes
+        self._stop_event = self._ctx.Event()
+        self._pause_event = self._ctx.Event()
+
+        self.process = self._ctx.Process(
+            target=_capture_worker,
+            args=(self.shm.name, shape, self.slots, send_conn, free_slots,
+                  self._stop_event, self._pause_event,
+                  region, monitor_index, show_cursor, target_fps, self.thread_policy,
+                  backend, backend_options, zoom, child_logging_config(self._ctx)),
+            daemon=True,
+        )
+        self.process.start()
+        send_conn.close() # 親側の送信端は不要
+
+        try:
+            while self.running:
+                if not recv_conn.poll(0.1):
+                    if not self.process.is_alive():
+                        break
+                    continue
+                try:
+                    msg = recv_conn.recv()
+                except EOFError:
+                    break
+                if msg is None:
+                    break
+                slot, timestamp = msg
+                if self.deferred_release:
+                    # 返却は消費側 (release_frame) に任せる
+                    yield ring[slot], timestamp
+                    continue
+                try:
+                    yield ring[slot], timestamp
+                finally:
+                    # 消費側が次を要求した時点でスロットを返却
+                    free_slots.put(slot)
+        finally:
+            del ring
+            recv_conn.close()
+            self._shutdown()
+
+    def release_frame(self, frame):
+        """deferred_release 時: yield したフレームのスロットを返却する (フレームごとに1回)"""
+        free_slots = self._free_slots
+        if free_slots is None:
+            return # 終了済み
+        slot = (frame.__array_interface__['data'][0] - self._ring_base) // self._frame_bytes
+        free_slots.put(slot)
+
+    def _shutdown(self):
+        self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self.process is not None:
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.process = None
+        if self._free_slots is not None:
+            # 子プロセスは終了しているので、残りの返却を待たずに閉じる
+            self._free_slots.cancel_join_thread()
+            self._free_slots.close()
+            self._free_slots = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                # 呼び出し側がまだフレームのビューを保持している
+                pass
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = None
+
+    def stop(self):
+        self.running = False
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def pause(self):
+        self.paused = True
+        if self._pause_event is not None:
+            self._pause_event.set()
+
+    def resume(self):
+        self.paused = False
+        if self._pause_event is not None:
+            self._pause_event.clear()
@@ -0,0 +1,230 @@
+import os
+import time
+from collections import deque
+
+import ffmpeg
+
+from utils.logger import get_logger
+
+log = get_logger("encoder")
+
+class SupervisedEncoder:
+    """
+    VideoEncoder の監視ラッパー (write_frame / get_progress / stop は VideoEncoder と同じ)
+    ffmpeg が落ちた・パイプが切れたら新しいセグメントに書き込む代わりのエンコーダを起動し、
+    停止時にセグメントを無劣化で結合して output_path にする
+
+    - 起動し直す間に届くフレームは送り出し側 (EncoderFeeder のキューと退避ファイル) に溜まる
+    - 落ちたエンコーダの内部に残っていたフレームは、直近のフレームを保持するリングから再送する
+      (キャプチャの共有メモリから借用したフレームはコピーせず、リングから外れた時点で返却する)
+    - セグメントは断片化して書くので、落ちても直前の断片までは読める
+      結合時に実際のフレーム数を数え、再送と重なる分は切り捨て、失われた分は前のコマを表示し続けて時間軸を保つ
+    """
+    def __init__(self, factory, output_path, fps, replay_sec=1.0, max_restarts=3, on_spawn=None,
+                 replay_max_bytes=None):
+        """
+        factory(path, output_options) -> 未起動の VideoEncoder
+        on_spawn(encoder): 起動直後に呼ばれる (優先度・コア固定の適用など)
+        replay_max_bytes: 再送用リングのメモリ上限 (None は replay_sec 分すべて、0 で再送しない)
+        """
+        self.factory = factory
+        self.output_path = output_path
+        self.fps = fps
+        self.max_restarts = max_restarts
+        self.on_spawn = on_spawn
+        self.base, self.ext = os.path.splitext(output_path)
+        # 再送用リング (フレームの大きさが分かる最初の書き込みで作る)
+        self.replay_frames = max(1, int(round(fps * replay_sec)))
+        self.replay_max_bytes = replay_max_bytes
+        self.replay = None
+        self.fragment_us = max(1, int(replay_sec * 1_000_000 / 4))
+        self.encoder = None
+        self.segments = [] # {'path', 'start'} (start: 全体での先頭フレーム番号)
+        self.gaps = []
+        self.frames_in = 0 # 受け取ったフレーム数 (全体のフレーム番号)
+        self.failed = False
+        self.frames_discarded = 0 # 再起動を諦めた後に捨てたフレーム数
+
+    @property
+    def process(self):
+        return self.encoder.process if self.encoder else None
+
+    def _output_options(self):
+        if self.ext.lower() in ('.mp4', '.mov'):
+            # 断片化 MP4 (moov を先頭に置き、一定時間ごとに断片を書き出す)
+            return {'movflags': '+empty_moov+default_base_moof', 'frag_duration': self.fragment_us}
+        return {} # Matroska はクラスタ単位で読める
+
+    def _spawn(self):
+        index = len(self.segments)
+        path = self.output_path if index == 0 else f"{self.base}.seg{index:03d}{self.ext}"
+        encoder = self.factory(path, self._output_options())
+        encoder.start()
+        if self.on_spawn:
+            self.on_spawn(encoder)
+        self.encoder = encoder
+        self.segments.append({'path': path, 'start': self.frames_in})
+
+    def start(self):
+        self._spawn()
+
+    def write_frame(self, frame, release=None):
+        """release(frame): frame が借用したビューの場合に指定 (使い終わったら呼ぶ)"""
+        if self.failed:
+            self.frames_discarded += 1
+            if release:
+                release(frame)
+            return False
+        if self.replay is None:
+            self.replay = deque(maxlen=self.replay_length(frame.nbytes))
+        if self.replay.maxlen:
+            if len(self.replay) == self.replay.maxlen:
+                self._release_entry(self.replay.popleft())
+            if release is None and not frame.flags.owndata:
+                # 退避ファイルのビューは次の書き込みで上書きされるのでコピー
+                frame = frame.copy()
+            self.replay.append((frame, release))
+        self.frames_in += 1
+        written = self.encoder.process.poll() is None and self.encoder.write_frame(frame)
+        if not written:
+            written = self._restart()
+        if release and not self.replay.maxlen:
+            release(frame)
+        return written
+
+    @staticmethod
+    def _release_entry(entry):
+        frame, release = entry
+        if release:
+            release(frame)
+
+    def _release_replay(self):
+        """リングに保持している借用フレームをすべて返却"""
+        while self.replay:
+            self._release_entry(self.replay.popleft())
+
+    def replay_length(self, frame_bytes):
+        """
+        リングに保持するフレーム数 (フル解像度の BGRA なので、高解像度ではメモリ上限で抑える)
+        借用したフレームを渡す場合、貸し出し側はこの枚数分を余分に確保しておくこと
+        """
+        if self.replay_max_bytes is None:
+            return self.replay_frames
+        return min(self.replay_frames, int(self.replay_max_bytes) // max(1, frame_bytes))
+
+    def _restart(self):
+        """代わりのエンコーダを起動して、リングに残っているフレームを書き直す"""
+        detected = time.perf_counter()
+        returncode = self.encoder.process.poll()
+        self.encoder.stop()
+        if len(self.gaps) >= self.max_restarts:
+            log.error(f"Encoder failed {len(self.gaps) + 1} times, giving up")
+            self.failed = True
+            self.encoder = None
+            self._release_replay()
+            return False
+        # 再送は現在のセグメントの先頭より前には戻らない (立て続けに落ちた場合)
+        replay_start = max(self.frames_in - len(self.replay or ()), self.segments[-1]['start'])
+        frames = [entry[0] for entry in list(self.replay)[replay_start - self.frames_in:]] \
+            if replay_start < self.frames_in else []
+        # 前のセグメントは再送の先頭までで打ち切る (結合時に使う)
+        self.segments[-1]['end'] = replay_start
+        try:
+            self.frames_in = replay_start
+            self._spawn()
+            for frame in frames:
+                self.frames_in += 1
+                if not self.encoder.write_frame(frame):
+                    raise RuntimeError("replacement encoder rejected frames")
+        except Exception as e:
+            log.error(f"Encoder restart failed: {e}")
+            self.failed = True
+            self._release_replay()
+            return False
+        gap = {
+            "at_sec": round(replay_start / self.fps, 3),
+            "restart_ms": round((time.perf_counter() - detected) * 1000, 1),
+            "replayed_frames": len(frames),
+            "returncode": returncode,
+        }
+        self.gaps.append(gap)
+        log.warning("Encoder restarted", extra={"fields": gap})
+        return True
+
+    def get_progress(self):
+        """現在のセグメントの進捗 (encoded_frames は全体のフレーム番号に換算)"""
+        if not self.encoder:
+            return {}
+        progress = self.encoder.get_progress()
+        if progress:
+            progress['encoded_frames'] += self.segments[-1]['start']
+        return progress
+
+    def get_stats(self):
+        return {
+            "encoder_restarts": len(self.gaps),
+            "encoder_gaps": [dict(gap) for gap in self.gaps],
+            "encoder_failed": self.failed,
+            "encoder_discarded_frames": self.frames_discarded,
+            "encoder_replay_frames": self.replay.maxlen if self.replay is not None else 0,
+        }
+
+    @staticmethod
+    def _count_frames(path):
+        """実際に読めるフレーム数 (落ちたセグメントの末尾は欠けている)"""
+        try:
+            info = ffmpeg.probe(path, select_streams='v:0', count_packets=None)
+            return int(info['streams'][0].get('nb_read_packets') or 0)
+        except Exception as e:
+            log.warning(f"Failed to probe segment {path}: {e}")
+            return 0
+
+    def stop(self):
+        """最後のエンコーダを終了し、セグメントがあれば結合する"""
+        if self.encoder:
+            self.encoder.stop()
+            self.encoder = None
+        self._release_replay()
+        # 配信のみ (ファイル出力なし) の場合は結合するものが無い
+        if len(self.segments) > 1 and os.path.exists(self.segments[0]['path']):
+            self._join_segments()
+
+    def _join_segments(self):
+        """concat demuxer でストリームコピー結合 (各セグメントの長さは受け取ったフレーム数で固定)"""
+        first = self.segments[0]
+        first_path = f"{self.base}.seg000{self.ext}"
+        os.replace(first['path'], first_path)
+        first['path'] = first_path
+        list_path = f"{self.base}.segments.txt"
+        lines = []
+        for index, segment in enumerate(self.segments[:-1]):
+            expected = segment['end'] - segment['start']
+            actual = self._count_frames(segment['path'])
+            if index < len(self.gaps):
+                self.gaps[index]['lost_frames'] = max(0, expected - actual)
+            lines.append(f"file '{os.path.abspath(segment['path'])}'")
+            # 再送分との重なりを落とし (outpoint)、欠けた分は時間を空けて後ろをずらさない (duration)
+            lines.append(f"outpoint {(expected - 0.5) / self.fps:.6f}")
+            lines.append(f"duration {expected / self.fps:.6f}")
+        lines.append(f"file '{os.path.abspath(self.segments[-1]['path'])}'")
+        with open(list_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        try:
+            (
+                ffmpeg.input(list_path, format='concat', safe=0)
+                .output(self.output_path, c='copy')
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        except ffmpeg.Error as e:
+            # 結合できなければ最初のセグメントだけでも出力として残す (他のセグメントは作業フォルダに残る)
+            log.error(f"Failed to join encoder segments: {e.stderr.decode('utf-8', 'replace')[-500:]}")
+            os.replace(first_path, self.output_path)
+            return
+        for segment in self.segments:
+            os.remove(segment['path'])
+        os.remove(list_path)
+        log.info("Encoder segments joined", extra={"fields": {
+            "segments": len(self.segments),
+            "lost_frames": sum(gap.get('lost_frames', 0) for gap in self.gaps),
+        }})
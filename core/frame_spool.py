@@ -0,0 +1,189 @@
+import mmap
+import os
+import threading
+import queue
+from collections import deque
+
+import numpy as np
+
+
+class FrameSpool:
+    """
+    メモリマップされた生フレームの退避ファイル (リング構造)
+    容量上限 (max_bytes) を超えた分は保存できず、dropped としてカウントする
+    """
+    def __init__(self, path, frame_shape, max_bytes):
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.capacity = max(0, int(max_bytes) // self.frame_bytes) if self.frame_bytes else 0
+        self.file = None
+        self.mm = None
+        self.timestamps = deque()
+        self.read_index = 0
+        self.write_index = 0
+        self.dropped = 0
+        self.peak_frames = 0
+
+        if self.capacity > 1:
+            self.file = open(self.path, "w+b")
+            # 疎ファイルとして確保 (実際に書き込まれるまでディスクを消費しない)
+            self.file.truncate(self.capacity * self.frame_bytes)
+            self.mm = mmap.mmap(self.file.fileno(), self.capacity * self.frame_bytes)
+
+    def __len__(self):
+        return self.write_index - self.read_index
+
+    def fill_ratio(self):
+        if self.capacity <= 1:
+            return 0.0
+        return len(self) / (self.capacity - 1)
+
+    def append(self, frame, timestamp):
+        """フレームを末尾に追加。満杯なら False を返す"""
+        # 直前に pop したスロットはまだ読み出し中の可能性があるため 1 枠空けておく
+        if self.mm is None or len(self) >= self.capacity - 1:
+            self.dropped += 1
+            return False
+        offset = (self.write_index % self.capacity) * self.frame_bytes
+        self.mm[offset:offset + self.frame_bytes] = memoryview(np.ascontiguousarray(frame)).cast("B")
+        self.timestamps.append(timestamp)
+        self.write_index += 1
+        self.peak_frames = max(self.peak_frames, len(self))
+        return True
+
+    def pop(self):
+        """先頭のフレームを (ndarray, timestamp) で取り出す。空なら None"""
+        if len(self) == 0:
+            return None
+        offset = (self.read_index % self.capacity) * self.frame_bytes
+        # mmap 上のビューを返す (次の append で上書きされる前に消費すること)
+        frame = np.frombuffer(self.mm, dtype=np.uint8, count=self.frame_bytes, offset=offset)
+        self.read_index += 1
+        return frame.reshape(self.frame_shape), self.timestamps.popleft()
+
+    def close(self):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class EncoderFeeder:
+    """
+    キャプチャとエンコーダの間に入る送り出しスレッド
+    メモリ上のキューが溢れた分は FrameSpool に退避し、エンコーダが追いついた時点で順番通りに書き出す
+    """
+    def __init__(self, encoder, frame_shape, fps, queue_size=8, spool_path=None, spool_max_bytes=0, release=None):
+        """
+        release(frame): 指定時は submit されたフレームを借用したビュー (キャプチャの共有メモリ) として扱い、
+                        コピーせずにキューへ入れる。使い終わったら release で返却する
+                        (エンコーダへ渡したフレームの返却は encoder.write_frame(frame, release=...) に任せる)
+        """
+        self.encoder = encoder
+        self.release = release
+        self.fps = fps
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.spool = FrameSpool(spool_path, frame_shape, spool_max_bytes) if spool_path else None
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.latest_timestamp = 0.0
+        self.peak_backlog_sec = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._feed_loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame, timestamp):
+        """キャプチャ側から呼ばれる。ブロックしない"""
+        with self.lock:
+            self.latest_timestamp = timestamp
+            # 退避中のフレームがある間は順序を守るため新しいフレームも退避先へ
+            if self.spool is None or len(self.spool) == 0:
+                try:
+                    if self.release:
+                        # 借用したビューのまま渡す (返却はエンコーダへの書き込み後)
+                        self.queue.put_nowait((frame, timestamp, True))
+                    else:
+                        # 呼び出し元がバッファを再利用する場合に備えて所有権のある配列にする
+                        self.queue.put_nowait((frame if frame.flags.owndata else frame.copy(), timestamp, False))
+                    return
+                except queue.Full:
+                    pass
+            if self.spool is None or not self.spool.append(frame, timestamp):
+                self.frames_dropped += 1
+        # 退避ファイルへコピーしたか捨てたフレームはすぐに返却
+        if self.release:
+            self.release(frame)
+
+    def _next_item(self):
+        # キューのフレームは退避中のフレームより古いので先に取り出す
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        # 退避中のフレームがある間は待たずに取り出す (待つと取得レートより遅くなり退避が解消しない)
+        if self.spool is not None:
+            with self.lock:
+                item = self.spool.pop()
+            if item is not None:
+                return item + (False,)
+        # どちらも空の時だけキューで待つ
+        try:
+            return self.queue.get(timeout=0.05)
+        except queue.Empty:
+            return None
+
+    def _feed_loop(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                if not self.running:
+                    break
+                continue
+            frame, timestamp, borrowed = item
+            self.peak_backlog_sec = max(self.peak_backlog_sec, self.latest_timestamp - timestamp)
+            if borrowed:
+                self.encoder.write_frame(frame, release=self.release)
+            else:
+                self.encoder.write_frame(frame)
+            self.frames_written += 1
+
+    def get_stats(self):
+        stats = {
+            "queue_frames": self.queue.qsize(),
+            "frames_written": self.frames_written,
+            "frames_dropped": self.frames_dropped,
+            "peak_backlog_sec": round(self.peak_backlog_sec, 3),
+            "spool_fill": 0.0,
+            "spool_frames": 0,
+            "spool_peak_frames": 0,
+        }
+        if self.spool is not None:
+            stats["spool_fill"] = round(self.spool.fill_ratio(), 3)
+            stats["spool_frames"] = len(self.spool)
+            stats["spool_peak_frames"] = self.spool.peak_frames
+        return stats
+
+    def stop(self):
+        """残りのフレームをすべて書き出してから停止"""
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        if self.spool is not None:
+            self.spool.close()
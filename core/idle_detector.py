@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class IdleDetector:
+    """
+    画面の変化と音声の有無から「何も起きていない区間」を検出する
+    無操作・無音が idle_threshold_sec を超えた分は録画に出力しない (後からの再エンコード不要)
+    """
+    def __init__(self, idle_threshold_sec=3.0, change_threshold=0.002, stride=8, pixel_tolerance=8):
+        self.idle_threshold_sec = idle_threshold_sec
+        self.change_threshold = change_threshold # 変化したサンプル画素の割合
+        self.stride = max(1, int(stride))
+        self.pixel_tolerance = pixel_tolerance # 圧縮ノイズ等を無視するための差分許容値
+        self.cut_seconds = 0.0
+        self.cut_segments = 0
+        self.cut_start = None
+        self.reset()
+
+    def reset(self, timestamp=None):
+        """一時停止時などに検出状態をリセット (進行中のカットは timestamp で閉じる)"""
+        if self.cut_start is not None and timestamp is not None:
+            self.cut_seconds += timestamp - self.cut_start
+        self.cut_start = None
+        self.prev_sample = None
+        self.last_activity = None
+        self.last_score = 0.0
+
+    def change_score(self, frame):
+        """
+        間引いた画素同士の比較による安価な変化量 (0.0 - 1.0)
+        比較対象は最後に変化ありと判定したフレーム (毎フレーム更新すると、少しずつ進む変化を検出できない)
+        BGRA の A チャンネルは常に一定なので除外
+        戻り値: (変化量, 間引いた画素)
+        """
+        sample = frame[::self.stride, ::self.stride, :3].astype(np.int16)
+        prev = self.prev_sample
+        if prev is None or prev.shape != sample.shape:
+            return 1.0, sample
+        changed = np.abs(sample - prev).max(axis=2) > self.pixel_tolerance
+        return float(np.count_nonzero(changed)) / changed.size, sample
+
+    def update(self, frame, timestamp, last_sound_time=None):
+        """
+        フレームごとに呼び出す
+        戻り値: このフレームを出力するなら True、アイドル区間としてカットするなら False
+        """
+        self.last_score, sample = self.change_score(frame)
+        if self.last_activity is None or self.last_score > self.change_threshold:
+            self.last_activity = timestamp
+            self.prev_sample = sample
+        if last_sound_time:
+            self.last_activity = max(self.last_activity, last_sound_time)
+
+        idle = (timestamp - self.last_activity) > self.idle_threshold_sec
+        if idle and self.cut_start is None:
+            self.cut_start = timestamp
+            self.cut_segments += 1
+        elif not idle and self.cut_start is not None:
+            self.cut_seconds += timestamp - self.cut_start
+            self.cut_start = None
+        return not idle
+
+    def get_stats(self, now=None):
+        cut_seconds = self.cut_seconds
+        if self.cut_start is not None and now is not None:
+            cut_seconds += now - self.cut_start
+        return {
+            "idle_cut_sec": round(cut_seconds, 1),
+            "idle_cut_segments": self.cut_segments,
+            "change_score": round(self.last_score, 4),
+        }
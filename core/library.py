@@ -0,0 +1,274 @@
+import os
+import json
+import sqlite3
+import threading
+import queue
+import time
+import ffmpeg
+from PyQt6.QtCore import QObject, pyqtSignal
+from utils.logger import get_logger
+
+log = get_logger("library")
+
+VIDEO_EXTENSIONS = (".mp4", ".gif", ".mkv", ".mov")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    created_at REAL NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    size INTEGER,
+    audio_sources TEXT,
+    stats TEXT,
+    probed INTEGER NOT NULL DEFAULT 0,
+    thumb_path TEXT,
+    sprite_path TEXT,
+    resume_points TEXT,
+    keyframe_interval_sec REAL
+);
+CREATE INDEX IF NOT EXISTS idx_recordings_created ON recordings(created_at DESC);
+"""
+
+# 後から追加した列 (既存の DB には ALTER TABLE で追加する)
+ADDED_COLUMNS = {
+    "resume_points": "TEXT", # 一時停止からの再開位置 (秒数の JSON 配列、分割位置の候補)
+    "keyframe_interval_sec": "REAL",
+}
+
+class RecordingLibrary:
+    """
+    録画ファイルのカタログ (SQLite)
+    録画完了時のメタデータを保存しておき、一覧表示のたびに動画をスキャン・デコードしない
+    """
+    def __init__(self, library_dir):
+        self.library_dir = library_dir
+        self.thumb_dir = os.path.join(library_dir, "thumbs")
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        self.db_path = os.path.join(library_dir, "library.sqlite3")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(recordings)")}
+            for name, column_type in ADDED_COLUMNS.items():
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE recordings ADD COLUMN {name} {column_type}")
+            self.conn.commit()
+
+    def add_recording(self, path, info=None):
+        """録画完了時に呼ぶ。info は Recorder.recording_info"""
+        info = info or {}
+        path = os.path.abspath(path)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        probed = 1 if info.get("duration") is not None else 0
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO recordings (path, created_at, duration, width, height, fps, size,
+                                           audio_sources, stats, probed, resume_points, keyframe_interval_sec)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                       duration=excluded.duration, width=excluded.width, height=excluded.height,
+                       fps=excluded.fps, size=excluded.size, audio_sources=excluded.audio_sources,
+                       stats=excluded.stats, probed=excluded.probed,
+                       resume_points=excluded.resume_points,
+                       keyframe_interval_sec=excluded.keyframe_interval_sec,
+                       thumb_path=NULL, sprite_path=NULL""",
+                (path, info.get("created_at", time.time()), info.get("duration"),
+                 info.get("width"), info.get("height"), info.get("fps"), size,
+                 ",".join(info.get("audio_sources", [])), json.dumps(info.get("stats", {})), probed,
+                 json.dumps(info.get("resume_points", [])), info.get("keyframe_interval_sec"))
+            )
+            self.conn.commit()
+
+    def import_directory(self, directory):
+        """
+        カタログに無い既存の録画ファイルを登録 (メタデータは後からサムネイル生成時に取得)
+        戻り値: 追加した件数
+        """
+        added = 0
+        with self.lock:
+            known = {row[0] for row in self.conn.execute("SELECT path FROM recordings")}
+            for entry in os.scandir(directory):
+                if not entry.is_file() or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+                path = os.path.abspath(entry.path)
+                if path in known:
+                    continue
+                stat = entry.stat()
+                self.conn.execute(
+                    "INSERT INTO recordings (path, created_at, size) VALUES (?, ?, ?)",
+                    (path, stat.st_mtime, stat.st_size)
+                )
+                added += 1
+            self.conn.commit()
+        return added
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+
+    def fetch(self, offset, limit):
+        """新しい順に limit 件取得"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM recordings ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, recording_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def resume_points(row):
+        """行の再開位置 (分割位置の候補) を秒数のリストで返す"""
+        try:
+            return [float(p) for p in json.loads(row.get("resume_points") or "[]")]
+        except (TypeError, ValueError):
+            return []
+
+    def update(self, recording_id, **fields):
+        if not fields:
+            return
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE recordings SET {columns} WHERE id = ?",
+                              (*fields.values(), recording_id))
+            self.conn.commit()
+
+    def remove_missing(self):
+        """実体が存在しないエントリを削除"""
+        with self.lock:
+            rows = self.conn.execute("SELECT id, path FROM recordings").fetchall()
+            missing = [(row["id"],) for row in rows if not os.path.exists(row["path"])]
+            self.conn.executemany("DELETE FROM recordings WHERE id = ?", missing)
+            self.conn.commit()
+        return len(missing)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ThumbnailWorker(QObject):
+    """
+    サムネイル・スプライトシートをバックグラウンドで生成してディスクにキャッシュする
+    一覧に表示されたものだけを要求ベースで生成する
+    """
+    thumbnail_ready = pyqtSignal(int) # recording id
+
+    THUMB_WIDTH = 320
+    SPRITE_TILE_WIDTH = 160
+    SPRITE_GRID = (5, 5)
+
+    def __init__(self, library):
+        super().__init__()
+        self.library = library
+        self.requests = queue.Queue()
+        self.pending = set()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+        if self.thread:
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def request(self, recording_id):
+        """サムネイル生成を要求 (重複要求は無視)"""
+        if recording_id in self.pending:
+            return
+        self.pending.add(recording_id)
+        self.requests.put(recording_id)
+
+    def _worker_loop(self):
+        while self.running:
+            recording_id = self.requests.get()
+            if recording_id is None:
+                break
+            try:
+                self._generate(recording_id)
+            except Exception as e:
+                log.warning(f"Thumbnail generation failed ({recording_id}): {e}")
+            finally:
+                self.pending.discard(recording_id)
+
+    def _generate(self, recording_id):
+        row = self.library.get(recording_id)
+        if not row or not os.path.exists(row["path"]):
+            return
+
+        duration = row["duration"]
+        if not row["probed"]:
+            duration = self._probe(row)
+
+        thumb_path = os.path.join(self.library.thumb_dir, f"{recording_id}.jpg")
+        sprite_path = os.path.join(self.library.thumb_dir, f"{recording_id}_sprite.jpg")
+
+        # 代表フレーム (冒頭のカウントダウン等を避けて 10% 地点)
+        seek = (duration or 0) * 0.1
+        (
+            ffmpeg
+            .input(row["path"], ss=seek)
+            .filter('scale', self.THUMB_WIDTH, -2)
+            .output(thumb_path, vframes=1)
+            .run(overwrite_output=True, quiet=True)
+        )
+
+        # スプライトシート (全体を均等に間引いてタイル状に並べる)
+        cols, rows = self.SPRITE_GRID
+        if duration:
+            interval = max(duration / (cols * rows), 0.1)
+            try:
+                (
+                    ffmpeg
+                    .input(row["path"])
+                    .filter('fps', fps=1.0 / interval)
+                    .filter('scale', self.SPRITE_TILE_WIDTH, -2)
+                    .filter('tile', f"{cols}x{rows}")
+                    .output(sprite_path, vframes=1)
+                    .run(overwrite_output=True, quiet=True)
+                )
+            except ffmpeg.Error:
+                sprite_path = None
+        else:
+            sprite_path = None
+
+        self.library.update(recording_id, thumb_path=thumb_path, sprite_path=sprite_path)
+        self.thumbnail_ready.emit(recording_id)
+
+    def _probe(self, row):
+        """取り込んだだけのファイルのメタデータを取得"""
+        info = ffmpeg.probe(row["path"])
+        video = next((s for s in info["streams"] if s.get("codec_type") == "video"), {})
+        audio_count = sum(1 for s in info["streams"] if s.get("codec_type") == "audio")
+        duration = float(info.get("format", {}).get("duration") or 0) or None
+        fps = None
+        rate = video.get("avg_frame_rate", "0/0")
+        num, _, den = rate.partition("/")
+        if den and float(den) != 0:
+            fps = round(float(num) / float(den), 2)
+        self.library.update(
+            row["id"], duration=duration, width=video.get("width"), height=video.get("height"),
+            fps=fps, audio_sources="audio" if audio_count else "", probed=1
+        )
+        return duration
@@ -0,0 +1,84 @@
+import sys
+import mss
+import numpy as np
+
+# ピクチャインピクチャの配置 (overlay フィルタの式: W/H=メイン, w/h=子画面)
+POSITIONS = {
+    'top-left': ('{m}', '{m}'),
+    'top-right': ('W-w-{m}', '{m}'),
+    'bottom-left': ('{m}', 'H-h-{m}'),
+    'bottom-right': ('W-w-{m}', 'H-h-{m}'),
+}
+
+def pip_size(main_size, source_size, scale):
+    """メイン映像の幅に対する比率から子画面サイズを決定 (偶数に丸める)"""
+    main_w, _ = main_size
+    src_w, src_h = source_size
+    w = max(2, int(main_w * scale) // 2 * 2)
+    h = max(2, int(w * src_h / src_w) // 2 * 2) if src_w else w
+    return w, h
+
+def overlay_expressions(position, margin):
+    x, y = POSITIONS.get(position, POSITIONS['bottom-right'])
+    return x.format(m=margin), y.format(m=margin)
+
+def overlay_offset(position, margin, main_size, size):
+    """overlay_expressions と同じ配置をピクセル座標で返す (ROI 直接書き込み用)"""
+    main_w, main_h = main_size
+    w, h = size
+    x = margin if position in ('top-left', 'bottom-left') else main_w - w - margin
+    y = margin if position in ('top-left', 'top-right') else main_h - h - margin
+    return max(0, x), max(0, y)
+
+def ffmpeg_input_args(source_type, source):
+    """
+    ファイル・カメラを ffmpeg の入力として開くための (url, kwargs)
+    ファイルはループ再生、カメラはプラットフォームごとのデバイス指定
+    """
+    if source_type == 'file':
+        return source, {'stream_loop': -1}
+    if source_type == 'camera':
+        if sys.platform.startswith('win'):
+            return f"video={source}", {'format': 'dshow'}
+        if sys.platform == 'darwin':
+            return str(source), {'format': 'avfoundation'}
+        return source or '/dev/video0', {'format': 'v4l2'}
+    raise ValueError(f"Unsupported PiP source type: {source_type}")
+
+
+class RegionPipSource:
+    """
+    画面の別領域を子画面として合成する
+    取得した ROI を縮小してフレームの該当部分にだけ直接書き込む (フレーム全体のコピーは発生しない)
+    """
+    def __init__(self, region, main_size, scale=0.25, position='bottom-right', margin=16):
+        # region: (left, top, width, height)
+        self.region = {
+            "left": int(region[0]),
+            "top": int(region[1]),
+            "width": int(region[2]),
+            "height": int(region[3]),
+        }
+        self.size = pip_size(main_size, (self.region["width"], self.region["height"]), scale)
+        self.offset = overlay_offset(position, margin, main_size, self.size)
+        # 最近傍法の縮小用インデックス (毎フレーム計算しない)
+        w, h = self.size
+        self.rows = (np.arange(h) * self.region["height"] // h).astype(np.intp)
+        self.cols = (np.arange(w) * self.region["width"] // w).astype(np.intp)
+        self.sct = None
+
+    def blit(self, frame):
+        """frame (BGRA) の子画面領域を上書き"""
+        if self.sct is None:
+            # mss は呼び出しスレッドで生成する必要がある
+            self.sct = mss.mss()
+        grab = np.asarray(self.sct.grab(self.region))
+        x, y = self.offset
+        w, h = self.size
+        dest = frame[y:y + h, x:x + w]
+        dest[...] = grab[np.ix_(self.rows[:dest.shape[0]], self.cols[:dest.shape[1]])]
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
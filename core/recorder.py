@@ -1,16 +1,59 @@
 import threading
 import time
 import os
-import wave
-import numpy as np
+import shutil
 import ffmpeg
 from datetime import datetime
 from PyQt6.QtCore import QObject, pyqtSignal
 
 from core.screen_capture import ScreenCapturer
+from core.capture_process import ProcessScreenCapturer
 from core.audio_capture import AudioCapturer
 from core.video_encoder import VideoEncoder
+from core.encoder_supervisor import SupervisedEncoder
+from core.frame_spool import EncoderFeeder
+from core.burst import BurstWriter
+from core.idle_detector import IdleDetector
+from core.pip import RegionPipSource
+from core.scheduling import CpuScheduler
+from core.zoom import roi_size
+from core.transcoder import run_transcode, verify_output
+from core.audio_spool import AudioSpoolWriter
 from utils.config import config
+from utils.audio_devices import device_registry
+from utils.logger import get_logger
+
+log = get_logger("recorder")
+
+class RecordingSession:
+    """
+    1回分の録画の仕上げに必要な情報
+    録画スレッドの終了時に作成し、仕上げエンコード (数分かかることがある) は Recorder の属性ではなくこちらを参照する
+    """
+    def __init__(self, recorder):
+        self.workspace = recorder.workspace
+        self.lossless = recorder.lossless
+        self.timelapse = recorder.timelapse
+        self.burst = recorder.burst
+        self.zoom = recorder.zoom
+        self.stream = recorder.stream
+        self.output_format = recorder.output_format
+        self.temp_video_path = recorder.temp_video_path
+        self.final_output_path = recorder.final_output_path
+        self.audio_paths = dict(recorder.audio_paths)
+        self.audio_start_ts = dict(recorder.audio_start_ts)
+        self.video_start_ts = recorder.video_start_ts
+        self.created_at = recorder.created_at
+        self.resolution = recorder.resolution
+        self.resume_points = list(recorder.resume_points)
+        self.stats = dict(recorder.stats)
+
+    def stream_only(self):
+        return self.stream is not None and not self.stream['record']
+
+    def with_audio(self):
+        return not (self.timelapse or self.burst or self.stream_only())
+
 
 class Recorder(QObject):
     # シグナル定義
@@ -18,12 +61,29 @@ class Recorder(QObject):
     status_changed = pyqtSignal(str) # ステータス文字列
     finished = pyqtSignal(str) # 保存完了時のパス
     error_occurred = pyqtSignal(str)
+    stats_updated = pyqtSignal(dict) # 統計情報 (バッファ使用率など、約1秒ごと)
+    levels_updated = pyqtSignal(dict) # 音声レベル (dBFS、meter_update_hz ごと)
 
     def __init__(self):
         super().__init__()
         self.screen_capturer = ScreenCapturer()
         self.audio_capturer = AudioCapturer()
         self.video_encoder = None
+        self.frame_feeder = None
+        self.frame_release = None # 共有メモリから借用したフレームの返却 (別プロセスでの取得時)
+        self.idle_detector = None
+        self.pip_source = None
+        self.scheduler = None
+        self.stats = {}
+        self.last_stats_time = 0
+        self.last_levels_time = 0
+        self.backlog_growth_count = 0 # エンコード待ちのフレームが増え続けた回数
+        self.last_backlog_frames = 0
+        self.encoder_lagging = False
+        self.encoder_failed = False # エンコーダの再起動を諦めた (以降のフレームは保存されない)
+        self.recording_info = {} # 録画完了時のメタデータ (ライブラリ登録用)
+        self.frames_submitted = 0
+        self.resume_points = [] # 再開位置 (出力動画上の秒数、分割位置の候補)
         
         self.is_recording = False
         self.is_paused = False
@@ -32,16 +92,36 @@ class Recorder(QObject):
         self.pause_start_time = 0
         
         self.recording_thread = None
+        self.finalizing = False # 録画スレッドが仕上げを終えて finished / error_occurred を通知するまで True
         
         # 一時ファイルパス
+        self.workspace = "" # セッションごとの作業フォルダ
+        self.lossless = False # 低負荷録画 (可逆の中間ファイル -> 録画後に仕上げエンコード)
+        self.timelapse = False
+        self.burst = False # 連写 (静止画を連番で保存、動画・音声なし)
+        self.zoom = None # カーソル追従ズームの設定 (None は無効)
+        self.stream = None # 低遅延配信の設定 (None は配信なし)
+        self.output_format = 'mp4'
+        self.capture_fps = config.fps # 画面取得の頻度 (タイムラプス時は出力 fps と異なる)
         self.temp_video_path = ""
         self.temp_audio_path = ""
         self.final_output_path = ""
-        self.wave_file = None
+        self.wave_files = {} # トラック名 -> AudioSpoolWriter (ミックス時は 'mix' のみ)
+        self.audio_paths = {} # トラック名 -> 一時WAVパス
+        self.audio_start_ts = {} # トラック名 -> 最初のブロックの時刻
+        self.video_start_ts = None
 
     def start_recording(self, region=None, monitor_index=1, output_format='mp4'):
+        """録画を開始。前の録画の仕上げが終わっていない場合は開始せず False を返す"""
         if self.is_recording:
-            return
+            return False
+        if self.finalizing:
+            log.warning("Previous recording is still being finalized, not starting")
+            return False
+        if self.recording_thread is not None:
+            # 通知後の一時ファイル削除だけが残っている
+            self.recording_thread.join()
+            self.recording_thread = None
 
         if not os.path.exists(config.output_dir):
             os.makedirs(config.output_dir)
@@ -52,22 +132,41 @@ class Recorder(QObject):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"recording_{timestamp}.mp4" # 中間ファイルは常にMP4
         self.final_output_path = os.path.join(config.output_dir, filename)
+        self.burst = output_format == 'burst'
+        if self.burst:
+            # 連写は静止画を入れるフォルダが出力になる
+            self.final_output_path = os.path.join(config.output_dir, f"burst_{timestamp}")
+        
+        # 一時ファイルはセッションごとの作業フォルダに置く
+        self.workspace = os.path.join(config.output_dir, ".sessions", timestamp)
+        os.makedirs(self.workspace, exist_ok=True)
+        self.lossless = config.capture_mode == 'lossless'
+        video_name = "intermediate.mkv" if self.lossless else "temp_video.mp4"
+        self.temp_video_path = os.path.join(self.workspace, video_name)
+        self.temp_audio_path = os.path.join(self.workspace, "temp_audio.wav")
+        self.temp_spool_path = os.path.join(self.workspace, "temp_spool.raw")
         
-        self.temp_video_path = os.path.join(config.output_dir, "temp_video.mp4")
-        self.temp_audio_path = os.path.join(config.output_dir, "temp_audio.wav")
+        # 低遅延配信 (ファイル出力と同じエンコード結果を tee で同時に送る)
+        self.stream = None
+        if config.stream_enabled and config.stream_url and not self.burst:
+            if self.lossless:
+                log.warning("Streaming is not available in lossless capture mode")
+            else:
+                self.stream = {
+                    'url': config.stream_url,
+                    'bitrate_kbps': config.stream_bitrate_kbps,
+                    'keyint_sec': config.stream_keyint_sec,
+                    'preset': config.stream_preset,
+                    'record': config.stream_record,
+                }
         
         # 解像度の決定 (region or monitor size)
         if region:
             width, height = region[2], region[3]
         else:
-            # 指定モニタの解像度を取得するために一時的にmssを使用
-            import mss
-            with mss.mss() as sct:
-                if monitor_index < len(sct.monitors):
-                    monitor = sct.monitors[monitor_index]
-                else:
-                    monitor = sct.monitors[1]
-                width, height = monitor["width"], monitor["height"]
+            # 指定モニタの解像度 (キャプチャバックエンドのモニタ情報)
+            monitor = ScreenCapturer.resolve_monitor(ScreenCapturer.list_monitors(), None, monitor_index)
+            width, height = monitor["width"], monitor["height"]
 
         # 幅・高さは偶数である必要があるので調整
         width = width if width % 2 == 0 else width - 1
@@ -78,9 +177,111 @@ class Recorder(QObject):
         if region:
             final_region = (region[0], region[1], width, height)
         
-        # 動画エンコーダ開始
-        self.video_encoder = VideoEncoder(self.temp_video_path, (width, height), fps=config.fps)
-        self.video_encoder.start()
+        self.resolution = (width, height)
+        # カーソル追従ズーム: カーソル周辺の ROI だけを取得し、出力解像度は変えずに拡大する
+        self.zoom = None
+        frame_width, frame_height = width, height
+        if config.zoom_factor > 1.0:
+            self.zoom = {'factor': config.zoom_factor, 'smoothing_sec': config.zoom_smoothing_sec,
+                         'deadzone': config.zoom_deadzone}
+            frame_width, frame_height = roi_size(width, height, config.zoom_factor)
+        self.created_at = time.time()
+        self.frames_submitted = 0
+        self.resume_points = []
+        # タイムラプス: interval 秒ごとに1枚取得し、出力は通常の fps で再生 (音声なし)
+        self.timelapse = config.timelapse_enabled and not self.burst
+        if self.burst:
+            self.capture_fps = config.burst_fps
+        elif self.timelapse:
+            self.capture_fps = 1.0 / config.timelapse_interval_sec
+        else:
+            self.capture_fps = config.fps
+        
+        # CPU スケジューリング (エンコーダのスレッド数・優先度・コア固定)
+        self.scheduler = CpuScheduler(config.cpu_policy)
+        
+        # 子画面 (ファイル・カメラは ffmpeg 側で合成、画面領域はフレームに直接書き込む)
+        pip = None
+        self.pip_source = None
+        if config.pip_source_type in ('file', 'camera'):
+            pip = {
+                'type': config.pip_source_type,
+                'source': config.pip_source,
+                'position': config.pip_position,
+                'scale': config.pip_scale,
+                'margin': config.pip_margin,
+            }
+        elif config.pip_source_type == 'region' and config.pip_source:
+            self.pip_source = RegionPipSource(config.pip_source, (frame_width, frame_height), scale=config.pip_scale,
+                                              position=config.pip_position, margin=config.pip_margin)
+        
+        if self.burst:
+            self.video_encoder = None
+        else:
+            # 動画エンコーダ開始 (落ちたら別セグメントで再起動し、停止時に結合する)
+            codec = config.intermediate_codec if self.lossless else None
+            self.video_encoder = SupervisedEncoder(
+                lambda path, options: VideoEncoder(path, (frame_width, frame_height), fps=config.fps,
+                                                   keyint_sec=config.keyframe_interval_sec, pip=pip,
+                                                   threads=self.scheduler.encoder_threads,
+                                                   codec=codec, output_options=options,
+                                                   output_size=(width, height), stream=self.stream),
+                self.temp_video_path, config.fps,
+                replay_sec=config.encoder_replay_sec, max_restarts=config.encoder_max_restarts,
+                replay_max_bytes=config.encoder_replay_max_mb * 1024 * 1024,
+                on_spawn=lambda encoder: self.scheduler.apply_encoder(encoder.process.pid)
+            )
+            self.video_encoder.start()
+        
+        # キャプチャ方式の選択 (同一プロセス or 別プロセス)
+        self.frame_release = None
+        if config.capture_out_of_process:
+            slots = config.capture_ring_slots
+            if self.video_encoder:
+                # 共有メモリ上のフレームをコピーせずにエンコーダまで渡す
+                # (送り出しキューと再送用リングに保持される分だけスロットを増やす)
+                slots += config.frame_queue_size + self.video_encoder.replay_length(frame_width * frame_height * 4)
+            self.screen_capturer = ProcessScreenCapturer(slots=slots, thread_policy=self.scheduler.thread_policy(),
+                                                         deferred_release=self.video_encoder is not None)
+            if self.video_encoder:
+                self.frame_release = self.screen_capturer.release_frame
+        else:
+            self.screen_capturer = ScreenCapturer()
+        
+        if self.burst:
+            # 連写: 取得ループはそのまま、圧縮はプロセスプールで並列に行う (エンコーダは使わない)
+            self.frame_feeder = BurstWriter(
+                self.final_output_path, image_format=config.burst_format,
+                quality=config.burst_quality, png_compress_level=config.burst_png_compress_level,
+                workers=config.burst_workers, queue_size=config.burst_queue_size
+            )
+        else:
+            # エンコーダ送り出しスレッド (溢れたフレームはディスクへ退避)
+            self.frame_feeder = EncoderFeeder(
+                self.video_encoder, (frame_height, frame_width, 4), config.fps,
+                queue_size=config.frame_queue_size,
+                spool_path=self.temp_spool_path if config.spool_max_mb > 0 else None,
+                spool_max_bytes=config.spool_max_mb * 1024 * 1024,
+                release=self.frame_release
+            )
+        self.frame_feeder.start()
+        self.stats = {"audio_enum_ms": round(device_registry.last_enum_ms, 1)}
+        self.backlog_growth_count = 0
+        self.last_backlog_frames = 0
+        self.encoder_lagging = False
+        self.encoder_failed = False
+        
+        # 無操作・無音区間の検出
+        self.idle_detector = None
+        if self.timelapse:
+            # 前回の取得から変化の無いフレームは出力しない (しきい値 0 秒で毎回判定)
+            self.idle_detector = IdleDetector(idle_threshold_sec=0.0, change_threshold=config.idle_change_threshold)
+        elif config.idle_trim_enabled:
+            self.idle_detector = IdleDetector(
+                idle_threshold_sec=config.idle_threshold_sec,
+                change_threshold=config.idle_change_threshold
+            )
+            self.audio_capturer.silence_threshold = config.idle_audio_threshold
         
         # 音声ファイル準備
         self._prepare_audio_file()
@@ -91,51 +292,112 @@ class Recorder(QObject):
         self.start_time = time.time()
         self.elapsed_time = 0
         
-        self.audio_capturer.start_capture(
-            use_system=config.use_system_audio,
-            use_mic=config.use_mic_audio,
-            mic_device_id=config.mic_device_id
-        )
+        self.audio_capturer.gains = {'system': config.system_audio_gain, 'mic': config.mic_audio_gain}
+        self.audio_capturer.use_limiter = config.audio_limiter_enabled
+        self.audio_capturer.scheduler = self.scheduler
+        self.audio_capturer.backend = config.audio_backend
+        self.audio_capturer.replay_paths = {'system': config.audio_replay_path, 'mic': config.audio_mic_replay_path}
+        self.audio_capturer.click_options = {
+            'period': config.calibration_period_sec,
+            'delay_ms': config.calibration_audio_delay_ms,
+            'drift_ppm': config.calibration_audio_drift_ppm,
+        }
+        if self._with_audio():
+            self.audio_capturer.start_capture(
+                use_system=config.use_system_audio,
+                use_mic=config.use_mic_audio,
+                mic_device_id=config.mic_device_id,
+                samplerate=config.audio_samplerate,
+                channels=config.audio_channels,
+                separate_tracks=config.audio_separate_tracks
+            )
 
+        self.finalizing = True
         self.recording_thread = threading.Thread(target=self._recording_loop, args=(final_region, monitor_index))
         self.recording_thread.start()
         
         self.status_changed.emit("録画中")
+        return True
+
+    def _stream_only(self):
+        return self.stream is not None and not self.stream['record']
+
+    def _with_audio(self):
+        """タイムラプス・連写・配信のみ (ファイル出力なし) は音声を録音しない"""
+        return not (self.timelapse or self.burst or self._stream_only())
 
     def _prepare_audio_file(self):
-        try:
-            self.wave_file = wave.open(self.temp_audio_path, 'wb')
-            self.wave_file.setnchannels(2) # AudioCapturer固定値
-            self.wave_file.setsampwidth(2) # 16bit = 2bytes
-            self.wave_file.setframerate(44100) # AudioCapturer固定値
-        except Exception as e:
-            print(f"Error creating wave file: {e}")
+        # 別トラック時はソースごと、通常はミックス済みの1ファイル
+        if not self._with_audio():
+            tracks = []
+        elif config.audio_separate_tracks:
+            tracks = [name for name, enabled in (('system', config.use_system_audio), ('mic', config.use_mic_audio)) if enabled]
+        else:
+            tracks = ['mix']
+        self.wave_files = {}
+        self.audio_start_ts = {}
+        self.video_start_ts = None
+        self.audio_paths = {
+            track: self.temp_audio_path if track == 'mix' else self.temp_audio_path.replace(".wav", f"_{track}.wav")
+            for track in tracks
+        }
+        for track, path in self.audio_paths.items():
+            try:
+                # 4GB 超は RF64、ヘッダは定期的に更新 (途中で落ちても読める)
+                self.wave_files[track] = AudioSpoolWriter(
+                    path, config.audio_samplerate, config.audio_channels,
+                    sample_format=config.audio_spool_format,
+                    header_interval_sec=config.audio_header_interval_sec
+                )
+            except Exception as e:
+                log.error(f"Error creating wave file: {e}")
 
     def _recording_loop(self, region, monitor_index):
-        capture_gen = self.screen_capturer.start_capture(region=region, monitor_index=monitor_index, show_cursor=config.show_cursor, target_fps=config.fps)
+        if not config.capture_out_of_process:
+            # このスレッドで画面を取得する
+            self.scheduler.apply_capture_thread()
+        capture_gen = self.screen_capturer.start_capture(region=region, monitor_index=monitor_index, show_cursor=config.show_cursor, target_fps=self.capture_fps, zoom=self.zoom)
         
         try:
             for frame, timestamp in capture_gen:
                 if not self.is_recording:
+                    self._release_frame(frame)
                     break
                 
                 # 一時停止中は書き込みスキップ
                 if self.is_paused:
+                    self._release_frame(frame)
                     continue
                 
-                # 映像書き込み
-                self.video_encoder.write_frame(frame)
+                # 子画面の合成 (ROI のみ上書き)
+                if self.pip_source:
+                    self.pip_source.blit(frame)
+                
+                # アイドル区間はフレームも音声も出力しない
+                keep = True
+                if self.idle_detector:
+                    keep = self.idle_detector.update(frame, timestamp, self.audio_capturer.last_sound_time)
+                
+                # 映像書き込み (送り出しスレッド経由)
+                if keep:
+                    self.frame_feeder.submit(frame, timestamp)
+                    self.frames_submitted += 1
+                    if self.video_start_ts is None:
+                        self.video_start_ts = timestamp
+                else:
+                    self._release_frame(frame)
                 
                 # 音声書き込み
-                # キューに溜まっている分をすべて書き出す
+                # キューに溜まっている分をすべて書き出す (カット中は読み捨て)
                 while True:
-                    audio_data = self.audio_capturer.get_audio_data()
-                    if audio_data is None:
+                    item = self.audio_capturer.get_audio_data()
+                    if item is None:
                         break
-                    if self.wave_file:
-                        # float32 (-1.0 to 1.0) -> int16
-                        audio_int16 = (audio_data * 32767).astype(np.int16)
-                        self.wave_file.writeframes(audio_int16.tobytes())
+                    track, audio_data, audio_ts = item
+                    wave_file = self.wave_files.get(track)
+                    if wave_file and keep:
+                        self.audio_start_ts.setdefault(track, audio_ts)
+                        wave_file.write(audio_data)
                 
                 # 時間更新
                 self._update_time_label()
@@ -143,8 +405,24 @@ class Recorder(QObject):
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
+            # 借用したフレームを書き切ってから共有メモリを閉じる
+            frame = None
             self._cleanup_capture()
-            self._finalize_output()
+            capture_gen.close()
+            try:
+                self._finalize_output(RecordingSession(self))
+            finally:
+                self.finalizing = False
+
+    def _notify(self, signal, message):
+        """仕上げの結果を通知 (受け取った側がすぐに次の録画を開始できるよう、先に finalizing を解除する)"""
+        self.finalizing = False
+        signal.emit(message)
+
+    def _release_frame(self, frame):
+        """送り出しスレッドに渡さなかったフレームをキャプチャ側へ返却 (共有メモリから借用している場合のみ)"""
+        if self.frame_release:
+            self.frame_release(frame)
 
     def _update_time_label(self):
         now = time.time()
@@ -154,6 +432,82 @@ class Recorder(QObject):
         minutes = (total_sec % 3600) // 60
         seconds = total_sec % 60
         self.time_updated.emit(f"{hours:02}:{minutes:02}:{seconds:02}")
+        
+        # 音声レベルは一定間隔で通知 (GUIの負荷を抑える)
+        if config.meter_update_hz and now - self.last_levels_time >= 1.0 / config.meter_update_hz:
+            self.last_levels_time = now
+            levels = self.audio_capturer.get_levels()
+            if levels:
+                self.levels_updated.emit(levels)
+        
+        # 統計情報は1秒ごとに通知
+        if now - self.last_stats_time >= 1.0:
+            self.last_stats_time = now
+            self._update_stats()
+    
+    def _update_stats(self):
+        if hasattr(self.screen_capturer, 'get_stats'):
+            self.stats.update(self.screen_capturer.get_stats())
+        if self.frame_feeder:
+            self.stats.update(self.frame_feeder.get_stats())
+        if self.idle_detector:
+            self.stats.update(self.idle_detector.get_stats(time.time()))
+        if self.video_encoder:
+            self.stats.update(self.video_encoder.get_stats())
+            self._check_encoder_failed()
+            progress = self.video_encoder.get_progress()
+            self.stats.update(progress)
+            if progress and "frames_written" in self.stats:
+                # パイプ内で未エンコードのフレーム数
+                self.stats["pipe_backlog_frames"] = max(0, self.stats["frames_written"] - progress["encoded_frames"])
+            self._check_encoder_backlog()
+        if self.scheduler:
+            self.stats["cpu_policy"] = self.scheduler.report()
+        self.stats_updated.emit(dict(self.stats))
+
+    def _check_encoder_failed(self):
+        """再起動の上限に達してエンコーダが止まったら通知 (録画は続くが、以降のフレームは破棄される)"""
+        if self.encoder_failed or not self.stats.get("encoder_failed"):
+            return
+        self.encoder_failed = True
+        log.error("Encoder gave up, frames are being discarded", extra={"fields": {
+            "encoder_restarts": self.stats.get("encoder_restarts", 0),
+            "discarded_frames": self.stats.get("encoder_discarded_frames", 0),
+        }})
+        self.status_changed.emit("録画中 (エンコーダ停止: 以降の映像は保存されません)")
+
+    @staticmethod
+    def _encoder_failure_message(stats):
+        """エンコーダが止まって出力が途中で切れている場合のメッセージ (問題なければ None)"""
+        if not stats.get("encoder_failed"):
+            return None
+        return (f"エンコーダが停止したため、途中から先の映像が失われています "
+                f"(再起動 {stats.get('encoder_restarts', 0)}回、"
+                f"破棄 {stats.get('encoder_discarded_frames', 0)}フレーム)")
+
+    def _check_encoder_backlog(self):
+        """
+        エンコード待ちのフレーム (パイプ内・キュー・退避ファイル) が増え続けたら、詰まる前に警告
+        ffmpeg の speed は開始からの累積値で、一時停止やカットの後は 1.0 を下回ったままになるため使わない
+        タイムラプスは取得間隔が長く、エンコーダ内部に残るフレームだけで遅延と判定してしまうため対象外
+        """
+        if not self.is_recording or self.is_paused or self.timelapse or self.encoder_failed:
+            return
+        backlog = sum(self.stats.get(key, 0) for key in ("pipe_backlog_frames", "queue_frames", "spool_frames"))
+        self.stats["encoder_backlog_frames"] = backlog
+        threshold = config.fps * 0.5 # エンコーダ内部の遅延分は許容する
+        if backlog >= threshold and backlog > self.last_backlog_frames:
+            self.backlog_growth_count += 1
+        elif backlog < threshold or backlog < self.last_backlog_frames:
+            self.backlog_growth_count = 0
+        self.last_backlog_frames = backlog
+        lagging = self.backlog_growth_count >= 3
+        if lagging != self.encoder_lagging:
+            self.encoder_lagging = lagging
+            if lagging:
+                self.status_changed.emit(f"録画中 (エンコード遅延 {backlog / config.fps:.1f}秒)")
+            else:
+                self.status_changed.emit("録画中")
 
     def pause_recording(self):
         if self.is_recording and not self.is_paused:
@@ -161,6 +515,8 @@ class Recorder(QObject):
             self.screen_capturer.pause()
             self.audio_capturer.pause()
             self.pause_start_time = time.time()
+            if self.idle_detector:
+                self.idle_detector.reset(self.pause_start_time)
             self.status_changed.emit("一時停止中")
 
     def resume_recording(self):
@@ -168,6 +524,7 @@ class Recorder(QObject):
             self.is_paused = False
             pause_duration = time.time() - self.pause_start_time
             self.start_time += pause_duration
+            self.resume_points.append(self.frames_submitted / config.fps)
             
             self.screen_capturer.resume()
             self.audio_capturer.resume()
@@ -176,40 +533,144 @@ class Recorder(QObject):
     def stop_recording(self):
         if self.is_recording:
             self.is_recording = False
-            # スレッド終了を待つ
+            # 取得間隔の待機 (タイムラプスでは数秒以上) を中断して、取得ループをすぐに終わらせる
+            # 別プロセスの場合は停止イベントが子プロセス側の待機も中断する
+            self.screen_capturer.stop()
             # _cleanup_capture と _finalize_output はスレッド内で呼ばれる
 
     def _cleanup_capture(self):
         self.screen_capturer.stop()
         self.audio_capturer.stop()
+        if self.frame_feeder:
+            # キュー・退避ファイルに残ったフレームを書き切る
+            self.frame_feeder.stop()
+            self._update_stats()
+            self.frame_feeder = None
         if self.video_encoder:
+            # 再起動していればセグメントを結合 (欠落フレーム数もここで確定する)
             self.video_encoder.stop()
-        if self.wave_file:
-            self.wave_file.close()
+            self.stats.update(self.video_encoder.get_stats())
+        for wave_file in self.wave_files.values():
+            wave_file.close()
+        self.wave_files = {}
+        if self.pip_source:
+            self.pip_source.close()
+            self.pip_source = None
+
+    def _build_recording_info(self, session):
+        """ライブラリ登録用のメタデータ (finished 発行前に確定させる)"""
+        audio_sources = []
+        with_audio = session.with_audio()
+        if config.use_system_audio and with_audio:
+            audio_sources.append("system")
+        if config.use_mic_audio and with_audio:
+            audio_sources.append("mic")
+        frames = session.stats.get("frames_written", 0)
+        self.recording_info = {
+            "created_at": session.created_at,
+            "duration": frames / config.fps if config.fps else None,
+            "width": session.resolution[0],
+            "height": session.resolution[1],
+            "fps": config.fps,
+            "audio_sources": audio_sources,
+            "audio_tracks": list(session.audio_paths),
+            # 配信と同時に録画した場合、ファイルも配信用の設定 (GOP・上限ビットレート) でエンコードされている
+            "keyframe_interval_sec": session.stream['keyint_sec'] if session.stream else config.keyframe_interval_sec,
+            "rate_control": f"maxrate {session.stream['bitrate_kbps']}k" if session.stream else "crf",
+            "resume_points": list(session.resume_points),
+            "capture_mode": "lossless" if session.lossless else "standard",
+            "timelapse_interval_sec": config.timelapse_interval_sec if session.timelapse else None,
+            "burst_fps": config.burst_fps if session.burst else None,
+            "zoom_factor": session.zoom['factor'] if session.zoom else None,
+            "stream_url": session.stream['url'] if session.stream else None,
+            "stats": dict(session.stats),
+        }
 
-    def _finalize_output(self):
+    def _build_mux_stream(self, session, video_options=None):
+        """
+        映像と音声トラックを結合する ffmpeg ストリームを構築
+        各トラックは最初のブロックの時刻と映像の先頭フレームの差だけずらして揃える
+        video_options: 映像の出力設定 (None はストリームコピー)
+        """
+        video_options = video_options or {'vcodec': 'copy'}
+        input_video = ffmpeg.input(session.temp_video_path)
+        audio_streams = []
+        titles = []
+        for track, path in session.audio_paths.items():
+            if not os.path.exists(path) or os.path.getsize(path) <= 100:
+                continue
+            offset = 0.0
+            if session.video_start_ts is not None and track in session.audio_start_ts:
+                offset = round(session.audio_start_ts[track] - session.video_start_ts, 3)
+            kwargs = {'itsoffset': offset} if offset else {}
+            audio_streams.append(ffmpeg.input(path, **kwargs).audio)
+            titles.append({'mix': 'Mix', 'system': 'System', 'mic': 'Microphone'}[track])
+
+        if not audio_streams:
+            # 音声がない場合
+            return ffmpeg.output(input_video, session.final_output_path, **video_options)
+
+        if config.audio_separate_tracks and config.audio_premix_track and len(audio_streams) > 1:
+            # 1トラックしか再生しないプレイヤー向けに、ミックス済みトラックを先頭に置く
+            premix = (
+                ffmpeg.filter(audio_streams, 'amix', inputs=len(audio_streams), duration='longest')
+                .filter('volume', len(audio_streams)) # amix の自動減衰を戻す
+                .filter('alimiter', limit=0.98)
+            )
+            audio_streams = [premix] + audio_streams
+            titles = ['Mix'] + titles
+
+        metadata = {f"metadata:s:a:{i}": f"title={title}" for i, title in enumerate(titles)}
+        return ffmpeg.output(input_video.video, *audio_streams, session.final_output_path,
+                             acodec='aac', **video_options, **metadata)
+
+    def _delivery_options(self):
+        """低負荷録画の仕上げエンコード設定 (キーフレーム間隔は通常録画と同じ)"""
+        options = VideoEncoder.codec_options(config.fps, config.keyframe_interval_sec)
+        options.update({'preset': config.delivery_preset, 'crf': config.delivery_crf, 'movflags': '+faststart'})
+        return options
+
+    def _finalize_output(self, session):
+        if session.burst:
+            self._finalize_burst(session)
+            return
+        if session.stream_only():
+            # 配信のみ: 残すファイルは無い
+            self._build_recording_info(session)
+            shutil.rmtree(session.workspace, ignore_errors=True)
+            failure = self._encoder_failure_message(session.stats)
+            if failure:
+                self._notify(self.error_occurred, f"Finalize Error: {failure}\n{session.stream['url']}")
+            else:
+                self._notify(self.finished, session.stream['url'])
+            return
         self.status_changed.emit("エンコード中...")
+        self._build_recording_info(session)
+        verified = False
         
         # 映像と音声を結合
         try:
-            if not os.path.exists(self.temp_video_path):
+            if not os.path.exists(session.temp_video_path):
                 raise Exception("Video file not generated")
-                
-            input_video = ffmpeg.input(self.temp_video_path)
             
-            if os.path.exists(self.temp_audio_path) and os.path.getsize(self.temp_audio_path) > 100:
-                input_audio = ffmpeg.input(self.temp_audio_path)
-                stream = ffmpeg.output(input_video, input_audio, self.final_output_path, vcodec='copy', acodec='aac')
+            if session.lossless:
+                # 中間ファイルから仕上げエンコード (アイドル優先度)
+                self.status_changed.emit("仕上げエンコード中...")
+                run_transcode(self._build_mux_stream(session, self._delivery_options()), nice=config.transcode_nice)
+                verify_output(session.final_output_path, session.temp_video_path)
+                verified = True
             else:
-                # 音声がない場合
-                stream = ffmpeg.output(input_video, self.final_output_path, vcodec='copy')
-            
-            stream.run(overwrite_output=True, quiet=True)
+                stream = self._build_mux_stream(session)
+                stream.run(overwrite_output=True, quiet=True)
             
+            failure = self._encoder_failure_message(session.stats)
+            if failure:
+                # 途中までの出力は残し、成功扱いにはしない (ライブラリにも登録しない)
+                self._notify(self.error_occurred, f"Finalize Error: {failure}\n{session.final_output_path}")
             # GIF変換が必要な場合
-            if hasattr(self, 'output_format') and self.output_format == 'gif':
+            elif session.output_format == 'gif':
                 self.status_changed.emit("GIF変換中...")
-                mp4_path = self.final_output_path
+                mp4_path = session.final_output_path
                 gif_path = mp4_path.replace(".mp4", ".gif")
                 
                 try:
@@ -227,25 +688,49 @@ class Recorder(QObject):
                     # 生成成功したらMP4は削除？ 今回は両方残すか、GIFのみにするか。通常は置換
                     if os.path.exists(gif_path):
                         os.remove(mp4_path)
-                        self.finished.emit(gif_path)
+                        self._notify(self.finished, gif_path)
                     else:
-                        self.finished.emit(mp4_path)
+                        self._notify(self.finished, mp4_path)
                         
                 except Exception as e:
-                    print(f"GIF Conversion failed: {e}")
-                    self.finished.emit(mp4_path) # 失敗したらMP4を返す
+                    log.error(f"GIF Conversion failed: {e}")
+                    self._notify(self.finished, mp4_path) # 失敗したらMP4を返す
             else:
-                self.finished.emit(self.final_output_path)
+                self._notify(self.finished, session.final_output_path)
             
         except Exception as e:
-            self.error_occurred.emit(f"Finalize Error: {e}")
+            message = str(e)
+            if session.lossless and os.path.exists(session.temp_video_path):
+                # 出力を確認できなかった場合は中間ファイル (と音声) を作業フォルダに残す
+                log.error(f"Transcode failed, keeping workspace: {session.workspace}")
+                message += f"\n中間ファイル: {session.workspace}"
+            self._notify(self.error_occurred, f"Finalize Error: {message}")
         finally:
-            # 一時ファイル削除
-            try:
-                if os.path.exists(self.temp_video_path):
-                    os.remove(self.temp_video_path)
-                if os.path.exists(self.temp_audio_path):
-                    os.remove(self.temp_audio_path)
-            except Exception:
-                pass
+            # 一時ファイル削除 (低負荷録画の中間ファイルは出力の検証後のみ)
+            if verified or not session.lossless:
+                try:
+                    if os.path.exists(session.temp_video_path):
+                        os.remove(session.temp_video_path)
+                    for path in session.audio_paths.values():
+                        if os.path.exists(path):
+                            os.remove(path)
+                    shutil.rmtree(session.workspace, ignore_errors=True)
+                except Exception:
+                    pass
 
+    def _finalize_burst(self, session):
+        """連写: 静止画はプール側で書き出し済み (stop で待機済み)。作業フォルダを消して通知するだけ"""
+        self._build_recording_info(session)
+        written = session.stats.get("frames_written", 0)
+        log.info("Burst finished", extra={"fields": {
+            "path": session.final_output_path,
+            "stills_written": written,
+            "stills_per_sec": session.stats.get("stills_per_sec"),
+            "frames_dropped": session.stats.get("frames_dropped", 0),
+            "peak_backlog": session.stats.get("burst_peak_backlog", 0),
+        }})
+        shutil.rmtree(session.workspace, ignore_errors=True)
+        if written:
+            self._notify(self.finished, session.final_output_path)
+        else:
+            self._notify(self.error_occurred, f"Finalize Error: No stills written ({session.final_output_path})")
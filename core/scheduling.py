@@ -0,0 +1,201 @@
+import os
+import sys
+import threading
+
+from utils.logger import get_logger
+
+log = get_logger("scheduling")
+
+# 組み込みのスケジューリングポリシー
+#   balanced:      OS 任せ (従来どおり)
+#   capture-first: キャプチャ・音声用にコアを確保し、エンコーダはそれ以外のコアで優先度を下げて動かす
+#   low-impact:    エンコーダをコアの半分・アイドル優先度に制限 (録画対象のアプリにCPUを譲る)
+POLICIES = ('balanced', 'capture-first', 'low-impact')
+
+# Windows の優先度クラス
+_IDLE_PRIORITY_CLASS = 0x00000040
+_BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+_NORMAL_PRIORITY_CLASS = 0x00000020
+_ABOVE_NORMAL_PRIORITY_CLASS = 0x00008000
+_PROCESS_SET_INFORMATION = 0x0200
+_PROCESS_QUERY_INFORMATION = 0x0400
+_THREAD_PRIORITY = {'normal': 0, 'high': 2} # THREAD_PRIORITY_NORMAL / HIGHEST
+
+def plan_policy(name, cpu_count=None):
+    """
+    ポリシー名から具体的な設定を決定
+    encoder_threads: 0 はエンコーダの自動設定
+    encoder_cpus / capture_cpus: None は制限なし
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    all_cpus = list(range(cpu_count))
+    plan = {
+        'policy': name,
+        'encoder_threads': 0,
+        'encoder_nice': 0,
+        'encoder_cpus': None,
+        'capture_cpus': None,
+        'capture_priority': 'normal',
+    }
+    if name == 'capture-first' and cpu_count >= 4:
+        # 末尾のコア (8コア以上なら2つ) をキャプチャ・音声・UI用に空けておく
+        reserved = 2 if cpu_count >= 8 else 1
+        plan.update({
+            'encoder_cpus': all_cpus[:-reserved],
+            'encoder_threads': cpu_count - reserved,
+            'encoder_nice': 5,
+            'capture_cpus': all_cpus[-reserved:],
+            'capture_priority': 'high',
+        })
+    elif name == 'capture-first':
+        plan.update({'encoder_nice': 5, 'capture_priority': 'high'})
+    elif name == 'low-impact':
+        encoder_cpus = all_cpus[:max(1, cpu_count // 2)]
+        plan.update({
+            'encoder_cpus': encoder_cpus,
+            'encoder_threads': len(encoder_cpus),
+            'encoder_nice': 15,
+        })
+    elif name != 'balanced':
+        log.warning(f"Unknown CPU policy '{name}', using balanced")
+        plan['policy'] = 'balanced'
+    return plan
+
+def _windows_priority_class(nice):
+    if nice >= 15:
+        return _IDLE_PRIORITY_CLASS
+    if nice > 0:
+        return _BELOW_NORMAL_PRIORITY_CLASS
+    if nice < 0:
+        return _ABOVE_NORMAL_PRIORITY_CLASS
+    return _NORMAL_PRIORITY_CLASS
+
+def _cpu_mask(cpus):
+    mask = 0
+    for cpu in cpus:
+        mask |= 1 << cpu
+    return mask
+
+def set_process_priority(pid, nice):
+    """プロセスの優先度を設定 (nice 値、Windows では相当する優先度クラス)"""
+    if sys.platform.startswith('win'):
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(_PROCESS_SET_INFORMATION, False, pid)
+        if not handle:
+            raise OSError(f"OpenProcess failed for pid {pid}")
+        try:
+            if not kernel32.SetPriorityClass(handle, _windows_priority_class(nice)):
+                raise OSError("SetPriorityClass failed")
+        finally:
+            kernel32.CloseHandle(handle)
+        return
+    os.setpriority(os.PRIO_PROCESS, pid, nice)
+
+def set_process_affinity(pid, cpus):
+    """プロセスの全スレッドを指定コアに固定"""
+    if sys.platform.startswith('win'):
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(_PROCESS_SET_INFORMATION | _PROCESS_QUERY_INFORMATION, False, pid)
+        if not handle:
+            raise OSError(f"OpenProcess failed for pid {pid}")
+        try:
+            if not kernel32.SetProcessAffinityMask(handle, ctypes.c_size_t(_cpu_mask(cpus))):
+                raise OSError("SetProcessAffinityMask failed")
+        finally:
+            kernel32.CloseHandle(handle)
+        return
+    if not hasattr(os, 'sched_setaffinity'):
+        raise NotImplementedError("CPU affinity is not supported on this platform")
+    # Linux ではスレッド単位なので、起動済みのワーカースレッドにもすべて適用する
+    task_dir = f"/proc/{pid}/task"
+    tids = [int(t) for t in os.listdir(task_dir)] if os.path.isdir(task_dir) else [pid]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass
+
+def apply_current_thread(cpus=None, priority='normal'):
+    """呼び出し元スレッドのコア固定と優先度 (権限が無い場合は無視して結果を返す)"""
+    applied = {}
+    if cpus:
+        try:
+            if sys.platform.startswith('win'):
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), ctypes.c_size_t(_cpu_mask(cpus)))
+            elif hasattr(os, 'sched_setaffinity'):
+                # pid 0 は呼び出し元スレッドのみに作用する
+                os.sched_setaffinity(0, cpus)
+            else:
+                raise NotImplementedError("CPU affinity is not supported on this platform")
+            applied['cpus'] = list(cpus)
+        except Exception as e:
+            log.debug(f"Thread affinity not applied: {e}")
+    if priority != 'normal':
+        try:
+            if sys.platform.startswith('win'):
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), _THREAD_PRIORITY.get(priority, 0)):
+                    raise OSError("SetThreadPriority failed")
+            else:
+                # Linux の nice はスレッド単位 (下げるには CAP_SYS_NICE が必要)
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -5)
+            applied['priority'] = priority
+        except Exception as e:
+            log.debug(f"Thread priority not applied: {e}")
+    return applied
+
+
+class CpuScheduler:
+    """
+    録画中の各処理にスケジューリングポリシーを適用
+    権限やプラットフォームの都合で適用できなかった項目はスキップし、適用結果を report() で返す
+    """
+    def __init__(self, policy='balanced', cpu_count=None):
+        self.plan = plan_policy(policy, cpu_count)
+        self.applied = {'policy': self.plan['policy']}
+        self.lock = threading.Lock()
+
+    @property
+    def encoder_threads(self):
+        return self.plan['encoder_threads']
+
+    def thread_policy(self):
+        """別プロセスに渡すためのキャプチャスレッド設定 (pickle 可能)"""
+        return {'cpus': self.plan['capture_cpus'], 'priority': self.plan['capture_priority']}
+
+    def apply_encoder(self, pid):
+        """エンコーダ (ffmpeg) プロセスの優先度とコア固定"""
+        if self.plan['encoder_nice']:
+            try:
+                set_process_priority(pid, self.plan['encoder_nice'])
+                self._record('encoder_nice', self.plan['encoder_nice'])
+            except Exception as e:
+                log.warning(f"Failed to set encoder priority: {e}")
+        if self.plan['encoder_cpus']:
+            try:
+                set_process_affinity(pid, self.plan['encoder_cpus'])
+                self._record('encoder_cpus', self.plan['encoder_cpus'])
+            except Exception as e:
+                log.warning(f"Failed to set encoder affinity: {e}")
+        if self.plan['encoder_threads']:
+            self._record('encoder_threads', self.plan['encoder_threads'])
+
+    def apply_capture_thread(self, name='capture'):
+        """呼び出し元スレッド (画面取得・音声取得) に設定を適用"""
+        applied = apply_current_thread(self.plan['capture_cpus'], self.plan['capture_priority'])
+        if applied:
+            self._record(f'{name}_thread', applied)
+        return applied
+
+    def _record(self, key, value):
+        with self.lock:
+            self.applied[key] = value
+
+    def report(self):
+        with self.lock:
+            return dict(self.applied)
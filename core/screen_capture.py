@@ -1,64 +1,93 @@
 import time
 import os
-import mss
-import numpy as np
-from PIL import Image, ImageDraw
+import threading
+from core.capture_backends import backend_settings, get_backend_class, open_backend
+from core.zoom import ZoomViewport, open_cursor_tracker
 from utils.config import config
+from utils.logger import get_logger, save_debug_frame
+
+log = get_logger("capture")
 
 class ScreenCapturer:
-    def __init__(self):
-        # メインスレッドでモニタ情報を取得
-        with mss.mss() as sct:
-            self.monitor = sct.monitors[1] # デフォルトはプライマリモニタ
+    def __init__(self, backend=None, backend_options=None):
+        """
+        backend: 取得方式 (core.capture_backends.BACKENDS のキー、None なら設定値)
+        backend_options: バックエンドへの追加設定 (別プロセスでは設定を共有できないため明示的に渡す)
+        """
+        name, options = backend_settings()
+        self.backend_name = backend or name
+        self.backend_options = backend_options if backend_options is not None else options
+        self.backend = None
+        self.backend_stats = {}
+        self.viewport = None
             
         self.running = False
         self.paused = False
-        self.first_frame_debug = True
+        self.wake = threading.Event() # 長い取得間隔 (タイムラプス) の待機中でも停止できるように
+        self.first_frame_debug = config.debug_save_first_frame
         
+    @staticmethod
+    def list_monitors():
+        """現在のバックエンドでのモニタ一覧 (mss.monitors と同じ形式)"""
+        name, options = backend_settings()
+        return get_backend_class(name).monitors(**options)
+
     @staticmethod
     def get_monitors():
         """利用可能なモニタのリストを返す"""
-        with mss.mss() as sct:
-            # monitors[0] は全画面結合、1以降が各モニタ
-            # インデックスと情報を返す
-            return [(i, m) for i, m in enumerate(sct.monitors) if i > 0]
+        # monitors[0] は全画面結合、1以降が各モニタ
+        # インデックスと情報を返す
+        return [(i, m) for i, m in enumerate(ScreenCapturer.list_monitors()) if i > 0]
+        
+    @staticmethod
+    def resolve_monitor(monitors, region=None, monitor_index=1):
+        """
+        region / monitor_index から grab 用矩形 (dict) を決定する
+        monitors: list_monitors() の結果
+        region: (left, top, width, height) のタプル
+        """
+        if region:
+            return {
+                "top": int(region[1]), 
+                "left": int(region[0]), 
+                "width": int(region[2]), 
+                "height": int(region[3])
+            }
+        # 指定されたモニタを使用
+        if monitor_index < len(monitors):
+            return monitors[monitor_index]
+        return monitors[1] # フォールバック
         
-    def start_capture(self, region=None, monitor_index=1, show_cursor=True, target_fps=30):
+    def start_capture(self, region=None, monitor_index=1, show_cursor=True, target_fps=30, zoom=None):
         """
         キャプチャを開始するジェネレータ
         region: (top, left, width, height) のタプル。指定された場合はmonitor_indexより優先
         monitor_index: 全画面録画時の対象モニタインデックス (MSS準拠、1始まり)
+        zoom: カーソル追従ズームの設定 dict (factor, smoothing_sec, deadzone)
+              指定時は録画範囲のうちカーソル周辺の ROI だけを取得する (フレームは ROI のサイズ)
         """
         self.running = True
         self.paused = False
+        self.wake.clear()
         
         frame_interval = 1.0 / target_fps
-        last_frame_time = time.time()
         
-        # スレッド内で新しいインスタンスを作成（必須）
-        with mss.mss() as sct:
-            # DEBUG: モニタ情報を出力
-            for i, m in enumerate(sct.monitors):
-                print(f"[DEBUG] MSS Monitor {i}: {m}")
-
-            # 録画範囲の設定
-            if region:
-                monitor = {
-                    "top": int(region[1]), 
-                    "left": int(region[0]), 
-                    "width": int(region[2]), 
-                    "height": int(region[3])
-                }
-                print(f"[DEBUG] Capture Config: Region={monitor}")
-                print(f"[DEBUG] Capture Config: Region={monitor}")
-            else:
-                # 指定されたモニタを使用
-                if monitor_index < len(sct.monitors):
-                    monitor = sct.monitors[monitor_index]
-                else:
-                    monitor = sct.monitors[1] # フォールバック
-                print(f"[DEBUG] Capture Config: Full Screen (Monitor {monitor_index})={monitor}")
-            
+        # 録画範囲の設定 (バックエンドはこのスレッド内で生成する)
+        monitors = get_backend_class(self.backend_name).monitors(**self.backend_options)
+        monitor = self.resolve_monitor(monitors, region, monitor_index)
+        viewport = cursor = self.viewport = None
+        rect = monitor
+        if zoom and zoom.get('factor', 1.0) > 1.0:
+            viewport = self.viewport = ZoomViewport(monitor, zoom['factor'], zoom.get('smoothing_sec', 0.3),
+                                                    zoom.get('deadzone', 0.25))
+            cursor = open_cursor_tracker(self.backend_name, monitor, target_fps)
+            rect = viewport.rect()
+        backend = self.backend = open_backend(self.backend_name, rect, self.backend_options)
+        log.info("Capture started", extra={"fields": {
+            "backend": backend.name, "region": monitor, "monitor_index": None if region else monitor_index,
+            "monitors": monitors[1:], "fps": target_fps, "zoom": zoom}})
+        
+        try:
             while self.running:
                 if self.paused:
                     time.sleep(0.1)
@@ -68,33 +97,47 @@ class ScreenCapturer:
                 
                 # スクリーンショット取得
                 try:
-                    sct_img = sct.grab(monitor)
-                    frame = np.array(sct_img)
+                    if viewport:
+                        # カーソルに追従して ROI を移動してから取得
+                        backend.move(*viewport.update(cursor.position() if cursor else None, start_time))
+                    frame = backend.grab()
                     
-                    # DEBUG: 最初のフレームを保存して確認
+                    # DEBUG: 最初のフレームを保存して確認 (設定で有効時のみ、保存は別スレッド)
                     if self.first_frame_debug:
                         self.first_frame_debug = False
-                        try:
-                            from PIL import Image
-                            debug_img = Image.frombytes('RGB', sct_img.size, sct_img.bgra, 'raw', 'BGRX')
-                            debug_img.save(os.path.join(config.output_dir, "debug_frame.png"))
-                            print(f"[DEBUG] Saved debug_frame.png. Region: {monitor}")
-                        except Exception as e:
-                            print(f"[DEBUG] Failed to save debug frame: {e}")
+                        save_debug_frame(frame, os.path.join(config.output_dir, "debug_frame.png"))
 
                     yield frame, start_time
                 except Exception as e:
-                    print(f"Capture error: {e}")
+                    log.exception(f"Capture error: {e}")
                     break
                 
                 # FPS制御
                 processing_time = time.time() - start_time
                 sleep_time = max(0, frame_interval - processing_time)
                 if sleep_time > 0:
-                    time.sleep(sleep_time)
+                    self.wake.wait(sleep_time)
+        finally:
+            self.backend_stats = self._collect_stats(backend)
+            self.backend = None
+            backend.close()
+            if cursor:
+                cursor.close()
+
+    def _collect_stats(self, backend):
+        stats = backend.get_stats()
+        if self.viewport:
+            stats.update(self.viewport.get_stats())
+        return stats
+
+    def get_stats(self):
+        """取得回数など (バックエンドごと)"""
+        backend = self.backend
+        return self._collect_stats(backend) if backend else dict(self.backend_stats)
 
     def stop(self):
         self.running = False
+        self.wake.set()
 
     def pause(self):
         self.paused = True
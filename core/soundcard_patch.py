@@ -4,13 +4,16 @@ import numpy
 import time
 import warnings
 import soundcard.mediafoundation as mf
+from utils.logger import get_logger
+
+log = get_logger("soundcard_patch")
 
 def patch_soundcard():
     """
     Patches soundcard.mediafoundation._Recorder._record_chunk to use numpy.frombuffer
     instead of the deprecated numpy.fromstring.
     """
-    print("[INFO] Applying runtime patch for soundcard (numpy.fromstring fix)...")
+    log.info("Applying runtime patch for soundcard (numpy.fromstring fix)...")
     
     # Access private modules from soundcard.mediafoundation
     _ffi = mf._ffi
@@ -63,4 +66,31 @@ def patch_soundcard():
 
     # Apply the patch
     mf._Recorder._record_chunk = _record_chunk
-    print("[INFO] soundcard patch applied successfully.")
+    log.info("soundcard patch applied successfully.")
+
+
+def read_device_samplerate(device):
+    """
+    WASAPI デバイスのネイティブなサンプリングレート (PKEY_AudioEngine_DeviceFormat) を取得する
+    soundcard は channels しか公開していないため、同じプロパティから nSamplesPerSec を読む
+    """
+    _ffi = mf._ffi
+    _com = mf._com
+
+    ppPropertyStore = _ffi.new('IPropertyStore **')
+    ptr = device._device_ptr()
+    hr = ptr[0][0].lpVtbl.OpenPropertyStore(ptr[0], 0, ppPropertyStore)
+    _com.release(ptr)
+    _com.check_error(hr)
+    propvariant = mf._PropVariant()
+    PKEY_AudioEngine_DeviceFormat = _ffi.new("PROPERTYKEY *",
+                                             [[0xf19f064d, 0x82c, 0x4e27, [0xbc, 0x73, 0x68, 0x82, 0xa1, 0xbb, 0x8e, 0x4c]],
+                                              0])
+    hr = ppPropertyStore[0][0].lpVtbl.GetValue(ppPropertyStore[0], PKEY_AudioEngine_DeviceFormat, propvariant.ptr)
+    _com.release(ppPropertyStore)
+    _com.check_error(hr)
+    if propvariant.ptr[0].vt != 65:
+        raise RuntimeError('Property was expected to be a blob, but is not a blob')
+    pPropVariantBlob = _ffi.cast("BLOB_PROPVARIANT *", propvariant.ptr)
+    waveformat = _ffi.cast("WAVEFORMATEX *", pPropVariantBlob[0].blob.pBlobData)
+    return int(waveformat[0].nSamplesPerSec)
@@ -0,0 +1,45 @@
+import ffmpeg
+
+from core.scheduling import set_process_priority
+from utils.logger import get_logger
+
+log = get_logger("transcoder")
+
+def run_transcode(stream, nice=19):
+    """
+    ffmpeg-python のストリームを低優先度で実行して完了を待つ
+    (録画終了後の仕上げエンコードが他のアプリの邪魔をしないように)
+    """
+    process = stream.overwrite_output().run_async(quiet=True)
+    try:
+        set_process_priority(process.pid, nice)
+    except Exception as e:
+        log.warning(f"Failed to lower transcode priority: {e}")
+    # 出力を読み続けないとパイプが詰まるため communicate で待つ
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: "
+                           f"{stderr.decode('utf-8', 'replace')[-500:]}")
+
+def probe_video(path):
+    """(長さ秒, 映像ストリーム) を返す。映像が無ければストリームは None"""
+    info = ffmpeg.probe(path)
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), None)
+    duration = float(info.get("format", {}).get("duration") or 0.0)
+    return duration, video
+
+def verify_output(output_path, source_path, tolerance_sec=0.5):
+    """
+    出力が元の中間ファイルと同じ長さ・解像度の映像を持つか確認
+    問題があれば RuntimeError (中間ファイルを削除してはいけない)
+    """
+    src_duration, src_video = probe_video(source_path)
+    out_duration, out_video = probe_video(output_path)
+    if out_video is None:
+        raise RuntimeError(f"No video stream in {output_path}")
+    if src_video and (out_video.get("width"), out_video.get("height")) != (src_video.get("width"), src_video.get("height")):
+        raise RuntimeError(f"Resolution mismatch: {out_video.get('width')}x{out_video.get('height')}")
+    # コンテナ差による端数を許容 (2% または tolerance_sec の大きい方)
+    if abs(out_duration - src_duration) > max(tolerance_sec, src_duration * 0.02):
+        raise RuntimeError(f"Duration mismatch: {out_duration:.2f}s (expected {src_duration:.2f}s)")
+    return out_duration
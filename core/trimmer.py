@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import shutil
+import subprocess
+import tempfile
+import ffmpeg
+
+from core.video_encoder import VideoEncoder
+
+class VideoTrimmer:
+    """
+    キーフレームを考慮した無劣化トリム・分割
+    キーフレーム間は再エンコードせずにストリームコピーし、
+    切り取り位置が GOP の途中にかかる先頭・末尾の部分だけを再エンコードする
+    """
+    EPSILON = 0.001
+    # x264 の subme は preset ごとに異なるので、元の preset の推定に使う
+    SUBME_PRESETS = {0: 'ultrafast', 1: 'superfast', 2: 'veryfast', 4: 'faster', 6: 'fast',
+                     7: 'medium', 8: 'slow', 9: 'slower', 10: 'veryslow'}
+    # ffprobe のプロファイル名 -> libx264 の profile
+    PROFILES = {'constrained baseline': 'baseline', 'baseline': 'baseline', 'main': 'main', 'high': 'high',
+                'high 10': 'high10', 'high 4:2:2': 'high422', 'high 4:4:4 predictive': 'high444'}
+
+    def __init__(self, input_path):
+        self.input_path = input_path
+        info = ffmpeg.probe(input_path)
+        self.duration = float(info["format"]["duration"])
+        video = next(s for s in info["streams"] if s.get("codec_type") == "video")
+        self.has_audio = any(s.get("codec_type") == "audio" for s in info["streams"])
+        num, _, den = video.get("avg_frame_rate", "30/1").partition("/")
+        self.fps = float(num) / float(den) if den and float(den) else 30.0
+        self.video_stream = video
+        self._keyframes = None
+        self._encode_options = None
+
+    def keyframes(self):
+        """キーフレームの時刻一覧 (キーフレームのみデコードするため高速)"""
+        if self._keyframes is None:
+            result = subprocess.run(
+                ["ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+                 "-show_entries", "frame=pts_time,best_effort_timestamp_time", "-of", "json",
+                 self.input_path],
+                capture_output=True, check=True
+            )
+            frames = json.loads(result.stdout).get("frames", [])
+            times = []
+            for frame in frames:
+                t = frame.get("pts_time", frame.get("best_effort_timestamp_time"))
+                if t not in (None, "N/A"):
+                    times.append(float(t))
+            self._keyframes = sorted(times)
+        return self._keyframes
+
+    def plan(self, start, end):
+        """
+        [start, end) を (開始, 終了, 'copy' or 'encode') の区間リストに分解
+        """
+        start = max(0.0, start)
+        end = min(self.duration, end)
+        if end - start <= self.EPSILON:
+            raise ValueError("トリム範囲が空です")
+        inner = [k for k in self.keyframes() if start - self.EPSILON <= k <= end + self.EPSILON]
+        if not inner:
+            return [(start, end, 'encode')]
+
+        first_key, last_key = inner[0], inner[-1]
+        parts = []
+        if first_key - start > self.EPSILON:
+            parts.append((start, first_key, 'encode'))
+        if last_key - first_key > self.EPSILON:
+            parts.append((first_key, last_key, 'copy'))
+        if end >= self.duration - self.EPSILON and last_key < end:
+            # 末尾まで残す場合は最後の GOP もそのままコピーできる
+            parts.append((last_key, end, 'copy'))
+        elif end - last_key > self.EPSILON:
+            parts.append((last_key, end, 'encode'))
+        return parts
+
+    def trim(self, output_path, start, end):
+        """[start, end) を切り出して output_path に保存"""
+        parts = self.plan(start, end)
+        work_dir = tempfile.mkdtemp(prefix="trim_", dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            segments = []
+            for i, (seg_start, seg_end, mode) in enumerate(parts):
+                seg_path = os.path.join(work_dir, f"part_{i:03}.ts")
+                self._write_segment(seg_path, seg_start, seg_end, mode)
+                segments.append(seg_path)
+
+            # MPEG-TS (Annex B) で連結するため、部分エンコードと元ストリームの SPS/PPS が異なっても問題ない
+            video = ffmpeg.input("concat:" + "|".join(segments)).video
+            if self.has_audio:
+                # AAC は全フレームが独立しているので、音声は範囲全体を一度にコピー
+                audio = ffmpeg.input(self.input_path, ss=start, t=end - start).audio
+                stream = ffmpeg.output(video, audio, output_path, vcodec='copy', acodec='copy',
+                                       movflags='+faststart')
+            else:
+                stream = ffmpeg.output(video, output_path, vcodec='copy', movflags='+faststart')
+            stream.run(overwrite_output=True, quiet=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_path
+
+    def split(self, points, output_pattern=None):
+        """
+        指定時刻で分割。points は秒数のリスト
+        output_pattern は '{index}' を含むパス (省略時は元ファイル名_partN.mp4)
+        """
+        if output_pattern is None:
+            base, ext = os.path.splitext(self.input_path)
+            output_pattern = base + "_part{index}" + ext
+        bounds = [0.0] + sorted(p for p in points if 0 < p < self.duration) + [self.duration]
+        outputs = []
+        for index, (seg_start, seg_end) in enumerate(zip(bounds, bounds[1:]), start=1):
+            outputs.append(self.trim(output_pattern.format(index=index), seg_start, seg_end))
+        return outputs
+
+    @staticmethod
+    def _x264_settings(path):
+        """先頭のアクセスユニットの SEI に x264 が書き込んだエンコード設定 (x264 以外なら空)"""
+        try:
+            data, _ = (
+                ffmpeg.input(path).video
+                .output('pipe:', format='h264', vcodec='copy', frames=1, **{'bsf:v': 'h264_mp4toannexb'})
+                .run(capture_stdout=True, quiet=True)
+            )
+        except ffmpeg.Error:
+            return {}
+        match = re.search(rb'x264 - core \d+.*? options: ([^\x00]*)', data, re.DOTALL)
+        if not match:
+            return {}
+        settings = {}
+        for item in match.group(1).decode('ascii', 'replace').split():
+            key, sep, value = item.partition('=')
+            if sep:
+                settings[key] = value
+        return settings
+
+    def encode_options(self):
+        """
+        部分再エンコードの設定
+        元のストリームとプロファイル・画素形式・preset・レート制御・GOP を揃え、
+        境目で画質が変わらないようにする (MP4 の avcC は先頭の再エンコード部分から作られるため)
+        """
+        if self._encode_options is not None:
+            return dict(self._encode_options)
+        video = self.video_stream
+        settings = self._x264_settings(self.input_path)
+
+        def number(key, default=None):
+            try:
+                return float(settings[key])
+            except (KeyError, ValueError):
+                return default
+
+        keyint_sec = number('keyint', 0) / self.fps
+        if not keyint_sec:
+            # 設定が読めない場合は実際のキーフレーム間隔 (中央値) に合わせる
+            gaps = sorted(b - a for a, b in zip(self.keyframes(), self.keyframes()[1:]))
+            keyint_sec = gaps[len(gaps) // 2] if gaps else None
+        options = VideoEncoder.codec_options(self.fps, keyint_sec)
+        if video.get('pix_fmt'):
+            options['pix_fmt'] = video['pix_fmt']
+        profile = self.PROFILES.get(str(video.get('profile', '')).lower())
+        if profile:
+            options['profile:v'] = profile
+        if video.get('level', -99) > 0:
+            options['level'] = f"{video['level'] / 10:.1f}"
+        if settings:
+            options['preset'] = self.SUBME_PRESETS.get(int(number('subme', 0)), options['preset'])
+            if number('rc_lookahead') == 0 and number('sliced_threads') == 1:
+                options['tune'] = 'zerolatency'
+            options['bf'] = int(number('bframes', 0))
+            rc = settings.get('rc')
+            if rc == 'crf':
+                options['crf'] = number('crf')
+            elif rc == 'cqp':
+                options['qp'] = int(number('qp', 0))
+            elif rc in ('abr', 'cbr') and number('bitrate'):
+                options['b:v'] = f"{int(number('bitrate'))}k"
+            if number('vbv_maxrate'):
+                options['maxrate'] = f"{int(number('vbv_maxrate'))}k"
+                options['bufsize'] = f"{int(number('vbv_bufsize', number('vbv_maxrate')))}k"
+        elif video.get('bit_rate'):
+            # x264 以外: 設定が分からないので平均ビットレートに合わせる
+            options['b:v'] = video['bit_rate']
+        self._encode_options = options
+        return dict(options)
+
+    def _write_segment(self, path, start, end, mode):
+        source = ffmpeg.input(self.input_path, ss=start, t=end - start).video
+        if mode == 'copy':
+            options = {'vcodec': 'copy', 'bsf:v': 'h264_mp4toannexb'}
+        else:
+            options = self.encode_options()
+            options['r'] = self.fps
+        (
+            ffmpeg
+            .output(source, path, format='mpegts', **options)
+            .run(overwrite_output=True, quiet=True)
+        )
+
+
+def trim_recording(input_path, head_sec=0.0, tail_sec=0.0, output_path=None):
+    """
+    先頭 head_sec 秒・末尾 tail_sec 秒を取り除いた録画を作る
+    (カウントダウンや停止ホットキー操作部分の除去用)
+    """
+    trimmer = VideoTrimmer(input_path)
+    if output_path is None:
+        base, ext = os.path.splitext(input_path)
+        output_path = f"{base}_trim{ext}"
+    return trimmer.trim(output_path, head_sec, trimmer.duration - tail_sec)
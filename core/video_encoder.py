@@ -1,15 +1,118 @@
+import os
 import ffmpeg
 import numpy as np
 import threading
-import subprocess
+from urllib.parse import urlsplit
+
+from core.pip import ffmpeg_input_args, overlay_expressions
+from utils.logger import get_logger
+
+log = get_logger("encoder")
 
 class VideoEncoder:
-    def __init__(self, output_path, resolution, fps=30):
+    VCODEC = 'libx264'
+    PRESET = 'ultrafast'
+    PIX_FMT = 'yuv420p'
+    # 低負荷録画用の中間コーデック (RGB のまま可逆圧縮するので色変換のコストもかからない)
+    INTERMEDIATE_CODECS = {
+        'x264-qp0': {'vcodec': 'libx264rgb', 'preset': 'ultrafast', 'qp': 0, 'pix_fmt': 'bgr0'},
+        'ffv1': {'vcodec': 'ffv1', 'level': 3, 'slices': 16, 'slicecrc': 0, 'pix_fmt': 'bgr0'},
+    }
+    # 配信先 URL のスキーム -> コンテナ
+    STREAM_FORMATS = {'rtmp': 'flv', 'rtmps': 'flv', 'srt': 'mpegts', 'udp': 'mpegts'}
+    # ファイル出力のコンテナ (tee で配信と同時に書く場合に明示する)
+    FILE_FORMATS = {'.mp4': 'mp4', '.mov': 'mov', '.mkv': 'matroska'}
+    # コンテナ側のオプション (tee の場合はファイル側の設定として渡す)
+    MUXER_OPTIONS = ('movflags', 'frag_duration')
+
+    def __init__(self, output_path, resolution, fps=30, keyint_sec=2.0, pip=None, threads=0, codec=None,
+                 output_options=None, output_size=None, stream=None):
+        """
+        pip: 子画面の設定 dict (type='file'/'camera', source, position, scale, margin)
+             指定時は ffmpeg の overlay フィルタでメイン映像に合成する
+        threads: エンコーダのスレッド数 (0 は自動)
+        codec: INTERMEDIATE_CODECS のキー (None は通常の H.264)
+        output_options: 追加の出力オプション (movflags など)
+        output_size: 出力解像度 (入力 resolution と異なる場合は ffmpeg で拡大縮小、ズーム録画用)
+        stream: 低遅延配信の設定 dict (url, bitrate_kbps, keyint_sec, preset, record)
+                record=True なら tee で output_path へのファイル出力と同時に配信する (エンコードは1回)
+        """
         self.output_path = output_path
+        self.pip = pip
         self.width, self.height = resolution
         self.fps = fps
+        self.keyint_sec = keyint_sec
+        self.threads = threads
+        self.codec = codec
+        self.output_options = output_options or {}
+        self.output_size = tuple(output_size) if output_size else (self.width, self.height)
+        self.stream = stream
         self.process = None
         
+        # ffmpeg の -progress 出力から得るエンコード状況
+        self.progress = {}
+        self.progress_lock = threading.Lock()
+        self.progress_thread = None
+
+    @classmethod
+    def codec_options(cls, fps, keyint_sec=2.0, codec=None):
+        """
+        映像エンコード設定 (トリム時の部分再エンコードでも同じ設定を使う)
+        キーフレーム間隔を固定 (シーンチェンジ検出による挿入なし) にして、
+        無劣化カット位置を予測可能にする
+        """
+        if codec == 'ffv1':
+            # イントラのみなのでキーフレーム設定は不要
+            return dict(cls.INTERMEDIATE_CODECS[codec])
+        if codec:
+            options = dict(cls.INTERMEDIATE_CODECS[codec])
+        else:
+            options = {'vcodec': cls.VCODEC, 'pix_fmt': cls.PIX_FMT, 'preset': cls.PRESET}
+        if keyint_sec:
+            keyint = max(1, int(round(fps * keyint_sec)))
+            options.update({'g': keyint, 'keyint_min': keyint, 'sc_threshold': 0})
+        return options
+
+    @classmethod
+    def stream_options(cls, fps, bitrate_kbps, keyint_sec=1.0, preset='veryfast'):
+        """
+        低遅延配信用の設定
+        zerolatency (先読み・B フレームなし、スライス並列)、GOP は keyint_sec で固定 (途中から視聴しても待ち時間が一定)、
+        ビットレートは上限付き (VBV は 0.5 秒分)
+        """
+        keyint = max(1, int(round(fps * keyint_sec)))
+        bitrate = int(bitrate_kbps)
+        return {
+            'vcodec': cls.VCODEC, 'pix_fmt': cls.PIX_FMT, 'preset': preset, 'tune': 'zerolatency',
+            'g': keyint, 'keyint_min': keyint, 'sc_threshold': 0, 'bf': 0,
+            'b:v': f'{bitrate}k', 'maxrate': f'{bitrate}k', 'bufsize': f'{max(1, bitrate // 2)}k',
+        }
+
+    def _stream_output(self, video, options):
+        """配信 (とファイル) への出力ノード"""
+        url = self.stream['url']
+        stream_format = self.STREAM_FORMATS.get(urlsplit(url).scheme.lower())
+        if stream_format is None:
+            raise ValueError(f"Unsupported stream URL: {url}")
+        muxer = {key: options.pop(key) for key in self.MUXER_OPTIONS if key in options}
+        # 受信側がすぐに表示できるよう、パケットを溜めずに送る
+        stream_muxer = {'flush_packets': 1}
+        if stream_format == 'mpegts':
+            stream_muxer.update({'muxdelay': 0, 'muxpreload': 0})
+        if not self.stream.get('record', True):
+            return video.output(url, format=stream_format, **options, **stream_muxer)
+
+        def spec(fields):
+            return ':'.join(f"{key}={value}" for key, value in fields.items())
+        file_format = self.FILE_FORMATS.get(os.path.splitext(self.output_path)[1].lower(), 'matroska')
+        # 配信側は別スレッドのキュー経由 (use_fifo) にし、失敗してもファイル出力は続ける (onfail=ignore)
+        targets = [
+            f"[{spec({'f': file_format, **muxer})}]{self.output_path}",
+            f"[{spec({'f': stream_format, 'onfail': 'ignore', 'use_fifo': 1, **stream_muxer})}]{url}",
+        ]
+        # flv / mp4 は SPS/PPS をヘッダに持つ必要がある (mpegts 側はキーフレームごとに自動で挿入される)
+        return video.output('|'.join(targets), format='tee', flags='+global_header', **options)
+        
     def start(self):
         """FFmpegプロセスを開始"""
         # 入力: rawvideo (pipeから)
@@ -24,24 +127,111 @@ class VideoEncoder:
         # リアルタイムで複数のパイプを扱う高度な実装が必要。
         # ここではシンプルに映像のみのエンコードフローを記述し、後で拡張する
         
+        video = input_video.video
+        if self.output_size != (self.width, self.height):
+            video = video.filter('scale', *self.output_size, flags='lanczos')
+        if self.pip:
+            video = self._apply_pip(video)
+        
+        if self.stream:
+            options = self.stream_options(self.fps, self.stream.get('bitrate_kbps', 4000),
+                                          self.stream.get('keyint_sec', 1.0), self.stream.get('preset', 'veryfast'))
+        else:
+            options = self.codec_options(self.fps, self.keyint_sec, self.codec)
+        if self.threads:
+            options['threads'] = self.threads
+        options.update(self.output_options)
+        if self.stream:
+            output = self._stream_output(video, options)
+        else:
+            output = video.output(self.output_path, **options)
         self.process = (
-            input_video
-            .output(self.output_path, vcodec='libx264', pix_fmt='yuv420p', preset='ultrafast')
+            output
+            .global_args('-progress', 'pipe:1', '-nostats')
             .overwrite_output()
-            .run_async(pipe_stdin=True)
+            .run_async(pipe_stdin=True, pipe_stdout=True)
         )
         
+        # 進捗読み取りスレッド (stdout を読み続けないとパイプが詰まるため常に起動)
+        self.progress = {}
+        self.progress_thread = threading.Thread(target=self._read_progress, args=(self.process.stdout,), daemon=True)
+        self.progress_thread.start()
+        
+    def _apply_pip(self, video):
+        """子画面入力を overlay フィルタで合成 (フィルタグラフ内で処理するため Python 側のコピーは不要)"""
+        url, kwargs = ffmpeg_input_args(self.pip['type'], self.pip.get('source'))
+        width = max(2, int(self.output_size[0] * self.pip.get('scale', 0.25)) // 2 * 2)
+        overlay = (
+            ffmpeg.input(url, **kwargs).video
+            .filter('setpts', 'PTS-STARTPTS') # 開始時刻をメイン映像に合わせる
+            .filter('scale', width, -2)
+        )
+        x, y = overlay_expressions(self.pip.get('position', 'bottom-right'), self.pip.get('margin', 16))
+        # shortest=1: メイン映像 (パイプ) の終了で出力も終了させる
+        return ffmpeg.overlay(video, overlay, x=x, y=y, shortest=1, eof_action='repeat')
+
+    def _read_progress(self, stream):
+        """
+        -progress の key=value 出力を解析
+        progress=continue / end の行で1ブロックが完結する
+        """
+        block = {}
+        for raw in iter(stream.readline, b''):
+            key, sep, value = raw.decode('utf-8', 'replace').strip().partition('=')
+            if not sep:
+                continue
+            block[key] = value
+            if key == 'progress':
+                snapshot = self._parse_progress(block)
+                with self.progress_lock:
+                    self.progress = snapshot
+                block = {}
+        stream.close()
+
+    @staticmethod
+    def _parse_progress(block):
+        def to_float(text, suffix=''):
+            try:
+                return float(text.strip().removesuffix(suffix))
+            except (AttributeError, ValueError):
+                return None
+
+        out_time_us = to_float(block.get('out_time_us') or block.get('out_time_ms'))
+        return {
+            'encoded_frames': int(to_float(block.get('frame')) or 0),
+            'encode_fps': to_float(block.get('fps')),
+            'speed': to_float(block.get('speed'), 'x'),
+            'bitrate_kbps': to_float(block.get('bitrate'), 'kbits/s'),
+            'output_bytes': int(to_float(block.get('total_size')) or 0),
+            'out_time_sec': out_time_us / 1_000_000 if out_time_us is not None else None,
+            'finished': block.get('progress') == 'end',
+        }
+
+    def get_progress(self):
+        """直近の進捗 (未取得なら空の dict)"""
+        with self.progress_lock:
+            return dict(self.progress)
+        
     def write_frame(self, frame):
-        """フレームデータを書き込む"""
+        """フレームデータを書き込む。書き込めなかったら False (パイプ切断など)"""
         if self.process:
             try:
-                self.process.stdin.write(frame.tobytes())
+                # 連続配列ならコピーせずにバッファをそのまま渡す
+                self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+                return True
             except Exception as e:
-                print(f"Error writing frame: {e}")
+                log.error(f"Error writing frame: {e}")
+        return False
 
     def stop(self):
         """プロセスを終了"""
         if self.process:
-            self.process.stdin.close()
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass # プロセスが先に終了している (パイプ切断)
             self.process.wait()
+            if self.progress_thread:
+                self.progress_thread.join(timeout=2.0)
+                self.progress_thread = None
             self.process = None
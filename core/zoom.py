@@ -0,0 +1,152 @@
+import os
+import sys
+import math
+import ctypes
+import ctypes.util
+
+from utils.logger import get_logger
+
+log = get_logger("capture")
+
+def roi_size(width, height, factor):
+    """ズーム時に取得する範囲のサイズ (偶数、出力と同じ縦横比)"""
+    factor = max(1.0, float(factor))
+    return max(2, int(width / factor) // 2 * 2), max(2, int(height / factor) // 2 * 2)
+
+
+class ZoomViewport:
+    """
+    マウスカーソルを追いかける取得範囲 (ROI)
+    - カーソルが ROI の中央付近 (deadzone) にある間は動かさない
+    - 目標位置へは時定数 smoothing_sec で指数的に近づける (滑らかなパン)
+    - ROI は常に bounds (録画範囲・モニタ) の内側に収める
+    """
+    def __init__(self, bounds, factor, smoothing_sec=0.3, deadzone=0.25):
+        self.left, self.top = int(bounds["left"]), int(bounds["top"])
+        self.width, self.height = int(bounds["width"]), int(bounds["height"])
+        self.roi_width, self.roi_height = roi_size(self.width, self.height, factor)
+        self.smoothing_sec = smoothing_sec
+        self.deadzone = deadzone
+        # 最初は中央
+        self.cx = self.left + self.width / 2
+        self.cy = self.top + self.height / 2
+        self.target = (self.cx, self.cy)
+        self.last_time = None
+        self.pans = 0 # ROI が移動したフレーム数
+
+    def _clamp(self, cx, cy):
+        half_w, half_h = self.roi_width / 2, self.roi_height / 2
+        cx = min(max(cx, self.left + half_w), self.left + self.width - half_w)
+        cy = min(max(cy, self.top + half_h), self.top + self.height - half_h)
+        return cx, cy
+
+    def rect(self):
+        """ROI (mss と同じ形式の dict)"""
+        return {"left": int(round(self.cx - self.roi_width / 2)), "top": int(round(self.cy - self.roi_height / 2)),
+                "width": self.roi_width, "height": self.roi_height}
+
+    def update(self, cursor, now):
+        """カーソル位置 (None は不明) と現在時刻から ROI を更新し、左上座標を返す"""
+        if cursor is not None:
+            x, y = cursor
+            tx, ty = self.target
+            # 目標の周囲 deadzone の範囲を出たときだけ目標を更新する
+            if (abs(x - tx) > self.roi_width * self.deadzone / 2
+                    or abs(y - ty) > self.roi_height * self.deadzone / 2):
+                self.target = self._clamp(x, y)
+        dt = 0.0 if self.last_time is None else max(0.0, now - self.last_time)
+        self.last_time = now
+        alpha = 1.0 if self.smoothing_sec <= 0 else 1.0 - math.exp(-dt / self.smoothing_sec)
+        before = self.rect()
+        self.cx += (self.target[0] - self.cx) * alpha
+        self.cy += (self.target[1] - self.cy) * alpha
+        rect = self.rect()
+        if (rect["left"], rect["top"]) != (before["left"], before["top"]):
+            self.pans += 1
+        return rect["left"], rect["top"]
+
+    def get_stats(self):
+        rect = self.rect()
+        return {"zoom_roi": (rect["left"], rect["top"], rect["width"], rect["height"]), "zoom_pans": self.pans}
+
+
+class Win32Cursor:
+    """GetCursorPos (仮想スクリーン座標、mss のモニタ座標と同じ)"""
+    def __init__(self):
+        self.user32 = ctypes.windll.user32
+        self.point = (ctypes.c_long * 2)()
+
+    def position(self):
+        if not self.user32.GetCursorPos(ctypes.byref(self.point)):
+            return None
+        return self.point[0], self.point[1]
+
+    def close(self):
+        pass
+
+
+class X11Cursor:
+    """XQueryPointer (ルートウィンドウ座標)"""
+    def __init__(self):
+        path = ctypes.util.find_library('X11')
+        if not path:
+            raise OSError("libX11 not found")
+        x11 = self.x11 = ctypes.CDLL(path)
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong] + \
+            [ctypes.POINTER(ctypes.c_ulong)] * 2 + [ctypes.POINTER(ctypes.c_int)] * 4 + [ctypes.POINTER(ctypes.c_uint)]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self.display = x11.XOpenDisplay(None)
+        if not self.display:
+            raise OSError("Cannot open X display")
+        self.root = x11.XDefaultRootWindow(self.display)
+
+    def position(self):
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        x, y, wx, wy = (ctypes.c_int() for _ in range(4))
+        mask = ctypes.c_uint()
+        if not self.x11.XQueryPointer(self.display, self.root, ctypes.byref(root), ctypes.byref(child),
+                                      ctypes.byref(x), ctypes.byref(y), ctypes.byref(wx), ctypes.byref(wy),
+                                      ctypes.byref(mask)):
+            return None
+        return x.value, y.value
+
+    def close(self):
+        if self.display:
+            self.x11.XCloseDisplay(self.display)
+            self.display = None
+
+
+class SyntheticCursor:
+    """合成画面用: 録画範囲内をリサージュ曲線で動く決定的なカーソル (呼び出しごとに 1 フレーム進む)"""
+    def __init__(self, bounds, fps=30):
+        self.bounds = bounds
+        self.step = 1.0 / fps
+        self.t = 0.0
+
+    def position(self):
+        b = self.bounds
+        self.t += self.step
+        x = b["left"] + b["width"] * (0.5 + 0.45 * math.sin(self.t * 0.7))
+        y = b["top"] + b["height"] * (0.5 + 0.45 * math.sin(self.t * 1.1 + 1.0))
+        return x, y
+
+    def close(self):
+        pass
+
+
+def open_cursor_tracker(backend_name, bounds, fps=30):
+    """取得方式に合ったカーソル位置の取得手段 (取得できなければ None: ROI は中央に固定)"""
+    if backend_name in ('synthetic', 'file', 'flash'):
+        return SyntheticCursor(bounds, fps)
+    try:
+        if sys.platform == 'win32':
+            return Win32Cursor()
+        if os.environ.get('DISPLAY'):
+            return X11Cursor()
+    except Exception as e:
+        log.warning(f"Cursor position unavailable ({e}), zoom stays centered")
+    return None
@@ -1,23 +1,65 @@
-from PyQt6.QtWidgets import QWidget, QRubberBand
-from PyQt6.QtCore import Qt, QRect, QPoint, QSize, pyqtSignal
-from PyQt6.QtGui import QColor, QPalette, QPen, QPainter, QBrush
+import sys
+from PyQt6.QtWidgets import QWidget, QRubberBand, QApplication
+from PyQt6.QtCore import Qt, QRect, QRectF, QPoint, QSize, pyqtSignal
+from PyQt6.QtGui import QColor, QPalette, QPen, QPainter, QBrush, QPixmap
+from utils.logger import get_logger
+
+log = get_logger("area_selector")
+
+def _list_window_rects():
+    """
+    表示中のトップレベルウィンドウの矩形 (物理座標) を列挙する
+    スナップ用。Windows 以外では空リスト
+    """
+    if not sys.platform.startswith('win'):
+        return []
+    try:
+        import ctypes
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        dwmapi = ctypes.windll.dwmapi
+        DWMWA_EXTENDED_FRAME_BOUNDS = 9
+        rects = []
+
+        @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+        def callback(hwnd, _):
+            if user32.IsWindowVisible(hwnd) and not user32.IsIconic(hwnd):
+                rect = wintypes.RECT()
+                # 影を含まない実際の枠を取得
+                if dwmapi.DwmGetWindowAttribute(hwnd, DWMWA_EXTENDED_FRAME_BOUNDS,
+                                                ctypes.byref(rect), ctypes.sizeof(rect)) != 0:
+                    user32.GetWindowRect(hwnd, ctypes.byref(rect))
+                if rect.right - rect.left > 20 and rect.bottom - rect.top > 20:
+                    rects.append((rect.left, rect.top, rect.right, rect.bottom))
+            return True
+
+        user32.EnumWindows(callback, 0)
+        return rects
+    except Exception as e:
+        log.debug(f"Failed to enumerate windows: {e}")
+        return []
+
 
 class AreaSelector(QWidget):
     selection_completed = pyqtSignal(tuple) # (x, y, w, h)
     selection_canceled = pyqtSignal()
 
+    MAGNIFIER_SIZE = 120 # 拡大鏡の表示サイズ (論理ピクセル)
+    MAGNIFIER_ZOOM = 8
+    SNAP_DISTANCE = 8 # ウィンドウ端に吸着する距離 (論理ピクセル)
+
     def __init__(self):
         super().__init__()
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.Tool)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
-        
+        self.setMouseTracking(True)
+
         # マルチモニタ対応: 全仮想デスクトップをカバーするように設定
-        from PyQt6.QtWidgets import QApplication
         screen_geometry = QApplication.primaryScreen().virtualGeometry()
         self.setGeometry(screen_geometry)
-        
+
         self.setCursor(Qt.CursorShape.CrossCursor)
-        
+
         self.rubberBand = QRubberBand(QRubberBand.Shape.Rectangle, self)
         self.origin = QPoint()
         self.current = QPoint()
@@ -27,62 +69,227 @@ class AreaSelector(QWidget):
         self.overlay_color = QColor(0, 0, 0, 100)
         self.border_color = QColor(255, 0, 0, 200)
 
+        # 静止画の背景 (表示開始時に一度だけ取得してキャッシュ)
+        self.backdrop = None # 元の画面
+        self.dimmed_backdrop = None # 暗くした画面 (描画のたびに合成しない)
+        self.backdrop_dpr = 1.0
+        self.snap_xs = []
+        self.snap_ys = []
+        self.cursor_pos = None
+
+    def start_selection(self):
+        """画面を固定して範囲選択を開始"""
+        screen_geometry = QApplication.primaryScreen().virtualGeometry()
+        self.setGeometry(screen_geometry)
+        self.origin = QPoint()
+        self.current = QPoint()
+        self.is_selecting = False
+        self.cursor_pos = None
+        self._capture_backdrop()
+        self._load_snap_edges()
+        self.show()
+        self.activateWindow()
+
+    def _capture_backdrop(self):
+        """全モニタの画面を取得し、通常版と暗くした版をキャッシュ"""
+        virtual = self.geometry()
+        screens = QApplication.screens()
+        dpr = max((s.devicePixelRatio() for s in screens), default=1.0)
+        backdrop = QPixmap(QSize(int(virtual.width() * dpr), int(virtual.height() * dpr)))
+        backdrop.setDevicePixelRatio(dpr)
+        backdrop.fill(Qt.GlobalColor.black)
+
+        painter = QPainter(backdrop)
+        grabbed = False
+        for screen in screens:
+            shot = screen.grabWindow(0)
+            if shot.isNull():
+                continue
+            geometry = screen.geometry().translated(-virtual.topLeft())
+            painter.drawPixmap(geometry, shot)
+            grabbed = True
+        painter.end()
+
+        if not grabbed:
+            # 取得できない環境 (一部の Wayland など) は従来の半透明オーバーレイにフォールバック
+            self.backdrop = None
+            self.dimmed_backdrop = None
+            return
+
+        dimmed = QPixmap(backdrop)
+        painter = QPainter(dimmed)
+        painter.fillRect(QRect(QPoint(0, 0), virtual.size()), self.overlay_color)
+        painter.end()
+
+        self.backdrop = backdrop
+        self.dimmed_backdrop = dimmed
+        self.backdrop_dpr = dpr
+
+    def _load_snap_edges(self):
+        """ウィンドウ端の座標をローカル論理座標で保持"""
+        dpr = self.screen().devicePixelRatio() if self.screen() else 1.0
+        origin = self.geometry().topLeft()
+        xs, ys = set(), set()
+        for left, top, right, bottom in _list_window_rects():
+            xs.update((round(left / dpr) - origin.x(), round(right / dpr) - origin.x()))
+            ys.update((round(top / dpr) - origin.y(), round(bottom / dpr) - origin.y()))
+        self.snap_xs = sorted(xs)
+        self.snap_ys = sorted(ys)
+
+    def _snap(self, pos):
+        """近くにウィンドウ端があれば吸着 (Shift 押下中は無効)"""
+        if QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier:
+            return pos
+        x = min(self.snap_xs, key=lambda v: abs(v - pos.x()), default=None)
+        y = min(self.snap_ys, key=lambda v: abs(v - pos.y()), default=None)
+        if x is None or abs(x - pos.x()) > self.SNAP_DISTANCE:
+            x = pos.x()
+        if y is None or abs(y - pos.y()) > self.SNAP_DISTANCE:
+            y = pos.y()
+        return QPoint(x, y)
+
+    def _selection_rect(self):
+        return QRect(self.origin, self.current).normalized()
+
+    def _dirty_selection_rect(self):
+        """枠線の太さを含めた再描画範囲"""
+        if self.origin.isNull():
+            return QRect()
+        return self._selection_rect().adjusted(-2, -2, 2, 2)
+
+    def _magnifier_rect(self):
+        if self.cursor_pos is None or self.backdrop is None:
+            return QRect()
+        size = self.MAGNIFIER_SIZE
+        rect = QRect(self.cursor_pos + QPoint(20, 20), QSize(size, size + 18))
+        # 画面端ではカーソルの反対側に表示
+        if rect.right() > self.width():
+            rect.moveRight(self.cursor_pos.x() - 20)
+        if rect.bottom() > self.height():
+            rect.moveBottom(self.cursor_pos.y() - 20)
+        return rect.adjusted(-2, -2, 2, 2)
+
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        
-        # 全体を少し暗く塗る
-        painter.fillRect(self.rect(), self.overlay_color)
+        dirty = event.rect()
+
+        if self.dimmed_backdrop is not None:
+            # 変化した範囲だけキャッシュ済みの背景から転送
+            painter.drawPixmap(dirty, self.dimmed_backdrop, self._source_rect(dirty))
+        else:
+            # 全体を少し暗く塗る
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.fillRect(dirty, self.overlay_color)
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
 
         if self.is_selecting and not self.origin.isNull():
-            # 選択範囲をクリア（透明に）して、そこだけ明るく見せる効果
-            selected_rect = QRect(self.origin, self.current).normalized()
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-            painter.fillRect(selected_rect, Qt.GlobalColor.transparent)
-            
+            # 選択範囲は元の明るさで表示
+            selected_rect = self._selection_rect()
+            visible = selected_rect.intersected(dirty)
+            if not visible.isEmpty():
+                if self.backdrop is not None:
+                    painter.drawPixmap(visible, self.backdrop, self._source_rect(visible))
+                else:
+                    painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+                    painter.fillRect(visible, Qt.GlobalColor.transparent)
+                    painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+
             # 枠線を描画
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
             pen = QPen(self.border_color, 2)
             painter.setPen(pen)
             painter.drawRect(selected_rect)
 
+        magnifier = self._magnifier_rect()
+        if not magnifier.isEmpty() and magnifier.intersects(dirty):
+            self._paint_magnifier(painter, magnifier.adjusted(2, 2, -2, -2))
+
+    def _source_rect(self, rect):
+        """ローカル論理座標 -> 背景ピクスマップのデバイスピクセル座標"""
+        dpr = self.backdrop_dpr
+        return QRectF(rect.x() * dpr, rect.y() * dpr, rect.width() * dpr, rect.height() * dpr)
+
+    def _paint_magnifier(self, painter, rect):
+        """カーソル周辺を拡大表示 (ピクセル単位の位置合わせ用)"""
+        size = self.MAGNIFIER_SIZE
+        view = QRect(rect.topLeft(), QSize(size, size))
+        dpr = self.backdrop_dpr
+        span = size / self.MAGNIFIER_ZOOM # 拡大元の範囲 (デバイスピクセル)
+        cx = self.cursor_pos.x() * dpr
+        cy = self.cursor_pos.y() * dpr
+        source = QRectF(cx - span / 2, cy - span / 2, span, span)
+
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        painter.drawPixmap(QRectF(view), self.backdrop, source)
+        painter.setPen(QPen(QColor(255, 255, 255, 200), 1))
+        painter.drawRect(view)
+        # 十字線
+        painter.setPen(QPen(self.border_color, 1))
+        painter.drawLine(view.center().x(), view.top(), view.center().x(), view.bottom())
+        painter.drawLine(view.left(), view.center().y(), view.right(), view.center().y())
+        # 物理座標の表示
+        global_pos = self.mapToGlobal(self.cursor_pos)
+        label = QRect(view.left(), view.bottom() + 1, size, 18)
+        painter.fillRect(label, QColor(0, 0, 0, 180))
+        painter.setPen(Qt.GlobalColor.white)
+        painter.drawText(label, Qt.AlignmentFlag.AlignCenter,
+                         f"{int(global_pos.x() * dpr)}, {int(global_pos.y() * dpr)}")
+
+    def _update_regions(self, *rects):
+        """古い範囲と新しい範囲の和だけを再描画"""
+        region = None
+        for rect in rects:
+            if rect.isEmpty():
+                continue
+            region = rect if region is None else region.united(rect)
+        if region is not None:
+            self.update(region)
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
-            self.origin = event.pos()
-            self.current = event.pos()
+            self.origin = self._snap(event.pos())
+            self.current = self.origin
             self.rubberBand.setGeometry(QRect(self.origin, QSize()))
             # self.rubberBand.show() # カスタム描画を使用するため非表示のまま
             self.is_selecting = True
-            self.update()
+            self._update_regions(self._dirty_selection_rect(), self._magnifier_rect())
 
     def mouseMoveEvent(self, event):
+        old_selection = self._dirty_selection_rect() if self.is_selecting else QRect()
+        old_magnifier = self._magnifier_rect()
+        self.cursor_pos = self._snap(event.pos())
         if self.is_selecting:
-            self.current = event.pos()
+            self.current = self.cursor_pos
             # self.rubberBand.setGeometry(QRect(self.origin, self.current).normalized())
-            self.update()
+        new_selection = self._dirty_selection_rect() if self.is_selecting else QRect()
+        self._update_regions(old_selection, new_selection, old_magnifier, self._magnifier_rect())
 
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.is_selecting:
             self.is_selecting = False
-            rect = QRect(self.origin, event.pos()).normalized()
-            
+            self.current = self._snap(event.pos())
+            rect = self._selection_rect()
+
             # 幅や高さが小さすぎる場合は誤操作とみなす
             if rect.width() > 10 and rect.height() > 10:
                 # Local to Global変換 (マルチモニタのオフセットを考慮)
                 top_left_global = self.mapToGlobal(rect.topLeft())
-                
+
                 # High DPI対応: 論理座標から物理座標へ変換
                 screen = self.screen()
                 dpr = screen.devicePixelRatio()
-                
+
                 # Global Logical -> Global Physical
                 x = int(top_left_global.x() * dpr)
                 y = int(top_left_global.y() * dpr)
                 w = int(rect.width() * dpr)
                 h = int(rect.height() * dpr)
-                
-                print(f"[DEBUG] Area Selection: Local({rect.x()}, {rect.y()}) -> Global Logical({top_left_global.x()}, {top_left_global.y()}) -> Physical({x}, {y}, {w}, {h}) DPR={dpr}")
-                
+
+                log.debug("Area selected", extra={"fields": {
+                    "local": (rect.x(), rect.y()),
+                    "global_logical": (top_left_global.x(), top_left_global.y()),
+                    "physical": (x, y, w, h), "dpr": dpr}})
+
+                self._release_backdrop()
                 self.selection_completed.emit((x, y, w, h))
                 self.close()
             else:
@@ -91,5 +298,11 @@ class AreaSelector(QWidget):
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Escape:
+            self._release_backdrop()
             self.selection_canceled.emit()
             self.close()
+
+    def _release_backdrop(self):
+        """全画面分のピクスマップは大きいので選択終了時に解放"""
+        self.backdrop = None
+        self.dimmed_backdrop = None
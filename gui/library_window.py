@@ -0,0 +1,360 @@
+import os
+import threading
+from collections import OrderedDict
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QListView, QPushButton,
+                             QLabel, QAbstractItemView, QDialog, QFormLayout, QDoubleSpinBox,
+                             QDialogButtonBox, QMessageBox)
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QUrl, QObject, QEvent, pyqtSignal
+from PyQt6.QtGui import QPixmap, QColor, QDesktopServices
+
+from utils.config import config
+from core.trimmer import VideoTrimmer, trim_recording
+from core.library import ThumbnailWorker
+
+class RecordingListModel(QAbstractListModel):
+    """
+    カタログDBから必要な分だけ読み込むリストモデル
+    スクロールに合わせて fetchMore でページ単位に取得するため、件数が多くても即座に開ける
+    マウスを乗せている項目はスプライトシートのコマをホバー位置に合わせて表示する (スクラブプレビュー)
+    """
+    PAGE_SIZE = 200
+    PIXMAP_CACHE_SIZE = 500
+    SPRITE_CACHE_SIZE = 20
+
+    def __init__(self, library, thumbnail_worker, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.worker = thumbnail_worker
+        self.rows = []
+        self.row_by_id = {}
+        self.total = 0
+        self.pixmaps = OrderedDict() # id -> QPixmap (LRU)
+        self.sprites = OrderedDict() # id -> スプライトシートの QPixmap (LRU)
+        self.scrub = None # (id, コマ番号) ホバー中の項目
+        self.placeholder = QPixmap(RecordingListModel.thumb_size())
+        self.placeholder.fill(QColor("#313244"))
+        self.worker.thumbnail_ready.connect(self._on_thumbnail_ready)
+        self.reload()
+
+    @staticmethod
+    def thumb_size():
+        return QSize(160, 90)
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.row_by_id = {}
+        self.pixmaps.clear()
+        self.sprites.clear()
+        self.scrub = None
+        self.total = self.library.count()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        page = self.library.fetch(len(self.rows), self.PAGE_SIZE)
+        if not page:
+            self.total = len(self.rows)
+            return
+        start = len(self.rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(page) - 1)
+        for i, row in enumerate(page):
+            self.row_by_id[row["id"]] = start + i
+        self.rows.extend(page)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(row["path"])
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._thumbnail(row)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self._describe(row)
+        if role == Qt.ItemDataRole.UserRole:
+            return row["path"]
+        return None
+
+    def set_scrub(self, row_index, fraction=0.0):
+        """ホバー位置 (項目の左端 0.0 - 右端 1.0) に対応するコマを表示する (row_index が None なら解除)"""
+        previous = self.scrub
+        self.scrub = None
+        if row_index is not None and 0 <= row_index < len(self.rows):
+            row = self.rows[row_index]
+            if row["sprite_path"]:
+                cols, rows = ThumbnailWorker.SPRITE_GRID
+                tile = min(cols * rows - 1, max(0, int(fraction * cols * rows)))
+                self.scrub = (row["id"], tile)
+        if self.scrub == previous:
+            return
+        for key in (previous, self.scrub):
+            row_index = self.row_by_id.get(key[0]) if key else None
+            if row_index is not None:
+                index = self.index(row_index)
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def _sprite_tile(self, row, tile):
+        """スプライトシートから1コマ切り出す (読み込めなければ None)"""
+        sprite = self.sprites.get(row["id"])
+        if sprite is None:
+            if not os.path.exists(row["sprite_path"]):
+                return None
+            sprite = QPixmap(row["sprite_path"])
+            if sprite.isNull():
+                return None
+            self.sprites[row["id"]] = sprite
+            if len(self.sprites) > self.SPRITE_CACHE_SIZE:
+                self.sprites.popitem(last=False)
+        else:
+            self.sprites.move_to_end(row["id"])
+        cols, rows = ThumbnailWorker.SPRITE_GRID
+        width, height = sprite.width() // cols, sprite.height() // rows
+        return sprite.copy((tile % cols) * width, (tile // cols) * height, width, height).scaled(
+            self.thumb_size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+    def _thumbnail(self, row):
+        """キャッシュ済みならそれを、無ければ生成を要求してプレースホルダを返す"""
+        if self.scrub and self.scrub[0] == row["id"]:
+            pixmap = self._sprite_tile(row, self.scrub[1])
+            if pixmap is not None:
+                return pixmap
+        pixmap = self.pixmaps.get(row["id"])
+        if pixmap is not None:
+            self.pixmaps.move_to_end(row["id"])
+            return pixmap
+        if row["thumb_path"] and os.path.exists(row["thumb_path"]):
+            pixmap = QPixmap(row["thumb_path"]).scaled(
+                self.thumb_size(), Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation)
+            self.pixmaps[row["id"]] = pixmap
+            if len(self.pixmaps) > self.PIXMAP_CACHE_SIZE:
+                self.pixmaps.popitem(last=False)
+            return pixmap
+        self.worker.request(row["id"])
+        return self.placeholder
+
+    def _describe(self, row):
+        lines = [row["path"]]
+        if row["duration"]:
+            minutes, seconds = divmod(int(row["duration"]), 60)
+            lines.append(f"長さ: {minutes:02}:{seconds:02}")
+        if row["width"] and row["height"]:
+            lines.append(f"解像度: {row['width']}x{row['height']} @ {row['fps'] or '?'}fps")
+        if row["size"]:
+            lines.append(f"サイズ: {row['size'] / (1024 * 1024):.1f} MB")
+        if row["audio_sources"]:
+            lines.append(f"音声: {row['audio_sources']}")
+        points = self.library.resume_points(row)
+        if points:
+            lines.append(f"分割位置: {len(points)} か所 (一時停止からの再開位置)")
+        return "\n".join(lines)
+
+    def _on_thumbnail_ready(self, recording_id):
+        row_index = self.row_by_id.get(recording_id)
+        if row_index is None:
+            return
+        updated = self.library.get(recording_id)
+        if updated:
+            self.rows[row_index] = updated
+        self.pixmaps.pop(recording_id, None)
+        self.sprites.pop(recording_id, None)
+        index = self.index(row_index)
+        self.dataChanged.emit(index, index)
+
+
+class TrimDialog(QDialog):
+    """先頭・末尾のトリム秒数を指定するダイアログ"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("トリム")
+        layout = QFormLayout(self)
+
+        self.head_spin = QDoubleSpinBox()
+        self.head_spin.setRange(0.0, 3600.0)
+        self.head_spin.setSingleStep(0.5)
+        self.head_spin.setSuffix(" 秒")
+        self.head_spin.setValue(config.trim_head_sec)
+
+        self.tail_spin = QDoubleSpinBox()
+        self.tail_spin.setRange(0.0, 3600.0)
+        self.tail_spin.setSingleStep(0.5)
+        self.tail_spin.setSuffix(" 秒")
+        self.tail_spin.setValue(config.trim_tail_sec)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout.addRow("先頭をカット:", self.head_spin)
+        layout.addRow("末尾をカット:", self.tail_spin)
+        layout.addRow(buttons)
+
+    def values(self):
+        return self.head_spin.value(), self.tail_spin.value()
+
+
+class TrimWorker(QObject):
+    """トリム・分割処理をバックグラウンドで実行"""
+    finished = pyqtSignal(list) # 出力ファイルのパス
+    failed = pyqtSignal(str)
+
+    def run(self, path, head_sec, tail_sec):
+        self._start(lambda: [trim_recording(path, head_sec, tail_sec)])
+
+    def split(self, path, points):
+        self._start(lambda: VideoTrimmer(path).split(points))
+
+    def _start(self, task):
+        threading.Thread(target=self._run, args=(task,), daemon=True).start()
+
+    def _run(self, task):
+        try:
+            self.finished.emit(task())
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class LibraryWindow(QWidget):
+    """録画ライブラリの一覧表示 (ダブルクリックで再生、マウスを横に動かすと内容をプレビュー)"""
+    def __init__(self, library, thumbnail_worker, parent=None):
+        super().__init__(parent)
+        self.setWindowFlag(Qt.WindowType.Window)
+        self.setWindowTitle("録画ライブラリ")
+        self.resize(820, 560)
+        self.library = library
+
+        layout = QVBoxLayout(self)
+
+        toolbar = QHBoxLayout()
+        self.count_label = QLabel("")
+        import_btn = QPushButton("フォルダを取り込む")
+        import_btn.clicked.connect(self._import_output_dir)
+        cleanup_btn = QPushButton("存在しない項目を削除")
+        cleanup_btn.clicked.connect(self._remove_missing)
+        toolbar.addWidget(self.count_label)
+        toolbar.addStretch()
+        self.trim_btn = QPushButton("トリム...")
+        self.trim_btn.clicked.connect(self._trim_selected)
+        toolbar.addWidget(self.trim_btn)
+        self.split_btn = QPushButton("再開位置で分割")
+        self.split_btn.clicked.connect(self._split_selected)
+        toolbar.addWidget(self.split_btn)
+        toolbar.addWidget(import_btn)
+        toolbar.addWidget(cleanup_btn)
+        layout.addLayout(toolbar)
+
+        self.model = RecordingListModel(library, thumbnail_worker, self)
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setIconSize(RecordingListModel.thumb_size())
+        self.view.setGridSize(QSize(190, 130))
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.view.setModel(self.model)
+        self.view.doubleClicked.connect(self._open_recording)
+        # ホバー位置に合わせたスクラブプレビュー
+        self.view.setMouseTracking(True)
+        self.view.viewport().installEventFilter(self)
+        layout.addWidget(self.view)
+
+        self.trim_worker = TrimWorker(self)
+        self.trim_worker.finished.connect(self._on_trim_finished)
+        self.trim_worker.failed.connect(self._on_trim_failed)
+
+        self._update_count()
+
+    def eventFilter(self, obj, event):
+        if obj is self.view.viewport():
+            if event.type() == QEvent.Type.MouseMove:
+                pos = event.position().toPoint()
+                index = self.view.indexAt(pos)
+                if index.isValid():
+                    rect = self.view.visualRect(index)
+                    self.model.set_scrub(index.row(), (pos.x() - rect.left()) / max(1, rect.width()))
+                else:
+                    self.model.set_scrub(None)
+            elif event.type() == QEvent.Type.Leave:
+                self.model.set_scrub(None)
+        return super().eventFilter(obj, event)
+
+    def refresh(self):
+        self.model.reload()
+        self._update_count()
+
+    def _update_count(self):
+        self.count_label.setText(f"{self.model.total} 件")
+
+    def _import_output_dir(self):
+        if os.path.isdir(config.output_dir):
+            self.library.import_directory(config.output_dir)
+        self.refresh()
+
+    def _remove_missing(self):
+        self.library.remove_missing()
+        self.refresh()
+
+    def _selected_row(self):
+        """選択中の MP4 の行 (トリム・分割の対象)"""
+        index = self.view.currentIndex()
+        if not index.isValid():
+            return None
+        row = self.model.rows[index.row()]
+        return row if row["path"].lower().endswith(".mp4") else None
+
+    def _trim_selected(self):
+        row = self._selected_row()
+        if not row:
+            return
+        dialog = TrimDialog(self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        head_sec, tail_sec = dialog.values()
+        self._set_busy(self.trim_btn, "トリム中...")
+        self.trim_worker.run(row["path"], head_sec, tail_sec)
+
+    def _split_selected(self):
+        row = self._selected_row()
+        if not row:
+            return
+        points = self.library.resume_points(row)
+        if not points:
+            QMessageBox.information(self, "分割", "この録画には分割位置 (一時停止からの再開位置) がありません")
+            return
+        times = ", ".join(f"{int(p // 60):02}:{p % 60:04.1f}" for p in points)
+        answer = QMessageBox.question(self, "分割", f"{len(points) + 1} 個のファイルに分割します\n分割位置: {times}")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self._set_busy(self.split_btn, "分割中...")
+        self.trim_worker.split(row["path"], points)
+
+    def _set_busy(self, button=None, text=""):
+        """処理中は同時に実行できないようトリム・分割のボタンを無効にする (button に処理中の表示)"""
+        self.trim_btn.setEnabled(button is None)
+        self.split_btn.setEnabled(button is None)
+        self.trim_btn.setText("トリム...")
+        self.split_btn.setText("再開位置で分割")
+        if button is not None:
+            button.setText(text)
+
+    def _on_trim_finished(self, output_paths):
+        self._set_busy()
+        for output_path in output_paths:
+            self.library.add_recording(output_path)
+        self.refresh()
+
+    def _on_trim_failed(self, message):
+        self._set_busy()
+        QMessageBox.critical(self, "エラー", f"トリム・分割に失敗しました:\n{message}")
+
+    def _open_recording(self, index):
+        path = index.data(Qt.ItemDataRole.UserRole)
+        if path and os.path.exists(path):
+            QDesktopServices.openUrl(QUrl.fromLocalFile(path))
@@ -1,6 +1,7 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QComboBox, QCheckBox, QGroupBox, 
-                             QFileDialog, QSystemTrayIcon, QMenu, QMessageBox, QFrame)
+                             QFileDialog, QSystemTrayIcon, QMenu, QMessageBox, QFrame, QProgressBar,
+                             QLineEdit)
 from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon, QAction, QFont
 import sys
@@ -18,8 +19,13 @@ from core.recorder import Recorder
 from core.screen_capture import ScreenCapturer
 from gui.area_selector import AreaSelector
 from gui.countdown_overlay import CountdownOverlay
-from utils.audio_devices import AudioDeviceManager
+from gui.library_window import LibraryWindow
+from core.library import RecordingLibrary, ThumbnailWorker
+from utils.audio_devices import AudioDeviceManager, device_registry
 from utils.hotkeys import HotkeyManager
+from utils.logger import get_logger
+
+log = get_logger("gui")
 
 # ダークテーマのスタイルシート
 DARK_STYLESHEET = """
@@ -148,6 +154,10 @@ class MainWindow(QMainWindow):
         # 依存関係チェック
         self._check_dependencies()
         
+        # 音声デバイスの列挙をバックグラウンドで開始
+        device_registry.poll_interval = config.audio_device_poll_sec
+        device_registry.start()
+        
         # ホットキーマネージャー
         self.hotkey_manager = HotkeyManager()
         self.hotkey_manager.toggle_recording_triggered.connect(self._toggle_recording)
@@ -160,6 +170,14 @@ class MainWindow(QMainWindow):
         self.recorder.status_changed.connect(self._update_status)
         self.recorder.finished.connect(self._on_recording_finished)
         self.recorder.error_occurred.connect(self._on_error)
+        self.recorder.stats_updated.connect(self._update_stats)
+        self.recorder.levels_updated.connect(self._update_levels)
+        
+        # 録画ライブラリ (サムネイルはバックグラウンドで遅延生成)
+        self.library = RecordingLibrary(config.library_dir)
+        self.thumbnail_worker = ThumbnailWorker(self.library)
+        self.thumbnail_worker.start()
+        self.library_window = None
         
         # コンポーネントの初期化
         self.area_selector = AreaSelector()
@@ -254,6 +272,13 @@ class MainWindow(QMainWindow):
         sys_layout.addWidget(self.sys_audio_check)
         sys_layout.addStretch()
         
+        # システム音声とマイクを別トラックで保存
+        self.separate_tracks_check = QCheckBox("別トラックで保存")
+        self.separate_tracks_check.setToolTip("システム音声とマイク音声を別々の音声トラックとして保存します (1トラック目はミックス)")
+        self.separate_tracks_check.setChecked(config.audio_separate_tracks)
+        self.separate_tracks_check.toggled.connect(lambda c: setattr(config, 'audio_separate_tracks', c))
+        sys_layout.addWidget(self.separate_tracks_check)
+        
         # マイク音声
         mic_layout = QHBoxLayout()
         self.mic_audio_check = QCheckBox("マイク音声を録音")
@@ -262,10 +287,10 @@ class MainWindow(QMainWindow):
         self.mic_combo = QComboBox()
         self.mic_combo.setEnabled(config.use_mic_audio)
         
-        # マイクデバイスの列挙
-        devices = AudioDeviceManager.get_input_devices()
-        for dev in devices:
-            self.mic_combo.addItem(dev['name'], dev['id'])
+        # マイクデバイスの列挙 (バックグラウンドで列挙済みのキャッシュを使用、初回の列挙は完了時に反映)
+        device_registry.devices_ready.connect(self._populate_mic_combo)
+        device_registry.devices_changed.connect(self._populate_mic_combo)
+        self._populate_mic_combo()
             
         self.mic_combo.currentIndexChanged.connect(self._on_mic_changed)
         self.mic_audio_check.toggled.connect(self._on_mic_toggled)
@@ -279,12 +304,45 @@ class MainWindow(QMainWindow):
         mic_layout.addWidget(self.mic_combo)
         mic_layout.addStretch()
         
+        # レベルメーター (録音中のみ更新)
+        meter_layout = QHBoxLayout()
+        meter_label = QLabel("レベル:")
+        self.level_meter = QProgressBar()
+        self.level_meter.setRange(-60, 0) # dBFS
+        self.level_meter.setValue(-60)
+        self.level_meter.setTextVisible(False)
+        self.level_meter.setMaximumHeight(8)
+        self.limiter_label = QLabel("")
+        self.limiter_label.setStyleSheet("color: #f38ba8; font-size: 9pt;")
+        meter_layout.addWidget(meter_label)
+        meter_layout.addWidget(self.level_meter, 1)
+        meter_layout.addWidget(self.limiter_label)
+        
         layout.addLayout(sys_layout)
         layout.addLayout(mic_layout)
+        layout.addLayout(meter_layout)
         
         group.setLayout(layout)
         parent_layout.addWidget(group)
 
+    def _populate_mic_combo(self):
+        """マイク一覧を更新 (初回の列挙完了時、デバイスの抜き差し時にも呼ばれる)"""
+        current_id = config.mic_device_id
+        self.mic_combo.blockSignals(True)
+        self.mic_combo.clear()
+        if not device_registry.ready.is_set():
+            # 列挙中は GUI スレッドで待たない (選択中のデバイス設定もそのまま)
+            self.mic_combo.addItem("デバイスを検索中...")
+            self.mic_combo.blockSignals(False)
+            return
+        for dev in AudioDeviceManager.get_input_devices(wait=False):
+            self.mic_combo.addItem(dev['name'], dev['id'])
+        index = self.mic_combo.findData(current_id)
+        if index >= 0:
+            self.mic_combo.setCurrentIndex(index)
+        self.mic_combo.blockSignals(False)
+        config.mic_device_id = self.mic_combo.currentData()
+
     def _init_quality_section(self, parent_layout):
         group = QGroupBox("  品質・その他")
         layout = QHBoxLayout()
@@ -306,9 +364,58 @@ class MainWindow(QMainWindow):
         self.countdown_check.setChecked(config.countdown_enabled)
         self.countdown_check.toggled.connect(lambda c: setattr(config, 'countdown_enabled', c))
         
+        # 別プロセスキャプチャ
+        self.process_capture_check = QCheckBox("別プロセスでキャプチャ")
+        self.process_capture_check.setToolTip("画面取得をGUIとは別のプロセスで行い、UI操作によるフレーム落ちを防ぎます")
+        self.process_capture_check.setChecked(config.capture_out_of_process)
+        self.process_capture_check.toggled.connect(lambda c: setattr(config, 'capture_out_of_process', c))
+        
+        # タイムラプス
+        self.timelapse_check = QCheckBox("タイムラプス")
+        self.timelapse_check.setToolTip(f"{config.timelapse_interval_sec:g}秒ごとに1枚撮影し、{config.fps}fpsで再生される動画にします (音声なし・変化の無いコマは省略)")
+        self.timelapse_check.setChecked(config.timelapse_enabled)
+        self.timelapse_check.toggled.connect(lambda c: setattr(config, 'timelapse_enabled', c))
+        
+        # 低負荷録画 (可逆の中間ファイル -> 停止後に仕上げエンコード)
+        self.lossless_check = QCheckBox("低負荷録画")
+        self.lossless_check.setToolTip("録画中は圧縮を最小限にしてCPU負荷を抑え、停止後にバックグラウンドで仕上げエンコードします")
+        self.lossless_check.setChecked(config.capture_mode == 'lossless')
+        self.lossless_check.toggled.connect(lambda c: setattr(config, 'capture_mode', 'lossless' if c else 'standard'))
+        
+        # CPU スケジューリング
+        self.cpu_policy_combo = QComboBox()
+        self.cpu_policy_combo.addItem("CPU: 標準", "balanced")
+        self.cpu_policy_combo.addItem("CPU: キャプチャ優先", "capture-first")
+        self.cpu_policy_combo.addItem("CPU: 低負荷", "low-impact")
+        self.cpu_policy_combo.setToolTip("エンコーダのスレッド数・優先度・使用コアを調整します")
+        self.cpu_policy_combo.setCurrentIndex(max(0, self.cpu_policy_combo.findData(config.cpu_policy)))
+        self.cpu_policy_combo.currentIndexChanged.connect(
+            lambda i: setattr(config, 'cpu_policy', self.cpu_policy_combo.itemData(i)))
+        
+        # カーソル追従ズーム
+        self.zoom_combo = QComboBox()
+        for factor in (1.0, 1.5, 2.0, 3.0):
+            self.zoom_combo.addItem("ズーム: なし" if factor == 1.0 else f"ズーム: {factor:g}x", factor)
+        self.zoom_combo.setToolTip("マウスカーソルの周辺だけを取得し、同じ解像度に拡大して録画します (滑らかに追従)")
+        self.zoom_combo.setCurrentIndex(max(0, self.zoom_combo.findData(config.zoom_factor)))
+        self.zoom_combo.currentIndexChanged.connect(
+            lambda i: setattr(config, 'zoom_factor', self.zoom_combo.itemData(i)))
+        
+        # 無操作・無音区間のカット
+        self.idle_trim_check = QCheckBox("無操作区間をカット")
+        self.idle_trim_check.setToolTip(f"画面の変化も音声もない状態が{config.idle_threshold_sec:.0f}秒を超えた部分を録画しません")
+        self.idle_trim_check.setChecked(config.idle_trim_enabled)
+        self.idle_trim_check.toggled.connect(lambda c: setattr(config, 'idle_trim_enabled', c))
+        
         layout.addWidget(fps_label)
         layout.addWidget(self.fps_combo)
+        layout.addWidget(self.cpu_policy_combo)
+        layout.addWidget(self.zoom_combo)
         layout.addStretch()
+        layout.addWidget(self.timelapse_check)
+        layout.addWidget(self.lossless_check)
+        layout.addWidget(self.idle_trim_check)
+        layout.addWidget(self.process_capture_check)
         layout.addWidget(self.countdown_check)
         
         group.setLayout(layout)
@@ -343,9 +450,35 @@ class MainWindow(QMainWindow):
             # GIF check icon is handled via checkbox
             pass
         
+        # 連写 (静止画を連番で保存)
+        self.burst_check = QCheckBox("連写 (静止画)")
+        self.burst_check.setToolTip(f"毎秒{config.burst_fps}枚の{config.burst_format.upper()}画像をフォルダに保存します (音声なし)")
+        
+        # ライブ配信 (録画と同時に低遅延で送信)
+        self.stream_check = QCheckBox("配信")
+        self.stream_check.setToolTip(f"録画しながら指定URLへ低遅延で配信します (映像のみ、上限 {config.stream_bitrate_kbps} kbps)\n"
+                                     f"録画ファイルも配信と同じ画質 (GOP {config.stream_keyint_sec:g}秒、"
+                                     f"上限 {config.stream_bitrate_kbps} kbps) になります")
+        self.stream_check.setChecked(config.stream_enabled)
+        self.stream_check.toggled.connect(lambda c: setattr(config, 'stream_enabled', c))
+        self.stream_url_edit = QLineEdit(config.stream_url)
+        self.stream_url_edit.setPlaceholderText("rtmp:// / srt:// / udp://")
+        self.stream_url_edit.setFixedWidth(200)
+        self.stream_url_edit.textChanged.connect(lambda text: setattr(config, 'stream_url', text.strip()))
+        
+        library_btn = QPushButton("ライブラリ")
+        library_btn.clicked.connect(self._show_library)
+        icon = self._get_icon('fa5s.th', '#89dceb')
+        if icon:
+            library_btn.setIcon(icon)
+        
         layout.addWidget(self.path_label, 1)
         layout.addWidget(browse_btn)
+        layout.addWidget(library_btn)
         layout.addWidget(self.gif_check)
+        layout.addWidget(self.burst_check)
+        layout.addWidget(self.stream_check)
+        layout.addWidget(self.stream_url_edit)
         
         group.setLayout(layout)
         parent_layout.addWidget(group)
@@ -388,6 +521,11 @@ class MainWindow(QMainWindow):
         
         self.statusBar().addWidget(status_prefix)
         self.statusBar().addWidget(self.status_label)
+        
+        # エンコード速度・バッファ状況
+        self.buffer_label = QLabel("")
+        self.buffer_label.setStyleSheet("color: #fab387;")
+        self.statusBar().addWidget(self.buffer_label)
         self.statusBar().addPermanentWidget(self.time_label)
 
     def _init_system_tray(self):
@@ -420,6 +558,14 @@ class MainWindow(QMainWindow):
             config.output_dir = folder
             self.path_label.setText(folder)
 
+    def _show_library(self):
+        if self.library_window is None:
+            self.library_window = LibraryWindow(self.library, self.thumbnail_worker, self)
+        else:
+            self.library_window.refresh()
+        self.library_window.show()
+        self.library_window.raise_()
+
     def _on_mic_toggled(self, checked):
         config.use_mic_audio = checked
         self.mic_combo.setEnabled(checked)
@@ -438,26 +584,40 @@ class MainWindow(QMainWindow):
 
     def _toggle_recording(self):
         if self.recorder.is_recording:
-            # 停止処理
+            # 停止処理 (仕上げが終わって finished / error_occurred が届くまで次の録画は開始できない)
             self.recorder.stop_recording()
-            self.record_btn.setText("  録画開始 (F9)")
-            icon = self._get_icon('fa5s.circle', '#1e1e2e')
+            self.record_btn.setText("  仕上げ中...")
+            icon = self._get_icon('fa5s.hourglass-half', '#1e1e2e')
             if icon:
                 self.record_btn.setIcon(icon)
+            self.record_btn.setEnabled(False)
             self.record_btn.setProperty("recording", False)
             self.record_btn.style().unpolish(self.record_btn)
             self.record_btn.style().polish(self.record_btn)
             self.pause_btn.setEnabled(False)
-            self._update_ui_state(True)
-        else:
-            # 開始処理
+        elif not self.recorder.finalizing:
+            # 開始処理 (ホットキーは仕上げ中でも届くので無視する)
             self._prepare_recording()
 
+    def _reset_record_button(self):
+        """録画開始できる状態に戻す"""
+        self.record_btn.setText("  録画開始 (F9)")
+        icon = self._get_icon('fa5s.circle', '#1e1e2e')
+        if icon:
+            self.record_btn.setIcon(icon)
+        self.record_btn.setEnabled(True)
+        self.record_btn.setProperty("recording", False)
+        self.record_btn.style().unpolish(self.record_btn)
+        self.record_btn.style().polish(self.record_btn)
+        self.pause_btn.setEnabled(False)
+        self._update_ui_state(True)
+
     def _prepare_recording(self):
         mode_index = self.mode_combo.currentIndex()
         if mode_index == 1: # 範囲指定
             self.hide() # メインウィンドウを隠す
-            self.area_selector.show()
+            # ウィンドウが消えてから背景を取得する
+            QTimer.singleShot(150, self.area_selector.start_selection)
         else:
             self._start_sequence()
 
@@ -483,8 +643,14 @@ class MainWindow(QMainWindow):
             area = self.selected_area
 
         monitor_idx = self.screen_combo.currentData()
-        output_format = 'gif' if self.gif_check.isChecked() else 'mp4'
-        self.recorder.start_recording(region=area, monitor_index=monitor_idx, output_format=output_format)
+        if self.burst_check.isChecked():
+            output_format = 'burst'
+        else:
+            output_format = 'gif' if self.gif_check.isChecked() else 'mp4'
+        if not self.recorder.start_recording(region=area, monitor_index=monitor_idx, output_format=output_format):
+            self.showNormal()
+            self.status_label.setText("前の録画を仕上げ中のため開始できません")
+            return
         
         self.record_btn.setText("  録画停止 (F9)")
         icon = self._get_icon('fa5s.stop', '#1e1e2e')
@@ -516,33 +682,82 @@ class MainWindow(QMainWindow):
         self.mode_combo.setEnabled(enabled)
         self.screen_combo.setEnabled(enabled)
         self.gif_check.setEnabled(enabled)
+        self.burst_check.setEnabled(enabled)
+        self.stream_check.setEnabled(enabled)
+        self.stream_url_edit.setEnabled(enabled)
         self.fps_combo.setEnabled(enabled)
+        self.process_capture_check.setEnabled(enabled)
+        self.cpu_policy_combo.setEnabled(enabled)
+        self.zoom_combo.setEnabled(enabled)
+        self.lossless_check.setEnabled(enabled)
+        self.timelapse_check.setEnabled(enabled)
+        self.idle_trim_check.setEnabled(enabled)
         self.sys_audio_check.setEnabled(enabled)
         self.mic_audio_check.setEnabled(enabled)
+        self.separate_tracks_check.setEnabled(enabled)
         self.mic_combo.setEnabled(enabled and config.use_mic_audio)
 
     def _update_timer(self, time_str):
         self.time_label.setText(time_str)
 
+    def _update_stats(self, stats):
+        parts = []
+        if "stills_per_sec" in stats:
+            parts.append(f"連写 {stats['stills_per_sec']:.1f}枚/s (待ち {stats.get('burst_backlog', 0)}, 欠落 {stats.get('frames_dropped', 0)})")
+            self.buffer_label.setText("  ".join(parts))
+            return
+        if stats.get("speed") is not None:
+            parts.append(f"エンコード {stats['speed']:.2f}x")
+        if stats.get("encoder_failed"):
+            parts.append(f"エンコーダ停止 (破棄 {stats.get('encoder_discarded_frames', 0)}フレーム)")
+        elif stats.get("encoder_restarts"):
+            parts.append(f"エンコーダ再起動 {stats['encoder_restarts']}回")
+        spool_frames = stats.get("spool_frames", 0)
+        if spool_frames or stats.get("frames_dropped", 0):
+            parts.append(
+                f"バッファ {stats.get('spool_fill', 0) * 100:.0f}% "
+                f"(遅延 {stats.get('peak_backlog_sec', 0):.1f}s, 欠落 {stats.get('frames_dropped', 0)})")
+        self.buffer_label.setText("  ".join(parts))
+
+    def _update_levels(self, levels):
+        master = levels.get("master")
+        if master:
+            self.level_meter.setValue(int(max(-60.0, min(0.0, master["peak_db"]))))
+        reduction = levels.get("limiter_gr_db", 0.0)
+        self.limiter_label.setText(f"リミッタ {reduction:.1f} dB" if reduction < -0.5 else "")
+
     def _update_status(self, status):
         self.status_label.setText(status)
 
     def _on_recording_finished(self, filepath):
+        self.level_meter.setValue(-60)
+        self.limiter_label.setText("")
+        if not os.path.exists(filepath):
+            # 配信のみ (ファイル出力なし)
+            message = f"配信を終了しました:\n{filepath}"
+        elif os.path.isdir(filepath):
+            # 連写はフォルダ (ライブラリには登録しない)
+            message = f"静止画を保存しました ({self.recorder.stats.get('frames_written', 0)}枚):\n{filepath}"
+        else:
+            # ライブラリに登録
+            try:
+                self.library.add_recording(filepath, self.recorder.recording_info)
+                if self.library_window is not None:
+                    self.library_window.refresh()
+            except Exception as e:
+                log.warning(f"Failed to register recording: {e}")
+            message = f"動画を保存しました:\n{filepath}"
         self.status_label.setText("待機中")
         self.time_label.setText("00:00:00")
+        self._reset_record_button()
         self.showNormal() # ウィンドウを復帰
-        QMessageBox.information(self, "録画完了", f"動画を保存しました:\n{filepath}")
+        QMessageBox.information(self, "録画完了", message)
 
     def _on_error(self, message):
         self.showNormal()
         QMessageBox.critical(self, "エラー", f"録画中にエラーが発生しました:\n{message}")
         # リセット処理
-        self.record_btn.setText("  録画開始 (F9)")
-        icon = self._get_icon('fa5s.circle', '#1e1e2e')
-        if icon:
-            self.record_btn.setIcon(icon)
-        self.pause_btn.setEnabled(False)
-        self._update_ui_state(True)
+        self._reset_record_button()
 
     def closeEvent(self, event):
         if self.recorder.is_recording:
@@ -556,6 +771,9 @@ class MainWindow(QMainWindow):
         
         # ホットキーのクリーンアップ
         self.hotkey_manager.stop_listening()
+        device_registry.stop()
+        self.thumbnail_worker.stop()
+        self.library.close()
         super().closeEvent(event)
 
 
@@ -1,6 +1,13 @@
 import sys
 import os
 
+from utils.config import config
+from utils.logger import setup_logging, get_logger
+
+# ログは最初に初期化 (以降の出力はバックグラウンドで書き込まれる)
+setup_logging(config.log_dir, config.log_level, config.log_keep_sessions)
+log = get_logger("main")
+
 # Apply patches early
 try:
     from core.soundcard_patch import patch_soundcard
@@ -8,7 +15,7 @@ try:
 except ImportError:
     pass
 except Exception as e:
-    print(f"Failed to apply soundcard patch: {e}")
+    log.warning(f"Failed to apply soundcard patch: {e}")
 
 from PyQt6.QtWidgets import QApplication
 from PyQt6.QtCore import Qt
@@ -0,0 +1,57 @@
+"""
+AudioMixer (ゲイン・ミックス・リミッタ・メーター) の処理コストを計測する
+合成したシステム音声・マイク音声を実際と同じブロック長で流し、音声1秒あたりのCPU時間を表示する
+
+使い方: python tools/bench_audio_mixer.py [--seconds 60] [--block 1024]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.audio_mixer import AudioMixer
+
+
+def synth(seconds, samplerate, channels, freq, amplitude):
+    t = np.arange(int(seconds * samplerate), dtype=np.float32) / samplerate
+    mono = (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return np.repeat(mono[:, None], channels, axis=1)
+
+
+def run(seconds, samplerate, channels, block, limiter):
+    # 両ソースとも大音量にしてリミッタを常に動作させる
+    system = synth(seconds, samplerate, channels, 440.0, 0.8)
+    mic = synth(seconds, samplerate, channels, 997.0, 0.7)
+    mixer = AudioMixer(samplerate, channels, gains={'system': 1.0, 'mic': 1.2}, limiter=limiter)
+
+    peak = 0.0
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for i in range(0, len(system), block):
+        out = mixer.mix({'system': system[i:i + block], 'mic': mic[i:i + block]})
+        peak = max(peak, float(np.abs(out).max()))
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+    mixer.get_levels()
+    return cpu, wall, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--samplerate', type=int, default=48000)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--block', type=int, default=1024)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'cpu ms/s':>10}{'wall ms/s':>11}{'peak':>8}")
+    for label, limiter in (('mix only', False), ('mix+limit', True)):
+        cpu, wall, peak = run(args.seconds, args.samplerate, args.channels, args.block, limiter)
+        print(f"{label:<12}{cpu * 1000 / args.seconds:>10.2f}{wall * 1000 / args.seconds:>11.2f}{peak:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+画面コンテンツ向けエンコード設定の品質と CPU 負荷をマトリクスで計測する
+決定的に生成したクリップ (エディタのスクロール・スライド切り替え・動画再生) を VideoEncoder に流し、
+コーデック x プリセット x CRF の組み合わせごとにエンコード fps・CPU 秒・ビットレート・PSNR/SSIM (ffmpeg のフィルタ) を求める
+
+使い方: python tools/bench_encoders.py [--clips editor slides video] [--codecs libx264 x264-qp0]
+                                        [--presets ultrafast veryfast] [--crfs 18 23 28] [--min-ssim 0.98]
+                                        [--json result.json]
+推奨設定は配布用のコーデックのうち、目標 fps と SSIM の下限を満たす中で最もビットレートが低いもの
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import ctypes
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.video_encoder import VideoEncoder
+
+CLIPS = ('editor', 'slides', 'video')
+
+
+def editor_frames(width, height, count, seed=1):
+    """暗い背景に文字列状のブロックが並んだページを 1 フレーム 4px ずつスクロール"""
+    rng = np.random.default_rng(seed)
+    line_h = 18
+    page = np.empty((height * 3, width, 4), dtype=np.uint8)
+    page[...] = (30, 30, 30, 255)
+    palette = np.array([(220, 220, 220), (86, 156, 214), (206, 145, 120), (106, 153, 85)], dtype=np.uint8)
+    for row in range(0, page.shape[0] - line_h, line_h):
+        x = 40 + 16 * int(rng.integers(0, 6)) # インデント
+        while x < width - 40 and rng.random() > 0.08:
+            word = int(rng.integers(2, 10)) * 7
+            page[row + 4:row + line_h - 4, x:min(x + word, width - 40), :3] = palette[rng.integers(0, len(palette))]
+            x += word + 7
+    for i in range(count):
+        y = (i * 4) % (page.shape[0] - height)
+        yield page[y:y + height]
+
+
+def slides_frames(width, height, count, fps, seed=2):
+    """スライドを 1.5 秒表示して 0.5 秒でクロスフェード"""
+    rng = np.random.default_rng(seed)
+    slides = []
+    for _ in range(3):
+        slide = np.full((height, width, 4), 250, dtype=np.uint8)
+        slide[:height // 6, :, :3] = rng.integers(40, 200, 3) # タイトル帯
+        for row in range(height // 4, height - 40, height // 8):
+            slide[row:row + height // 24, width // 10:int(width * rng.uniform(0.4, 0.9)), :3] = 60
+        slides.append(slide)
+    hold, fade = int(fps * 1.5), int(fps * 0.5)
+    for i in range(count):
+        index, t = divmod(i, hold + fade)
+        current, following = slides[index % 3], slides[(index + 1) % 3]
+        if t < hold:
+            yield current
+        else:
+            a = (t - hold + 1) / fade
+            yield (current * (1 - a) + following * a).astype(np.uint8)
+
+
+def video_frames(width, height, count, seed=3):
+    """動画再生相当: 動く干渉縞に粒状ノイズを重ねる (フレーム全体が毎回変わる)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[..., 3] = 255
+    for i in range(count):
+        t = i * 0.08
+        v = np.sin(x / 37.0 + t) + np.sin(y / 23.0 - t * 1.3) + np.sin((x + y) / 53.0 + t * 0.7)
+        grain = rng.normal(0, 6, (height, width)).astype(np.float32)
+        for c, phase in enumerate((0.0, 2.1, 4.2)):
+            frame[..., c] = np.clip(127 + 40 * np.sin(v + phase) + grain, 0, 255)
+        yield frame
+
+
+def write_clip(name, path, width, height, count, fps):
+    """参照用の生フレーム (BGRA) をファイルに書き出す (全組み合わせで同じ入力を使う)"""
+    if name == 'editor':
+        frames = editor_frames(width, height, count)
+    elif name == 'slides':
+        frames = slides_frames(width, height, count, fps)
+    else:
+        frames = video_frames(width, height, count)
+    with open(path, 'wb') as f:
+        for frame in frames:
+            f.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+
+
+def read_frames(path, width, height):
+    frame_bytes = width * height * 4
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(frame_bytes)
+            if len(data) < frame_bytes:
+                return
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+
+
+def _children_cpu():
+    """回収済みの子プロセスの CPU 時間 (user + sys)"""
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _process_cpu_windows(process):
+    """終了したプロセスの CPU 時間 (GetProcessTimes、ハンドルは Popen が保持している)"""
+    times = [ctypes.c_ulonglong() for _ in range(4)]
+    ctypes.windll.kernel32.GetProcessTimes(int(process._handle), *[ctypes.byref(t) for t in times])
+    return (times[2].value + times[3].value) / 1e7
+
+
+def encode(raw_path, out_path, width, height, fps, codec, preset, crf):
+    """VideoEncoder でエンコードして (壁時計秒, CPU 秒) を返す"""
+    options = {}
+    intermediate = codec in VideoEncoder.INTERMEDIATE_CODECS
+    if not intermediate:
+        options = {'vcodec': codec, 'preset': preset, 'crf': crf}
+    encoder = VideoEncoder(out_path, (width, height), fps=fps,
+                           codec=codec if intermediate else None, output_options=options)
+    cpu_before = 0.0 if os.name == 'nt' else _children_cpu()
+    start = time.perf_counter()
+    encoder.start()
+    process = encoder.process
+    for frame in read_frames(raw_path, width, height):
+        if not encoder.write_frame(frame):
+            raise RuntimeError(f"encoder failed ({codec} {preset} {crf})")
+    encoder.stop()
+    wall = time.perf_counter() - start
+    cpu = _process_cpu_windows(process) if os.name == 'nt' else _children_cpu() - cpu_before
+    return wall, cpu
+
+
+def measure_quality(encoded_path, raw_path, width, height, fps):
+    """ffmpeg の psnr / ssim フィルタで参照との差を測る (どちらも yuv444p に揃えて比較)"""
+    graph = ("[0:v]format=yuv444p,split[d0][d1];[1:v]format=yuv444p,split[r0][r1];"
+             "[d0][r0]psnr;[d1][r1]ssim")
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-nostats', '-i', encoded_path,
+         '-f', 'rawvideo', '-pix_fmt', 'bgra', '-s', f'{width}x{height}', '-r', str(fps), '-i', raw_path,
+         '-lavfi', graph, '-f', 'null', '-'],
+        capture_output=True, text=True)
+    psnr = re.search(r'PSNR .*average:([\d.]+|inf)', result.stderr)
+    ssim = re.search(r'SSIM .*All:([\d.]+)', result.stderr)
+    return (float(psnr.group(1)) if psnr else None, float(ssim.group(1)) if ssim else None)
+
+
+def combinations(codecs, presets, crfs):
+    for codec in codecs:
+        if codec in VideoEncoder.INTERMEDIATE_CODECS:
+            # 可逆の中間コーデックはプリセット・CRF を持たない
+            yield codec, None, None
+        else:
+            for preset in presets:
+                for crf in crfs:
+                    yield codec, preset, crf
+
+
+def recommend(rows, target_fps, min_ssim):
+    """
+    クリップごとに、目標 fps と SSIM の下限を満たす中でビットレートが最も低い設定 (同程度なら CPU 秒が少ない方)
+    可逆の中間コーデックは配布用の出力ではない (SSIM が最も高く、ビットレートは桁違い) ので候補から外す
+    """
+    best = {}
+    for row in rows:
+        if row['codec'] in VideoEncoder.INTERMEDIATE_CODECS:
+            continue
+        if row['encode_fps'] < target_fps or row['ssim'] is None or row['ssim'] < min_ssim:
+            continue
+        current = best.get(row['clip'])
+        key = (row['bitrate_kbps'], row['cpu_sec'])
+        if current is None or key < (current['bitrate_kbps'], current['cpu_sec']):
+            best[row['clip']] = row
+    return {clip: {k: row[k] for k in ('codec', 'preset', 'crf', 'encode_fps', 'ssim', 'bitrate_kbps')}
+            for clip, row in best.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clips', nargs='+', default=list(CLIPS), choices=CLIPS)
+    parser.add_argument('--codecs', nargs='+', default=['libx264', 'x264-qp0'],
+                        help='ffmpeg のエンコーダ名 (libx264, libx265 など) または中間コーデック (x264-qp0, ffv1)')
+    parser.add_argument('--presets', nargs='+', default=['ultrafast', 'veryfast', 'medium'])
+    parser.add_argument('--crfs', nargs='+', type=int, default=[18, 23, 28])
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--seconds', type=float, default=4.0)
+    parser.add_argument('--target-fps', type=float, default=None,
+                        help='推奨設定に必要なエンコード fps (既定は --fps の 1.5 倍)')
+    parser.add_argument('--min-ssim', type=float, default=0.98,
+                        help='推奨設定に必要な SSIM (これを満たす中で最もビットレートが低い設定を推奨)')
+    parser.add_argument('--json', help='結果を書き出す JSON ファイル')
+    args = parser.parse_args()
+
+    if shutil.which('ffmpeg') is None:
+        sys.exit("ffmpeg not found in PATH")
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    count = int(args.seconds * args.fps)
+    target_fps = args.target_fps or args.fps * 1.5
+
+    rows = []
+    workdir = tempfile.mkdtemp(prefix='bench_encoders_')
+    print(f"{'clip':<8}{'codec':<10}{'preset':<11}{'crf':>4}{'fps':>8}{'cpu s':>8}{'kbps':>9}{'psnr':>7}{'ssim':>8}")
+    try:
+        for clip in args.clips:
+            raw_path = os.path.join(workdir, f'{clip}.raw')
+            write_clip(clip, raw_path, width, height, count, args.fps)
+            for codec, preset, crf in combinations(args.codecs, args.presets, args.crfs):
+                out_path = os.path.join(workdir, f'{clip}_{codec}_{preset}_{crf}.mkv')
+                wall, cpu = encode(raw_path, out_path, width, height, args.fps, codec, preset, crf)
+                psnr, ssim = measure_quality(out_path, raw_path, width, height, args.fps)
+                row = {
+                    'clip': clip, 'codec': codec, 'preset': preset, 'crf': crf,
+                    'encode_fps': round(count / wall, 1),
+                    'cpu_sec': round(cpu, 2),
+                    'bitrate_kbps': round(os.path.getsize(out_path) * 8 / 1000 / (count / args.fps), 1),
+                    'psnr': psnr, 'ssim': ssim,
+                }
+                rows.append(row)
+                os.remove(out_path)
+                print(f"{clip:<8}{codec:<10}{preset or '-':<11}{'-' if crf is None else crf:>4}"
+                      f"{row['encode_fps']:>8.1f}{row['cpu_sec']:>8.2f}{row['bitrate_kbps']:>9.0f}"
+                      f"{psnr if psnr is not None else float('nan'):>7.2f}{ssim if ssim is not None else float('nan'):>8.4f}")
+            os.remove(raw_path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    recommended = recommend(rows, target_fps, args.min_ssim)
+    print(f"\nrecommended (encode fps >= {target_fps:g}, SSIM >= {args.min_ssim:g}, lowest bitrate):")
+    for clip in args.clips:
+        choice = recommended.get(clip)
+        if choice is None:
+            print(f"  {clip:<8}(no setting meets both targets)")
+            continue
+        print(f"  {clip:<8}{choice['codec']} preset={choice['preset']} crf={choice['crf']} "
+              f"({choice['encode_fps']} fps, SSIM {choice['ssim']}, {choice['bitrate_kbps']} kbps)")
+
+    if args.json:
+        report = {
+            'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                        'cpus': os.cpu_count()},
+            'settings': {'size': [width, height], 'fps': args.fps, 'frames': count, 'target_fps': target_fps,
+                         'min_ssim': args.min_ssim},
+            'results': rows,
+            'recommended': recommended,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"saved: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+CPU スケジューリングポリシーごとのフレーム落ちを計測する
+エンコーダ相当の負荷 (ffmpeg があれば libx264、無ければ CPU を使い切るワーカープロセス) を掛けながら
+キャプチャ相当のループ (1080p BGRA のコピー) を目標 fps で回し、期限に間に合わなかったフレーム数を数える
+
+使い方: python tools/bench_scheduling.py [--seconds 10] [--fps 60] [--policies balanced capture-first low-impact]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import threading
+import multiprocessing as mp
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.scheduling import POLICIES, CpuScheduler
+
+
+def _burn(stop_event):
+    """エンコーダの代わりに CPU を使い続ける"""
+    a = np.random.rand(256, 256)
+    while not stop_event.is_set():
+        a = a @ a
+        a /= np.abs(a).max()
+
+
+def start_load(scheduler, use_ffmpeg):
+    """負荷を開始して停止用の関数を返す"""
+    threads = scheduler.encoder_threads or os.cpu_count() or 1
+    if use_ffmpeg:
+        process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-re', '-f', 'lavfi',
+             '-i', 'testsrc2=size=2560x1440:rate=60', '-c:v', 'libx264', '-preset', 'medium',
+             '-threads', str(scheduler.encoder_threads), '-f', 'null', '-'],
+            stdin=subprocess.DEVNULL)
+        time.sleep(0.5) # x264 のワーカースレッド生成を待つ
+        scheduler.apply_encoder(process.pid)
+
+        def stop():
+            process.terminate()
+            process.wait()
+        return stop
+
+    ctx = mp.get_context('spawn')
+    stop_event = ctx.Event()
+    workers = [ctx.Process(target=_burn, args=(stop_event,), daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        scheduler.apply_encoder(worker.pid)
+
+    def stop():
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+    return stop
+
+
+def capture_loop(scheduler, seconds, fps, result):
+    """ScreenCapturer と同じ待ち方で 1080p フレームのコピーを繰り返す"""
+    scheduler.apply_capture_thread()
+    src = np.random.randint(0, 255, (1080, 1920, 4), dtype=np.uint8)
+    dst = np.empty_like(src)
+    interval = 1.0 / fps
+    start = time.perf_counter()
+    deadline = start
+    frames = dropped = 0
+    lateness = []
+    while time.perf_counter() - start < seconds:
+        deadline += interval
+        np.copyto(dst, src)
+        frames += 1
+        now = time.perf_counter()
+        late = now - deadline
+        if late > 0:
+            lateness.append(late)
+            # 次の期限も過ぎていればその分のフレームは取りこぼし
+            missed = int(late // interval)
+            dropped += missed
+            deadline += missed * interval
+        else:
+            time.sleep(-late)
+    result.update({
+        'frames': frames,
+        'dropped': dropped,
+        'late_p99_ms': float(np.percentile(lateness, 99)) * 1000 if lateness else 0.0,
+    })
+
+
+def run(policy, seconds, fps, use_ffmpeg):
+    scheduler = CpuScheduler(policy)
+    stop_load = start_load(scheduler, use_ffmpeg)
+    result = {}
+    try:
+        thread = threading.Thread(target=capture_loop, args=(scheduler, seconds, fps, result))
+        thread.start()
+        thread.join()
+    finally:
+        stop_load()
+    result['applied'] = scheduler.report()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--policies', nargs='+', default=list(POLICIES), choices=POLICIES)
+    parser.add_argument('--no-ffmpeg', action='store_true', help='ffmpeg があっても擬似負荷を使う')
+    args = parser.parse_args()
+
+    use_ffmpeg = not args.no_ffmpeg and shutil.which('ffmpeg') is not None
+    print(f"load: {'ffmpeg libx264' if use_ffmpeg else 'synthetic workers'}, cpus: {os.cpu_count()}")
+    print(f"{'policy':<15}{'frames':>8}{'dropped':>9}{'drop %':>8}{'late p99 ms':>13}  applied")
+    for policy in args.policies:
+        r = run(policy, args.seconds, args.fps, use_ffmpeg)
+        total = r['frames'] + r['dropped']
+        print(f"{policy:<15}{r['frames']:>8}{r['dropped']:>9}{r['dropped'] * 100 / max(1, total):>8.2f}"
+              f"{r['late_p99_ms']:>13.2f}  {r['applied']}")
+
+
+if __name__ == '__main__':
+    main()
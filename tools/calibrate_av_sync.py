@@ -0,0 +1,235 @@
+"""
+A/V 同期の校正: 閃光とクリック音を同時に発生させて Recorder で録画し、出力ファイル上のずれを測る
+実時刻 (time.time()) が period 秒の倍数になるたびに画面を白く光らせ、同じ時刻にクリック音を鳴らす
+解析では映像の立ち上がりと音声の立ち上がりを対応付け、開始・中間・終了のずれ (ms) とドリフト (ms/分) を求める
+
+  synthetic: 画面 'flash' と音声 'click' の合成ソースで録画 (ディスプレイ・サウンドデバイス不要)
+  live:      全画面の閃光ウィンドウとスピーカーからのクリック音を、通常の取得方式 (画面・システム音声) で録画
+             (表示・再生デバイスの遅延も結果に含まれる)
+
+使い方: python tools/calibrate_av_sync.py [--mode synthetic|live] [--seconds 60] [--fps 60] [--json report.json]
+        python tools/calibrate_av_sync.py --analyze recording.mp4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import ffmpeg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config import config
+
+
+def _stream_start(info, codec_type):
+    stream = next((s for s in info['streams'] if s.get('codec_type') == codec_type), None)
+    if stream is None:
+        raise RuntimeError(f"No {codec_type} stream")
+    return stream, float(stream.get('start_time') or 0.0)
+
+
+def _rising_edges(values, threshold, min_gap):
+    """threshold を下から上に越えた位置 (直前の立ち上がりから min_gap 以内は無視)"""
+    above = values >= threshold
+    edges = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+    kept = []
+    for index in edges:
+        if not kept or index - kept[-1] >= min_gap:
+            kept.append(int(index))
+    return kept
+
+
+def video_onsets(path, info, period):
+    """閃光が始まった時刻 (秒、出力ファイルの時間軸)"""
+    stream, start = _stream_start(info, 'video')
+    num, den = (int(v) for v in stream['r_frame_rate'].split('/'))
+    fps = num / den
+    raw, _ = (
+        ffmpeg.input(path).video
+        .filter('scale', 32, 18).filter('format', 'gray')
+        .output('pipe:', format='rawvideo')
+        .run(capture_stdout=True, quiet=True)
+    )
+    luma = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 32 * 18).mean(axis=1)
+    threshold = (luma.min() + luma.max()) / 2
+    edges = _rising_edges(luma, threshold, int(fps * period / 2))
+    return [start + i / fps for i in edges], fps
+
+
+def audio_onsets(path, info, period, samplerate=48000):
+    """クリック音が始まった時刻 (秒、出力ファイルの時間軸)"""
+    _, start = _stream_start(info, 'audio')
+    raw, _ = (
+        ffmpeg.input(path).audio
+        .output('pipe:', format='f32le', ac=1, ar=samplerate)
+        .run(capture_stdout=True, quiet=True)
+    )
+    envelope = np.abs(np.frombuffer(raw, dtype=np.float32))
+    edges = _rising_edges(envelope, envelope.max() * 0.5, int(samplerate * period / 2))
+    return [start + i / samplerate for i in edges]
+
+
+def analyze(path, period):
+    """映像と音声の立ち上がりを対応付けてずれを集計 (正の値は音声が遅れている)"""
+    info = ffmpeg.probe(path)
+    video, fps = video_onsets(path, info, period)
+    audio = np.array(audio_onsets(path, info, period))
+    pairs = []
+    for v in video:
+        if len(audio) == 0:
+            break
+        a = audio[np.argmin(np.abs(audio - v))]
+        if abs(a - v) < period / 2:
+            pairs.append((v, (a - v) * 1000))
+    if len(pairs) < 3:
+        raise RuntimeError(f"Too few matched events ({len(pairs)} of {len(video)} flashes, {len(audio)} clicks)")
+
+    times = np.array([p[0] for p in pairs])
+    offsets = np.array([p[1] for p in pairs])
+    thirds = np.array_split(offsets, 3)
+    slope = np.polyfit(times / 60.0, offsets, 1)[0] # ms / 分
+    return {
+        'file': path,
+        'flashes': len(video),
+        'clicks': int(len(audio)),
+        'matched': len(pairs),
+        'duration_sec': round(float(times[-1] - times[0]), 2),
+        'offset_ms': {
+            'start': round(float(np.median(thirds[0])), 2),
+            'middle': round(float(np.median(thirds[1])), 2),
+            'end': round(float(np.median(thirds[2])), 2),
+            'mean': round(float(offsets.mean()), 2),
+        },
+        'jitter_ms': round(float(offsets.std()), 2),
+        'drift_ms_per_min': round(float(slope), 3),
+        # 映像側の立ち上がりは取得間隔単位でしか分からない (平均で約半フレーム音声が先行して見える)
+        'video_resolution_ms': round(1000 / fps, 2),
+    }
+
+
+class ClickPlayer(threading.Thread):
+    """live: 既定のスピーカーからクリック音を再生 (ClickSource の波形をそのまま流す)"""
+    def __init__(self, period, samplerate=48000):
+        super().__init__(daemon=True)
+        from core.audio_sources import ClickSource
+        self.source = ClickSource(samplerate, 2, blocksize=480, period=period, realtime=False)
+        self.samplerate = samplerate
+        self.running = True
+
+    def run(self):
+        import soundcard as sc
+        with sc.default_speaker().player(samplerate=self.samplerate, blocksize=480) as player:
+            while self.running:
+                player.play(self.source.read()) # 再生デバイスの速度で進む
+
+
+def record(args):
+    """Recorder で録画して出力パスを返す"""
+    from PyQt6.QtCore import QTimer
+    if args.mode == 'live':
+        from PyQt6.QtWidgets import QApplication, QWidget
+        app = QApplication(sys.argv)
+    else:
+        from PyQt6.QtCore import QCoreApplication
+        app = QCoreApplication(sys.argv)
+    from core.recorder import Recorder
+
+    config.fps = args.fps
+    config.calibration_period_sec = args.period
+    config.calibration_audio_delay_ms = args.audio_delay_ms
+    config.calibration_audio_drift_ppm = args.audio_drift_ppm
+    config.use_system_audio = True
+    config.use_mic_audio = False
+    config.audio_separate_tracks = False
+    config.idle_trim_enabled = False
+    config.timelapse_enabled = False
+    config.zoom_factor = 1.0
+    if args.output_dir:
+        config.output_dir = args.output_dir
+
+    flash_window = player = None
+    if args.mode == 'synthetic':
+        config.capture_backend = 'flash'
+        config.synthetic_capture_size = (640, 360)
+        config.audio_backend = 'click'
+    else:
+        flash_window = QWidget()
+        flash_window.setStyleSheet("background: black;")
+        flash_window.showFullScreen()
+        flash_timer = QTimer()
+        flash_timer.setInterval(2)
+
+        def update_flash():
+            lit = time.time() % args.period < config.calibration_flash_sec
+            flash_window.setStyleSheet(f"background: {'white' if lit else 'black'};")
+        flash_timer.timeout.connect(update_flash)
+        flash_timer.start()
+        player = ClickPlayer(args.period)
+        player.start()
+
+    recorder = Recorder()
+    result = {}
+    recorder.finished.connect(lambda path: result.setdefault('path', path))
+    recorder.error_occurred.connect(lambda message: result.setdefault('error', message))
+
+    def start():
+        recorder.start_recording(monitor_index=args.monitor)
+        QTimer.singleShot(int(args.seconds * 1000), recorder.stop_recording)
+
+    def poll():
+        # 録画スレッドが出力の結合まで終えたら終了
+        if recorder.recording_thread is not None and not recorder.recording_thread.is_alive():
+            app.quit()
+
+    # live は閃光ウィンドウが表示されてから開始
+    QTimer.singleShot(1000 if flash_window else 0, start)
+    poll_timer = QTimer()
+    poll_timer.timeout.connect(poll)
+    poll_timer.start(200)
+    app.exec()
+
+    if player:
+        player.running = False
+    if 'path' not in result:
+        raise RuntimeError(result.get('error', 'Recording failed'))
+    return result['path']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['synthetic', 'live'], default='synthetic')
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--period', type=float, default=1.0, help='閃光・クリックの間隔 (秒)')
+    parser.add_argument('--monitor', type=int, default=1)
+    parser.add_argument('--audio-delay-ms', type=float, default=0.0, help='synthetic: 音声の遅れを模擬')
+    parser.add_argument('--audio-drift-ppm', type=float, default=0.0, help='synthetic: 音声の時計のずれを模擬')
+    parser.add_argument('--output-dir')
+    parser.add_argument('--analyze', metavar='FILE', help='録画せずに既存のファイルを解析')
+    parser.add_argument('--json', help='結果を書き出す JSON ファイル')
+    args = parser.parse_args()
+
+    path = args.analyze or record(args)
+    report = analyze(path, args.period)
+    if not args.analyze:
+        report['settings'] = {'mode': args.mode, 'fps': args.fps, 'period_sec': args.period,
+                              'simulated_delay_ms': args.audio_delay_ms, 'simulated_drift_ppm': args.audio_drift_ppm}
+
+    offset = report['offset_ms']
+    print(f"file: {report['file']}")
+    print(f"events: {report['matched']} matched ({report['flashes']} flashes, {report['clicks']} clicks) "
+          f"over {report['duration_sec']} s")
+    print(f"offset ms (audio - video): start {offset['start']:+.1f}  middle {offset['middle']:+.1f}  "
+          f"end {offset['end']:+.1f}  mean {offset['mean']:+.1f}  (jitter {report['jitter_ms']:.1f})")
+    print(f"drift: {report['drift_ms_per_min']:+.2f} ms/min  (video resolution {report['video_resolution_ms']} ms)")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"saved: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
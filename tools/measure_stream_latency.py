@@ -0,0 +1,172 @@
+"""
+低遅延配信の遅延 (取得 -> エンコード -> 送信 -> 受信 -> デコード) を計測する
+ローカルの ffmpeg を受信サーバ (listener) として起動し、Recorder から配信した映像をデコードさせる
+画面は 'flash' (実時刻が period 秒の倍数になると白くなる) を使うので、受信側で白くなった時刻の
+period での余りがそのまま遅延になる (遅延が period より短い前提)
+
+使い方: python tools/measure_stream_latency.py [--protocol udp|srt|rtmp] [--seconds 20] [--fps 30]
+                                               [--bitrate 4000] [--with-file] [--json result.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.config import config
+
+WIDTH, HEIGHT = 16, 9 # 受信側で縮小する大きさ (明るさだけ分かればよい)
+
+
+def endpoints(protocol, port):
+    """(送信側 URL, 受信側の入力引数)"""
+    if protocol == 'udp':
+        url = f'udp://127.0.0.1:{port}'
+        return f'{url}?pkt_size=1316', ['-f', 'mpegts', '-i', url]
+    if protocol == 'srt':
+        return (f'srt://127.0.0.1:{port}?mode=caller&latency=20000',
+                ['-f', 'mpegts', '-i', f'srt://127.0.0.1:{port}?mode=listener&latency=20000'])
+    url = f'rtmp://127.0.0.1:{port}/live/bench'
+    return url, ['-listen', '1', '-f', 'flv', '-i', url]
+
+
+class Listener:
+    """ffmpeg の受信サーバ。デコードしたフレームの明るさの立ち上がり時刻を記録する"""
+    def __init__(self, input_args, period):
+        self.period = period
+        self.latencies = []
+        self.frames = 0
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+             '-fflags', 'nobuffer', '-flags', 'low_delay', '-probesize', '32768', '-analyzeduration', '0',
+             *input_args,
+             '-vf', f'scale={WIDTH}:{HEIGHT},format=gray', '-fps_mode', 'passthrough',
+             '-f', 'rawvideo', 'pipe:'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        lit = False
+        frame_bytes = WIDTH * HEIGHT
+        while True:
+            data = self.process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            now = time.time()
+            self.frames += 1
+            bright = np.frombuffer(data, dtype=np.uint8).mean() >= 128
+            if bright and not lit:
+                # 閃光は period の倍数の時刻に始まっている
+                self.latencies.append((now % self.period) * 1000)
+            lit = bright
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+        self.thread.join(timeout=2.0)
+
+
+def run(args):
+    from PyQt6.QtCore import QCoreApplication
+    from core.recorder import Recorder
+    app = QCoreApplication(sys.argv)
+
+    send_url, listener_args = endpoints(args.protocol, args.port)
+    listener = Listener(listener_args, args.period)
+    time.sleep(0.5) # 受信側の待ち受け開始を待つ
+
+    config.output_dir = args.output_dir or tempfile.mkdtemp(prefix='stream_latency_')
+    config.capture_backend = 'flash'
+    config.synthetic_capture_size = tuple(int(v) for v in args.size.lower().split('x'))
+    config.calibration_period_sec = args.period
+    config.calibration_flash_sec = min(0.2, args.period / 4)
+    config.fps = args.fps
+    config.capture_mode = 'standard'
+    config.zoom_factor = 1.0
+    config.use_system_audio = False
+    config.use_mic_audio = False
+    config.stream_enabled = True
+    config.stream_url = send_url
+    config.stream_record = args.with_file
+    config.stream_bitrate_kbps = args.bitrate
+    config.stream_keyint_sec = args.keyint
+
+    recorder = Recorder()
+    result = {}
+    recorder.finished.connect(lambda path: result.setdefault('path', path))
+    recorder.error_occurred.connect(lambda message: result.setdefault('error', message))
+    try:
+        recorder.start_recording()
+        time.sleep(args.seconds)
+        recorder.stop_recording()
+        recorder.recording_thread.join()
+        app.processEvents()
+    finally:
+        time.sleep(0.5) # 最後のフレームの受信を待つ
+        listener.close()
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+    # 受信開始直後は GOP の途中から始まるため最初の1回を除く
+    samples = np.array(listener.latencies[1:])
+    if len(samples) == 0:
+        raise RuntimeError(f"No flashes received ({listener.frames} frames decoded)")
+    return {
+        'protocol': args.protocol,
+        'url': send_url,
+        'settings': {'fps': args.fps, 'size': args.size, 'bitrate_kbps': args.bitrate,
+                     'keyint_sec': args.keyint, 'with_file': args.with_file},
+        'frames_received': listener.frames,
+        'samples': int(len(samples)),
+        'latency_ms': {
+            'min': round(float(samples.min()), 1),
+            'median': round(float(np.median(samples)), 1),
+            'p95': round(float(np.percentile(samples, 95)), 1),
+            'max': round(float(samples.max()), 1),
+        },
+        'recording': result.get('path') if args.with_file else None,
+        'stats': {key: recorder.stats.get(key) for key in ('frames_written', 'frames_dropped', 'encoder_restarts')},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--protocol', choices=['udp', 'srt', 'rtmp'], default='udp')
+    parser.add_argument('--port', type=int, default=None, help='既定: udp/srt は 9000、rtmp は 1935')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--bitrate', type=int, default=4000, help='上限ビットレート (kbps)')
+    parser.add_argument('--keyint', type=float, default=1.0, help='GOP の長さ (秒)')
+    parser.add_argument('--period', type=float, default=2.0, help='閃光の間隔 (秒、想定する遅延より長くする)')
+    parser.add_argument('--with-file', action='store_true', help='配信と同時にファイルにも録画する (tee)')
+    parser.add_argument('--output-dir')
+    parser.add_argument('--json', help='結果を書き出す JSON ファイル')
+    args = parser.parse_args()
+    if args.port is None:
+        args.port = 1935 if args.protocol == 'rtmp' else 9000
+
+    if shutil.which('ffmpeg') is None:
+        sys.exit("ffmpeg not found in PATH")
+    report = run(args)
+    latency = report['latency_ms']
+    print(f"{args.protocol}: {report['samples']} samples, {report['frames_received']} frames received")
+    print(f"latency ms: min {latency['min']}  median {latency['median']}  p95 {latency['p95']}  max {latency['max']}")
+    if report['recording']:
+        print(f"recording: {report['recording']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"saved: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,187 @@
-import soundcard as sc
+import threading
+import time
+from PyQt6.QtCore import QObject, pyqtSignal
+from utils.logger import get_logger
+
+log = get_logger("audio_devices")
+
+try:
+    import soundcard as sc
+except Exception as e:
+    # サウンドサーバが無い環境ではデバイス一覧は空 (pulse / file / synthetic 入力は使用可能)
+    log.warning(f"soundcard is unavailable: {e}")
+    sc = None
+
+try:
+    from core.soundcard_patch import read_device_samplerate
+except Exception:
+    # Windows (mediafoundation) 以外ではレートを取得できない
+    read_device_samplerate = None
+
+class AudioDeviceRegistry(QObject):
+    """
+    音声デバイスのキャッシュ
+    バックグラウンドで一度だけ列挙し、Loopback/マイクのハンドルをデバイスIDをキーに保持する
+    一定間隔でデバイス構成をポーリングし、変化があれば再列挙して devices_changed を通知する
+    """
+    devices_changed = pyqtSignal() # デバイスの追加・削除、既定デバイスの変更時
+    devices_ready = pyqtSignal() # 初回の列挙完了時 (失敗した場合も通知する)
+
+    def __init__(self, poll_interval=5.0):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.running = False
+        self.thread = None
+        self.stop_event = threading.Event()
+
+        self.microphones = {} # id -> soundcard Microphone (Loopback含む)
+        self.loopbacks = {} # スピーカー名 -> Loopback Microphone
+        self.default_speaker_name = None
+        self.default_mic_id = None
+        self.default_loopback = None
+        self.last_enum_ms = 0.0 # 直近の列挙にかかった時間
+        self.enum_count = 0
+        self._signature = None
+        self.native_formats = {} # id -> (samplerate or None, channels)
+
+    def start(self):
+        """バックグラウンド列挙を開始 (二重起動はしない)"""
+        if self.running:
+            return
+        self.running = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+
+    def _poll_loop(self):
+        while self.running:
+            try:
+                self.refresh()
+            except Exception as e:
+                log.error(f"Error querying audio devices: {e}")
+            finally:
+                if not self.ready.is_set():
+                    self.ready.set()
+                    self.devices_ready.emit()
+            if self.stop_event.wait(self.poll_interval):
+                break
+
+    def refresh(self):
+        """デバイスを列挙してキャッシュを更新。構成が変わっていれば True"""
+        if sc is None:
+            return False
+        start = time.perf_counter()
+        all_mics = sc.all_microphones(include_loopback=True)
+        try:
+            speaker_name = sc.default_speaker().name
+        except Exception:
+            speaker_name = None
+        try:
+            mic_id = sc.default_microphone().id
+        except Exception:
+            mic_id = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        signature = (tuple(sorted(m.id for m in all_mics)), speaker_name, mic_id)
+        changed = signature != self._signature
+
+        if changed:
+            loopbacks = {m.name: m for m in all_mics if m.isloopback}
+            # スピーカーと同じ名前のLoopbackマイク、見つからなければ任意のLoopback
+            default_loopback = loopbacks.get(speaker_name)
+            if default_loopback is None and loopbacks:
+                default_loopback = next(iter(loopbacks.values()))
+            with self.lock:
+                self.native_formats = {}
+                self.microphones = {m.id: m for m in all_mics}
+                self.loopbacks = loopbacks
+                self.default_speaker_name = speaker_name
+                self.default_mic_id = mic_id
+                self.default_loopback = default_loopback
+                self._signature = signature
+
+        self.last_enum_ms = elapsed_ms
+        self.enum_count += 1
+        if changed and self.enum_count > 1:
+            self.devices_changed.emit()
+        return changed
+
+    def wait_ready(self, timeout=5.0):
+        """初回の列挙完了を待つ (未起動なら起動する)"""
+        self.start()
+        return self.ready.wait(timeout)
+
+    def get_loopback(self):
+        """既定スピーカーに対応するLoopbackマイク"""
+        self.wait_ready()
+        with self.lock:
+            return self.default_loopback
+
+    def get_microphone(self, device_id=None):
+        """デバイスIDに対応するマイク (Noneなら既定のマイク)"""
+        self.wait_ready()
+        with self.lock:
+            if device_id is None:
+                device_id = self.default_mic_id
+            mic = self.microphones.get(device_id)
+        if mic is None or mic.isloopback:
+            return None
+        return mic
+
+    def native_format(self, mic):
+        """
+        デバイスのネイティブ形式 (samplerate, channels)
+        レートが取得できない環境では samplerate は None (バックエンドに変換を任せる)
+        """
+        with self.lock:
+            cached = self.native_formats.get(mic.id)
+        if cached:
+            return cached
+        samplerate = None
+        if read_device_samplerate is not None:
+            try:
+                samplerate = read_device_samplerate(mic)
+            except Exception as e:
+                log.warning(f"Failed to read device samplerate: {e}")
+        try:
+            channels = int(mic.channels)
+        except Exception:
+            channels = 2
+        result = (samplerate, max(1, channels))
+        with self.lock:
+            self.native_formats[mic.id] = result
+        return result
+
+    def get_input_devices(self, wait=True):
+        """
+        キャッシュ済みの入力デバイス（マイク、Loopback除く）
+        wait=False なら初回の列挙を待たずにその時点のキャッシュを返す (GUI スレッド用)
+        """
+        if wait:
+            self.wait_ready()
+        with self.lock:
+            return [m for m in self.microphones.values() if not m.isloopback]
+
+# グローバルインスタンス
+device_registry = AudioDeviceRegistry()
 
 class AudioDeviceManager:
     @staticmethod
-    def get_input_devices():
-        """利用可能な入力デバイス（マイク）のリストを返す"""
+    def get_input_devices(wait=True):
+        """利用可能な入力デバイス（マイク）のリストを返す (wait=False は列挙の完了を待たない)"""
         devices = []
         try:
-            # include_loopback=False で通常のマイクのみ取得
-            mic_list = sc.all_microphones(include_loopback=False)
+            # キャッシュ済みの列挙結果を使用 (Loopbackは除外済み)
+            mic_list = device_registry.get_input_devices(wait=wait)
             for mic in mic_list:
                 devices.append({
                     'id': mic.id, # soundcardのデバイスID (String)
@@ -15,13 +189,11 @@ class AudioDeviceManager:
                     'api': 'WASAPI' # soundcard on Windows uses WASAPI
                 })
         except Exception as e:
-            print(f"Error querying audio devices: {e}")
+            log.error(f"Error querying audio devices: {e}")
         return devices
 
     @staticmethod
     def get_default_input_device():
         """デフォルトの入力デバイスIDを返す"""
-        try:
-            return sc.default_microphone().id
-        except Exception:
-            return None
+        device_registry.wait_ready()
+        return device_registry.default_mic_id
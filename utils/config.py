@@ -12,9 +12,104 @@ class Config:
         self.countdown_enabled = self.DEFAULT_COUNTDOWN
         self.show_cursor = self.DEFAULT_SHOW_CURSOR
         self.output_dir = self._get_default_output_dir()
+        # 録画ライブラリ (カタログDBとサムネイルキャッシュ)
+        self.library_dir = os.path.join(self.output_dir, ".library")
         self.use_system_audio = True
         self.use_mic_audio = False
         self.mic_device_id = None
+        # 音声の入力方式 ('soundcard' / 'pulse' / 'file' / 'synthetic' / 'click')
+        # pulse: PulseAudio / PipeWire のモニタ (Linux)、file / synthetic / click: デバイス不要 (検証・ベンチマーク用)
+        self.audio_backend = 'soundcard'
+        self.audio_replay_path = None # file: システム音声として再生するファイル
+        self.audio_mic_replay_path = None # file: マイク音声として再生するファイル
+        self.audio_device_poll_sec = 5.0 # 音声デバイス構成の監視間隔
+        # 音声の出力形式 (各デバイスのネイティブ形式からまとめて変換)
+        self.audio_samplerate = 48000
+        self.audio_channels = 2
+        # ミキサー (ソースごとのゲインとリミッタ)、レベルメーターの更新頻度
+        self.system_audio_gain = 1.0
+        self.mic_audio_gain = 1.0
+        self.audio_limiter_enabled = True
+        self.meter_update_hz = 10
+        # 録音中の一時WAV ('float32' は変換なしで書き込み、'int16' は従来形式)
+        self.audio_spool_format = 'float32'
+        self.audio_header_interval_sec = 5.0 # ヘッダ更新間隔 (異常終了時に失うのはこの分まで)
+        # システム音声とマイクを別トラックで保存 (後から音量バランスを調整できる)
+        self.audio_separate_tracks = False
+        self.audio_premix_track = True # 別トラック時に1トラック目へミックス済み音声を追加
+        # 画面取得方式 ('mss' / 'xshm' / 'xdamage' / 'synthetic' / 'file' / 'flash')
+        self.capture_backend = 'mss'
+        self.capture_replay_path = None # 'file' で再生する動画
+        self.synthetic_capture_size = (1920, 1080) # 'synthetic' / 'file' / 'flash' の画面サイズ
+        # A/V 同期の校正パターン (画面 'flash' と音声 'click' が実時刻 period 秒ごとに同時に発生する)
+        self.calibration_period_sec = 1.0
+        self.calibration_flash_sec = 0.1
+        self.calibration_audio_delay_ms = 0.0 # 音声の遅れを模擬 (解析の検証用)
+        self.calibration_audio_drift_ppm = 0.0 # 音声の時計のずれを模擬 (解析の検証用)
+        # 画面キャプチャを別プロセスで実行 (共有メモリ経由でフレームを受け渡す)
+        self.capture_out_of_process = False
+        self.capture_ring_slots = 4
+        # 録画方式 ('standard' / 'lossless')
+        # lossless: 録画中は可逆の中間ファイル (低CPU) に書き、停止後にアイドル優先度で仕上げエンコード
+        self.capture_mode = 'standard'
+        self.intermediate_codec = 'x264-qp0' # 'x264-qp0' / 'ffv1'
+        self.delivery_preset = 'medium'
+        self.delivery_crf = 20
+        self.transcode_nice = 19
+        # CPU スケジューリング ('balanced' / 'capture-first' / 'low-impact')
+        self.cpu_policy = 'balanced'
+        # エンコーダが落ちたときの再起動 (回数上限と、再送のために保持する直近フレームの秒数)
+        self.encoder_max_restarts = 3
+        self.encoder_replay_sec = 1.0
+        # 再送用に保持するフレームのメモリ上限 (MB)。フル解像度の BGRA で 1080p は1枚約 8MB、4K は約 33MB
+        # replay_sec 分がこの上限を超える場合は枚数を減らす (0 で再送しない)
+        self.encoder_replay_max_mb = 128
+        # エンコーダ送り出しキュー (フレーム数) と溢れた分の退避ファイル上限 (MB, 0で無効)
+        self.frame_queue_size = 8
+        self.spool_max_mb = 1024
+        # トリム・分割
+        # キーフレーム間隔 (秒)。固定間隔にすることで再エンコードなしのトリムを可能にする
+        self.keyframe_interval_sec = 2.0
+        self.trim_head_sec = 3.0 # トリム時の既定値 (先頭)
+        self.trim_tail_sec = 1.0 # トリム時の既定値 (末尾)
+        # ピクチャインピクチャ (None / 'file' / 'camera' / 'region')
+        self.pip_source_type = None
+        self.pip_source = None # ファイルパス / カメラ名 / (left, top, width, height)
+        self.pip_position = 'bottom-right'
+        self.pip_scale = 0.25 # メイン映像の幅に対する比率
+        self.pip_margin = 16
+        # タイムラプス (interval 秒ごとに1枚、出力は fps で再生。変化の無いフレームは省く)
+        self.timelapse_enabled = False
+        self.timelapse_interval_sec = 5.0
+        # 低遅延配信 (rtmp:// / srt:// / udp://)。録画と同じキャプチャ・エンコードを共有する (映像のみ)
+        # stream_record 時はファイルも配信と同じ設定 (stream_keyint_sec の GOP、上限ビットレート、stream_preset) で録画される
+        self.stream_enabled = False
+        self.stream_url = ''
+        self.stream_record = True # 配信と同時にファイルにも録画する
+        self.stream_bitrate_kbps = 4000 # 上限ビットレート
+        self.stream_keyint_sec = 1.0 # GOP の長さ (途中から受信したときの待ち時間の上限)
+        self.stream_preset = 'veryfast'
+        # カーソル追従ズーム (1.0 で無効)。カーソル周辺の 1/zoom_factor の範囲だけを取得し、出力解像度は変えない
+        self.zoom_factor = 1.0
+        self.zoom_smoothing_sec = 0.3 # パンの時定数
+        self.zoom_deadzone = 0.25 # カーソルがこの割合の範囲内で動いている間はパンしない
+        # 連写 (静止画を burst_fps で保存。圧縮はプロセスプールで並列に行い、キューが溢れたら捨てる)
+        self.burst_fps = 10
+        self.burst_format = 'png' # 'png' / 'webp' / 'jpeg'
+        self.burst_quality = 90 # webp / jpeg (webp は 100 で可逆)
+        self.burst_png_compress_level = 1 # 0-9 (大きいほど小さく遅い)
+        self.burst_workers = None # None は CPU数-1
+        self.burst_queue_size = 32
+        # 無操作・無音区間の自動カット
+        self.idle_trim_enabled = False
+        self.idle_threshold_sec = 3.0
+        self.idle_change_threshold = 0.002 # 変化したサンプル画素の割合
+        self.idle_audio_threshold = 0.01 # 音声RMS (これ以下を無音とみなす)
+        # ログ (起動ごとのセッションファイル、古いものから削除)
+        self.log_dir = os.path.join(self.output_dir, ".logs")
+        self.log_level = "INFO"
+        self.log_keep_sessions = 20
+        self.debug_save_first_frame = False # 最初のフレームを debug_frame.png に保存 (バックグラウンド)
         
     def _get_default_output_dir(self):
         """ユーザーのビデオフォルダをデフォルトとして取得"""
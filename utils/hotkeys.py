@@ -1,6 +1,9 @@
 import keyboard
 import threading
 from PyQt6.QtCore import QObject, pyqtSignal
+from utils.logger import get_logger
+
+log = get_logger("hotkeys")
 
 class HotkeyManager(QObject):
     # シグナル定義（GUIスレッドで処理するため）
@@ -21,7 +24,7 @@ class HotkeyManager(QObject):
                 keyboard.add_hotkey('F10', self._on_f10)
                 self.running = True
             except Exception as e:
-                print(f"Failed to register hotkeys: {e}")
+                log.error(f"Failed to register hotkeys: {e}")
 
     def stop_listening(self):
         """ホットキーの監視を停止"""
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER = "pyrec"
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードの JSON (extra={'fields': {...}} の内容も展開)"""
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.processName != "MainProcess":
+            entry["process"] = record.processName
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class LogManager:
+    """
+    ログ出力の管理
+    呼び出し側はキューに積むだけで、書き込みはバックグラウンドの QueueListener が行う
+    (キャプチャループ内でファイルI/Oやコンソール出力を待たない)
+    起動ごとにセッション単位のログファイル (JSON Lines) を作成する
+    """
+    def __init__(self):
+        self.queue = queue.Queue(-1)
+        self.listener = None
+        self.process_queue = None # 子プロセスからのレコード (multiprocessing のキュー)
+        self.process_listener = None
+        self.session_path = None
+        self.artifacts = None
+
+    def setup(self, log_dir, level="INFO", keep_sessions=20):
+        if self.listener is not None:
+            return self.session_path
+        handlers = []
+
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(ConsoleFormatter())
+        handlers.append(console)
+
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            self._remove_old_sessions(log_dir, keep_sessions)
+            name = time.strftime("session_%Y%m%d_%H%M%S") + f"_{os.getpid()}.jsonl"
+            self.session_path = os.path.join(log_dir, name)
+            file_handler = logging.FileHandler(self.session_path, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        except OSError as e:
+            self.session_path = None
+            console.handle(logging.makeLogRecord({"msg": f"Failed to create log file: {e}", "levelname": "WARNING"}))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+        root.propagate = False
+        root.handlers = [QueueHandler(self.queue)]
+
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.shutdown)
+        return self.session_path
+
+    @staticmethod
+    def _remove_old_sessions(log_dir, keep_sessions):
+        sessions = sorted(f for f in os.listdir(log_dir) if f.startswith("session_") and f.endswith(".jsonl"))
+        for name in sessions[:max(0, len(sessions) - keep_sessions + 1)]:
+            try:
+                os.remove(os.path.join(log_dir, name))
+            except OSError:
+                pass
+
+    def child_process_queue(self, ctx):
+        """
+        子プロセス用のログキュー (setup 前なら None)
+        子プロセスから届いたレコードはそのままメインのキューへ転送し、同じファイル・コンソールに出力する
+        """
+        if self.listener is None:
+            return None
+        if self.process_queue is None:
+            self.process_queue = ctx.Queue(-1)
+            self.process_listener = QueueListener(self.process_queue, QueueHandler(self.queue))
+            self.process_listener.start()
+        return self.process_queue
+
+    def artifact_writer(self):
+        if self.artifacts is None:
+            self.artifacts = DebugArtifactWriter()
+        return self.artifacts
+
+    def shutdown(self):
+        """キューに残ったレコードを書き出して停止"""
+        if self.artifacts is not None:
+            self.artifacts.stop()
+            self.artifacts = None
+        if self.process_listener is not None:
+            self.process_listener.stop()
+            self.process_listener = None
+            self.process_queue.close()
+            self.process_queue = None
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            for handler in logging.getLogger(ROOT_LOGGER).handlers:
+                handler.close()
+
+
+class DebugArtifactWriter:
+    """
+    デバッグ用の成果物 (サンプルフレームなど) をバックグラウンドで保存
+    キューが埋まっている場合は捨てる (録画側を待たせない)
+    """
+    def __init__(self, max_pending=4):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name="DebugArtifactWriter", daemon=True)
+        self.thread.start()
+
+    def save_frame(self, frame, path):
+        """frame (BGRA) のコピーを PNG として保存するよう要求"""
+        try:
+            self.queue.put_nowait((frame.copy(), path))
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        log = get_logger("debug")
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame, path = item
+            try:
+                import numpy as np
+                from PIL import Image
+                Image.fromarray(np.ascontiguousarray(frame[..., 2::-1])).save(path)
+                log.debug("Saved debug frame", extra={"fields": {"path": path}})
+            except Exception as e:
+                log.warning(f"Failed to save debug frame: {e}")
+
+    def stop(self):
+        try:
+            self.queue.put(None, timeout=1.0)
+        except queue.Full:
+            return
+        self.thread.join(timeout=5.0)
+
+
+# グローバルインスタンス
+log_manager = LogManager()
+
+def get_logger(name):
+    """pyrec 配下のロガー (setup 前でも使用可能、その間は WARNING 以上を標準エラーへ)"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+def setup_logging(log_dir, level="INFO", keep_sessions=20):
+    return log_manager.setup(log_dir, level, keep_sessions)
+
+def child_logging_config(ctx):
+    """子プロセスに渡すログ設定 (キュー, レベル)。子プロセス側で setup_child_logging に渡す"""
+    return log_manager.child_process_queue(ctx), logging.getLogger(ROOT_LOGGER).level
+
+def setup_child_logging(log_config):
+    """子プロセスの開始時に呼ぶ。レコードは親プロセスのキューへ送り、書き込みは親側で行う"""
+    log_queue, level = log_config or (None, logging.NOTSET)
+    if log_queue is None:
+        return
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.propagate = False
+    root.handlers = [QueueHandler(log_queue)]
+
+def save_debug_frame(frame, path):
+    return log_manager.artifact_writer().save_frame(frame, path)